@@ -4,7 +4,6 @@ mcauto-soap-client application package.
 This package contains the SOAP client and service implementation for the mcauto-soap-client application.
 """
 
-import os
 from pathlib import Path
 from dotenv import load_dotenv
 from flask import Flask
@@ -13,6 +12,11 @@ from flask import Flask
 env_path = Path(__file__).parent.parent / 'config' / '.env'
 load_dotenv(dotenv_path=env_path)
 
+from app.logging_config import configure_logging
+
+# Queued logging for every module (see app/logging_config.py)
+configure_logging()
+
 # Create the Flask application instance
 app = Flask(__name__)
 
@@ -0,0 +1,212 @@
+"""
+asyncio implementation of /comcorp-download-request, and the ASGI application.
+
+With a sync gunicorn worker every download request holds the worker for the
+whole Comcorp round trip. Served through ``asgi:application`` (e.g. with
+``uvicorn.workers.UvicornWorker``), /comcorp-download-request is handled on the
+event loop with the zeep AsyncClient instead, so one worker can keep
+thousands of slow provider calls in flight. Every other route is the Flask
+app, run in a thread pool through asgiref's WsgiToAsgi.
+"""
+import base64
+import binascii
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from app import debug_capture
+from app import result_cache, serialization
+from app.client_service import get_async_client, close_async_clients
+from app.comcorp_download_service import check_auth
+from app.envelope_template import submit_arguments
+from app.metrics import OUTBOUND, timed
+from app.result_model import result_to_model
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_REQUEST_PATH = '/comcorp-download-request'
+
+
+async def submit_download_request_async(payload, header=None):
+    """
+    Submit one IDXConsumerSubmitMessage to Comcorp from the event loop.
+
+    Args:
+        payload: The download request parameters (see comcorp_download_request)
+        header: A SecureXHeader built by getHeader; built here if not given
+
+    Returns:
+        A tuple (response_data, history) where history is the client's
+        RequestHistoryPlugin, holding this task's last sent/received envelopes
+    """
+    with timed(OUTBOUND, 'client'):
+        client = get_async_client()
+    history = client.history
+    history.reset()
+
+    with timed(OUTBOUND, 'build'):
+        args, kwargs = submit_arguments(client, payload, header)
+
+    result = await client.service.Submit(*args, **kwargs)
+
+    with timed(OUTBOUND, 'serialize'):
+        return result_to_model(result), history
+
+
+def _authorized(scope):
+    """Check the basic auth credentials of an ASGI request."""
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, credentials = value.decode('latin-1').partition(' ')
+            if scheme.lower() != 'basic':
+                return False
+            try:
+                username, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+            except (binascii.Error, UnicodeDecodeError):
+                return False
+            return check_auth(username, password)
+    return False
+
+
+async def _read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def _send_json(send, status, data, headers=(), mimetype=serialization.JSON_MIMETYPE):
+    body = serialization.encode(data, mimetype)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', mimetype.encode()),
+                    (b'content-length', str(len(body)).encode())] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_stream(send, status, chunks, headers=(), mimetype=serialization.JSON_MIMETYPE):
+    """Send a response body block by block (without a content-length)."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', mimetype.encode())] + list(headers),
+    })
+    for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def download_request_endpoint(scope, receive, send):
+    """
+    ASGI handler for POST /comcorp-download-request.
+
+    Same request and response as the Flask endpoint in comcorp_download_service.
+    """
+    if scope['method'] != 'POST':
+        await _send_json(send, 405, {'status': 'error', 'message': 'Method not allowed'})
+        return
+
+    if not _authorized(scope):
+        body = (b'Could not verify your access level for that URL.\n'
+                b'You have to login with proper credentials')
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'www-authenticate', b'Basic realm="Login Required"'),
+                        (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    debug_capture.start(debug_capture.is_flag_set(query.get('debug', [None])[-1]))
+
+    try:
+        try:
+            payload = json.loads(await _read_body(receive) or b'null')
+        except ValueError:
+            payload = None
+        if not payload:
+            await _send_json(send, 400, {
+                'status': 'error',
+                'message': 'No JSON payload provided'
+            })
+            return
+
+        logger.info("Received request with payload: %s", payload)
+
+        # Repeated queries may be answered from the result cache (if enabled);
+        # captured requests always go to Comcorp
+        headers = dict(scope['headers'])
+        cache_control = headers.get(b'cache-control', b'').decode('latin-1')
+        bypass = debug_capture.active() or result_cache.bypass_requested(cache_control)
+        response_data, history, outcome = await result_cache.fetch_async(
+            payload, lambda: submit_download_request_async(payload), bypass)
+
+        # Add request and response XML for debugging (captured requests only);
+        # it is pretty-printed while the response is streamed
+        debug_info = {}
+        try:
+            debug_info = debug_capture.history_debug_info(history, streamed=True)
+        except (IndexError, TypeError) as e:
+            logger.error(f"Error extracting request/response XML: {str(e)}")
+
+        # MessagePack if asked for and available
+        mimetype = serialization.negotiate(headers.get(b'accept', b'').decode('latin-1'))
+        body = {
+            'status': 'success',
+            'data': response_data,
+            'debug': debug_info
+        }
+        cache_headers = [(b'x-cache', outcome.upper().encode())] if outcome else ()
+        if not serialization.streamed(mimetype, debug_info):
+            await _send_json(send, 200, body, cache_headers, mimetype)
+            return
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        await _send_json(send, 500, {
+            'status': 'error',
+            'message': str(e)
+        })
+        return
+
+    # Once the response has started an error can't become a 500 response;
+    # it is left to the server, which closes the connection
+    await _send_stream(send, 200, serialization.iter_chunks(body), cache_headers, mimetype)
+
+
+def create_asgi_app(wsgi_app):
+    """
+    Build the ASGI application.
+
+    Args:
+        wsgi_app: The Flask app, serving every route not handled here
+
+    Returns:
+        An ASGI application callable
+    """
+    fallback = WsgiToAsgi(wsgi_app)
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await close_async_clients()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        elif scope['type'] == 'http' and scope['path'] == DOWNLOAD_REQUEST_PATH:
+            await download_request_endpoint(scope, receive, send)
+        else:
+            await fallback(scope, receive, send)
+
+    return application
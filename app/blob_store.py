@@ -0,0 +1,222 @@
+"""
+Content-addressed local store for the base64 blobs in callbacks.
+
+Statement images (IDX), documents and serialized images (IVX) and documents
+(FicaX) are decoded from the element text in chunks of ``BLOB_DECODE_CHUNK``
+characters straight into a file, hashed on the way, so the decoded blob is
+never held in memory as a whole. The file is named after its SHA-256 digest
+(``BLOB_STORE_DIR/ab/abcdef...``), which deduplicates documents Comcorp
+resends on retries: a blob already in the store is not written twice.
+
+Handlers get BlobRef references instead of element text, and read blobs back
+through a memory map. The element text is cleared once its blob is stored, so
+the store holds the only copy of the content: keep BLOB_STORE_DIR on
+persistent storage. Blobs not received again for ``BLOB_RETENTION_SECONDS``
+are deleted by ``python -m app.blob_store --prune`` (run it periodically).
+"""
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from base64 import b64decode
+from contextlib import contextmanager
+import sys
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to leave blobs in the element text
+BLOB_STORE_ENABLED = os.getenv('BLOB_STORE_ENABLED', '1') == '1'
+# Directory of the content-addressed store (relative to the working directory)
+BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', 'blob_store')
+# Seconds a blob is kept after it was last received; 0 keeps blobs forever
+BLOB_RETENTION_SECONDS = float(os.getenv('BLOB_RETENTION_SECONDS', str(30 * 24 * 3600)))
+# Characters of base64 text decoded at a time
+BLOB_DECODE_CHUNK = int(os.getenv('BLOB_DECODE_CHUNK', str(1 << 20)))
+
+_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+
+@dataclass(frozen=True)
+class BlobRef:
+    """
+    A blob in the store.
+
+    Attributes:
+        digest: The SHA-256 hex digest of the decoded content
+        size: The decoded size in bytes
+        path: The file holding the content
+        new: False if the content was already in the store
+    """
+    digest: str
+    size: int
+    path: str
+    new: bool = field(default=True, compare=False)
+
+    @contextmanager
+    def view(self):
+        """Map the blob read-only; yields a bytes-like mmap (b'' if empty)."""
+        if self.size == 0:
+            yield b''
+            return
+        with open(self.path, 'rb') as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def blob_path(digest, directory=None):
+    """Return the path of the blob with the given digest."""
+    return os.path.join(directory or BLOB_STORE_DIR, digest[:2], digest)
+
+
+def _decoded_chunks(text, chunk_size):
+    """Decode base64 text chunk by chunk, ignoring whitespace."""
+    pending = ''
+    for start in range(0, len(text), chunk_size):
+        pending += text[start:start + chunk_size].translate(_WHITESPACE)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield b64decode(pending[:usable], validate=True)
+            pending = pending[usable:]
+    if pending:
+        raise ValueError(f"Truncated base64 content ({len(pending)} trailing characters)")
+
+
+def store_base64(text, directory=None):
+    """
+    Decode base64 text into the store.
+
+    Args:
+        text: The base64 text (whitespace is ignored)
+        directory: The store directory (default BLOB_STORE_DIR)
+
+    Returns:
+        A BlobRef
+
+    Raises:
+        ValueError: if the text is not valid base64
+    """
+    directory = directory or BLOB_STORE_DIR
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix='.incoming-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in _decoded_chunks(text or '', BLOB_DECODE_CHUNK):
+                digest.update(chunk)
+                fh.write(chunk)
+                size += len(chunk)
+        hexdigest = digest.hexdigest()
+        path = blob_path(hexdigest, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(tmp_path, path)
+            new = True
+        except FileExistsError:
+            # Received again: keep it for another retention period
+            os.utime(path)
+            new = False
+        return BlobRef(hexdigest, size, path, new)
+    finally:
+        os.unlink(tmp_path)
+
+
+def store_element(elem, directory=None):
+    """
+    Move the base64 text of an element into the store.
+
+    The element's text is cleared, so the tree no longer holds the blob.
+
+    Args:
+        elem: An lxml Element with base64 text
+        directory: The store directory (default BLOB_STORE_DIR)
+
+    Returns:
+        A BlobRef
+    """
+    ref = store_base64(elem.text, directory)
+    elem.text = None
+    return ref
+
+
+def store_elements(elems, label):
+    """
+    Store the blobs of several elements, if the store is enabled.
+
+    Args:
+        elems: lxml Elements with base64 text
+        label: What the blobs are, for the log
+
+    Returns:
+        A list of BlobRef (empty if the store is disabled)
+    """
+    if not BLOB_STORE_ENABLED:
+        return []
+    refs = [store_element(elem) for elem in elems]
+    if refs:
+        logger.info("Stored %s %s (%s new, %s bytes)", len(refs), label,
+                    sum(ref.new for ref in refs), sum(ref.size for ref in refs))
+    return refs
+
+
+def open_blob(digest, directory=None):
+    """
+    Return a BlobRef for a stored digest.
+
+    Raises:
+        FileNotFoundError: if the blob is not in the store
+    """
+    path = blob_path(digest, directory)
+    return BlobRef(digest, os.path.getsize(path), path, new=False)
+
+
+def prune(directory=None, now=None):
+    """
+    Delete the blobs not received for BLOB_RETENTION_SECONDS.
+
+    Leftover incoming files (of an interrupted store) are deleted too.
+
+    Args:
+        directory: The store directory (default BLOB_STORE_DIR)
+        now: The current time (default: time.time())
+
+    Returns:
+        The number of files deleted
+    """
+    if BLOB_RETENTION_SECONDS <= 0:
+        return 0
+    directory = directory or BLOB_STORE_DIR
+    cutoff = (time.time() if now is None else now) - BLOB_RETENTION_SECONDS
+    deleted = 0
+    if not os.path.isdir(directory):
+        return deleted
+    for entry in os.scandir(directory):
+        entries = os.scandir(entry.path) if entry.is_dir() else [entry]
+        for blob in entries:
+            if blob.is_file() and blob.stat().st_mtime <= cutoff:
+                os.unlink(blob.path)
+                deleted += 1
+    logger.info("Pruned %s blobs older than %ss from %s", deleted, BLOB_RETENTION_SECONDS, directory)
+    return deleted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain the callback blob store.')
+    parser.add_argument('--dir', default=None, help='store directory (default: BLOB_STORE_DIR)')
+    parser.add_argument('--prune', action='store_true', help='delete the blobs older than BLOB_RETENTION_SECONDS')
+    args = parser.parse_args(argv)
+    if args.prune:
+        print(f"Deleted {prune(args.dir)} blobs")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,229 @@
+"""
+Durable local queue for ProviderResponseService callbacks.
+
+With ``PROVIDER_ASYNC_ACK=1`` the endpoint validates the envelope, stores the
+raw message here and acknowledges straight away; ``app.callback_worker``
+drains the queue, processes the messages and retries failures until they are
+moved to the dead-letter state.
+
+The queue is a SQLite database in WAL mode, so any number of gunicorn workers
+and queue workers on the same host can use it concurrently. The body of a
+processed message is dropped when it completes; the row itself is kept for
+``CALLBACK_RETENTION_SECONDS`` (for the stats) and then deleted.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+# Set to 1 to acknowledge callbacks before processing them
+ASYNC_ACK = os.getenv('PROVIDER_ASYNC_ACK', '0') == '1'
+CALLBACK_QUEUE_DB = os.getenv('CALLBACK_QUEUE_DB', 'callback_queue.sqlite3')
+# Attempts before a message is dead-lettered
+CALLBACK_MAX_ATTEMPTS = int(os.getenv('CALLBACK_MAX_ATTEMPTS', '5'))
+# Base delay in seconds before retrying; doubles after every failed attempt
+CALLBACK_RETRY_DELAY = float(os.getenv('CALLBACK_RETRY_DELAY', '5'))
+# Seconds after which a message claimed by a worker that died is handed out again
+CALLBACK_LEASE_SECONDS = float(os.getenv('CALLBACK_LEASE_SECONDS', '300'))
+# Seconds a processed message is kept (without its body) before it is deleted
+CALLBACK_RETENTION_SECONDS = float(os.getenv('CALLBACK_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'
+DEAD = 'dead'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callbacks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    received_at REAL NOT NULL,
+    body BLOB NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_at REAL,
+    processed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS callbacks_ready ON callbacks (status, next_attempt_at);
+"""
+# Completions between deletions of expired processed messages
+PRUNE_EVERY = 100
+
+
+class QueuedCallback:
+    """
+    A callback claimed from the queue.
+
+    Attributes:
+        id: The queue id
+        body: The raw SOAP envelope bytes
+        attempts: Number of earlier failed attempts
+        received_at: When the callback was acknowledged (epoch seconds)
+    """
+
+    def __init__(self, id, body, attempts, received_at):
+        self.id = id
+        self.body = body
+        self.attempts = attempts
+        self.received_at = received_at
+
+
+_local = threading.local()
+_completions = 0
+
+
+def get_connection(path=None):
+    """
+    Return this thread's connection to the queue database, creating the schema.
+
+    Connections are per thread and per process, so they are never shared
+    across a fork.
+    """
+    path = path or CALLBACK_QUEUE_DB
+    key = (os.getpid(), path)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(key)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.executescript(SCHEMA)
+        connections[key] = connection
+    return connection
+
+
+def enqueue(body, path=None):
+    """
+    Persist a raw callback for later processing.
+
+    Args:
+        body: The raw SOAP envelope bytes
+        path: The queue database (default: CALLBACK_QUEUE_DB)
+
+    Returns:
+        The queue id of the message
+    """
+    now = time.time()
+    cursor = get_connection(path).execute(
+        "INSERT INTO callbacks (received_at, body, status, next_attempt_at) VALUES (?, ?, ?, ?)",
+        (now, sqlite3.Binary(body), PENDING, now),
+    )
+    return cursor.lastrowid
+
+
+def claim(path=None):
+    """
+    Claim the oldest message that is ready to be processed.
+
+    Messages whose claim has outlived CALLBACK_LEASE_SECONDS are treated as
+    abandoned by a crashed worker and can be claimed again.
+
+    Returns:
+        A QueuedCallback, or None if nothing is ready
+    """
+    connection = get_connection(path)
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        row = connection.execute(
+            "SELECT id, body, attempts, received_at FROM callbacks"
+            " WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND claimed_at < ?)"
+            " ORDER BY id LIMIT 1",
+            (PENDING, now, PROCESSING, now - CALLBACK_LEASE_SECONDS),
+        ).fetchone()
+        if row is None:
+            connection.execute('COMMIT')
+            return None
+        connection.execute(
+            "UPDATE callbacks SET status = ?, claimed_at = ? WHERE id = ?",
+            (PROCESSING, now, row[0]),
+        )
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return QueuedCallback(row[0], bytes(row[1]), row[2], row[3])
+
+
+def complete(callback_id, path=None):
+    """Mark a message as processed and drop its body."""
+    global _completions
+    connection = get_connection(path)
+    now = time.time()
+    connection.execute(
+        "UPDATE callbacks SET status = ?, processed_at = ?, last_error = NULL, body = ? WHERE id = ?",
+        (DONE, now, sqlite3.Binary(b''), callback_id),
+    )
+    _completions += 1
+    if _completions % PRUNE_EVERY == 0:
+        prune(path, now)
+
+
+def prune(path=None, now=None):
+    """
+    Delete the processed messages older than CALLBACK_RETENTION_SECONDS.
+
+    Returns:
+        The number of messages deleted
+    """
+    now = time.time() if now is None else now
+    cursor = get_connection(path).execute(
+        "DELETE FROM callbacks WHERE status = ? AND processed_at <= ?",
+        (DONE, now - CALLBACK_RETENTION_SECONDS),
+    )
+    return cursor.rowcount
+
+
+def fail(callback_id, error, path=None):
+    """
+    Record a failed attempt; retry later with exponential backoff, or dead-letter.
+
+    Returns:
+        The new status of the message (PENDING or DEAD)
+    """
+    connection = get_connection(path)
+    attempts = connection.execute(
+        "SELECT attempts FROM callbacks WHERE id = ?", (callback_id,)
+    ).fetchone()[0] + 1
+    now = time.time()
+    status = DEAD if attempts >= CALLBACK_MAX_ATTEMPTS else PENDING
+    connection.execute(
+        "UPDATE callbacks SET status = ?, attempts = ?, next_attempt_at = ?, processed_at = ?, last_error = ?"
+        " WHERE id = ?",
+        (status, attempts, now + CALLBACK_RETRY_DELAY * 2 ** (attempts - 1),
+         now if status == DEAD else None, str(error), callback_id),
+    )
+    return status
+
+
+def requeue_dead(path=None):
+    """Move every dead-lettered message back to the queue; return how many."""
+    cursor = get_connection(path).execute(
+        "UPDATE callbacks SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+        (PENDING, time.time(), DEAD),
+    )
+    return cursor.rowcount
+
+
+def stats(path=None):
+    """
+    Summarise the queue.
+
+    Returns:
+        A dict with the message count per status, the mean time from
+        acknowledgement to completion in seconds of the processed messages
+        still kept, and how long they are kept (retention_seconds)
+    """
+    connection = get_connection(path)
+    counts = {status: 0 for status in (PENDING, PROCESSING, DONE, DEAD)}
+    for status, count in connection.execute("SELECT status, COUNT(*) FROM callbacks GROUP BY status"):
+        counts[status] = count
+    mean_latency = connection.execute(
+        "SELECT AVG(processed_at - received_at) FROM callbacks WHERE status = ?", (DONE,)
+    ).fetchone()[0]
+    counts['mean_processing_latency'] = mean_latency
+    counts['retention_seconds'] = CALLBACK_RETENTION_SECONDS
+    return counts
@@ -0,0 +1,158 @@
+"""
+Drain the callback queue filled by ProviderResponseService in async-ack mode.
+
+Run alongside the web workers, on the same host (the queue is a local SQLite
+database)::
+
+    PROVIDER_ASYNC_ACK=1 python -m app.callback_worker --processes 4
+
+Every process claims one callback at a time, runs it through the normal
+``process_submit_request`` path and marks it done, or records the failure so
+it is retried with backoff and eventually dead-lettered. A callback is only
+recorded in app.idempotency once it has been processed here; a copy queued
+by a Comcorp retry of a callback processed since is completed unprocessed. Each process logs its
+throughput and the mean time from acknowledgement to completion, so
+processing capacity can be measured separately from ack latency.
+
+``--stats`` prints the queue counts and ``--requeue-dead`` moves dead-lettered
+callbacks back to the queue.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from lxml import etree
+
+from app import callback_queue, idempotency
+from app.logging_config import configure_logging, flush as flush_logs
+
+logger = logging.getLogger(__name__)
+
+# Seconds to sleep when the queue is empty
+CALLBACK_POLL_INTERVAL = float(os.getenv('CALLBACK_POLL_INTERVAL', '0.5'))
+# Seconds between throughput reports
+CALLBACK_REPORT_INTERVAL = float(os.getenv('CALLBACK_REPORT_INTERVAL', '60'))
+
+
+def process_callback(callback):
+    """
+    Process one queued callback.
+
+    Args:
+        callback: A QueuedCallback
+
+    Returns:
+        A tuple (success, error_message)
+    """
+    from app.provider_response_service import process_submit_request
+
+    try:
+        envelope = etree.fromstring(callback.body)
+    except etree.XMLSyntaxError as e:
+        return False, f"Unparseable envelope: {str(e)}"
+    # The timestamp was checked when the callback was acknowledged
+    if process_submit_request(envelope, check_timestamp=False, size=len(callback.body)):
+        return True, None
+    return False, "process_submit_request returned false"
+
+
+def run(stop, path=None):
+    """
+    Claim and process callbacks until ``stop`` is set.
+
+    Args:
+        stop: A multiprocessing.Event
+        path: The queue database (default: CALLBACK_QUEUE_DB)
+    """
+    processed = failed = 0
+    latency = 0.0
+    busy = 0.0
+    report_at = time.monotonic() + CALLBACK_REPORT_INTERVAL
+
+    while not stop.is_set():
+        callback = callback_queue.claim(path)
+        if callback is None:
+            stop.wait(CALLBACK_POLL_INTERVAL)
+        else:
+            started = time.monotonic()
+            # Queued callbacks passed verify_security when they were acknowledged
+            key = idempotency.key_from_bytes(callback.body)
+            if idempotency.lookup(key) is not None:
+                logger.info(f"Callback {callback.id} ({key}) was already processed")
+                callback_queue.complete(callback.id, path)
+                continue
+            try:
+                success, error_message = process_callback(callback)
+            except Exception as e:
+                success, error_message = False, str(e)
+            busy += time.monotonic() - started
+
+            if success:
+                callback_queue.complete(callback.id, path)
+                idempotency.record(key, success)
+                processed += 1
+                latency += time.time() - callback.received_at
+            else:
+                status = callback_queue.fail(callback.id, error_message, path)
+                failed += 1
+                logger.error(f"Callback {callback.id} failed (attempt {callback.attempts + 1}, now {status}): {error_message}")
+
+        if time.monotonic() >= report_at:
+            if processed or failed:
+                logger.info(
+                    f"Processed {processed} callbacks ({failed} failed) in {busy:.1f}s busy: "
+                    f"{processed / busy if busy else 0:.1f}/s, "
+                    f"mean ack-to-done {latency / processed if processed else 0:.3f}s"
+                )
+            processed = failed = 0
+            latency = busy = 0.0
+            report_at = time.monotonic() + CALLBACK_REPORT_INTERVAL
+
+
+def worker_process(stop, path=None):
+    """Process entry point: run(), then write out the queued log records."""
+    try:
+        run(stop, path)
+    finally:
+        flush_logs()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--processes', type=int, default=int(os.getenv('CALLBACK_WORKER_PROCESSES', '2')))
+    parser.add_argument('--db', default=None, help='queue database (default: CALLBACK_QUEUE_DB)')
+    parser.add_argument('--stats', action='store_true', help='print the queue counts and exit')
+    parser.add_argument('--requeue-dead', action='store_true', help='retry dead-lettered callbacks and exit')
+    args = parser.parse_args(argv)
+
+    configure_logging(fmt='%(asctime)s - %(name)s - %(processName)s - %(levelname)s - %(message)s')
+
+    if args.stats:
+        print(json.dumps(callback_queue.stats(args.db), indent=2))
+        return
+    if args.requeue_dead:
+        print(f"Requeued {callback_queue.requeue_dead(args.db)} callbacks")
+        return
+
+    stop = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    processes = [
+        multiprocessing.Process(target=worker_process, args=(stop, args.db), name=f'callback-worker-{i}')
+        for i in range(max(1, args.processes))
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} callback workers on {args.db or callback_queue.CALLBACK_QUEUE_DB}")
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
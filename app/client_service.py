@@ -0,0 +1,251 @@
+"""
+Pooled zeep clients for outbound Comcorp calls.
+
+Building a ``zeep.Client`` parses the WSDL and every imported XSD, loads the
+signing key and certificate and creates a new HTTP session. Doing that on
+every request makes WSDL parsing, not the remote call, the dominant cost of
+``/comcorp-download-request``. This module keeps one client per worker process
+and hands it out to every request.
+
+``get_async_client`` is the asyncio equivalent: a ``zeep.AsyncClient`` on an
+httpx transport, with the same signing and encryption, for the ASGI app.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import deque
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import zeep
+from zeep.plugins import HistoryPlugin
+from zeep.proxy import AsyncServiceProxy
+from zeep.transports import AsyncTransport, Transport
+
+from app.constants import REQUESTING_MEMBER_WSDL, PRIVATE_KEY_FILE, PUBLIC_KEY_FILE
+from app.envelope_template import install as install_template
+from app.metrics import OUTBOUND, timed
+from app.plugin import encryptPlugin
+from app.signature_service import BinarySignatureTimestamp
+from app.wsdl_cache import load_document
+
+SERVICE_NAME = "ConsumerDecryptedService"
+PORT_NAME = "CustomBinding_IConsumerDecryptedService"
+
+# Keep-alive pool for the transport session
+POOL_CONNECTIONS = int(os.getenv('COMCORP_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.getenv('COMCORP_POOL_MAXSIZE', '16'))
+OPERATION_TIMEOUT = int(os.getenv('COMCORP_OPERATION_TIMEOUT', '120'))
+# Override the endpoint address from the WSDL (e.g. to point at a stand-in)
+SERVICE_ADDRESS = os.getenv('COMCORP_SERVICE_ADDRESS')
+# Set to 0 to build a new client per request (only useful for benchmarking)
+CLIENT_POOLING = os.getenv('COMCORP_CLIENT_POOLING', '1') != '0'
+# Connection limit of the async client; each open connection is one in-flight call
+ASYNC_MAX_CONNECTIONS = int(os.getenv('COMCORP_ASYNC_MAX_CONNECTIONS', '1000'))
+
+
+class RequestHistoryPlugin(HistoryPlugin):
+    """
+    HistoryPlugin that keeps its history per request.
+
+    The pooled client is shared by every request served by the worker, so the
+    last sent/received envelopes must not leak between concurrent requests.
+    The history lives in a context variable, which is per thread for the
+    threaded WSGI workers and per task for the asyncio client.
+    """
+
+    def __init__(self, maxlen=1):
+        self._maxlen = maxlen
+        self._history = contextvars.ContextVar(f'history-{id(self)}')
+
+    @property
+    def _buffer(self):
+        buffer = self._history.get(None)
+        if buffer is None:
+            buffer = deque([], self._maxlen)
+            self._history.set(buffer)
+        return buffer
+
+    def reset(self):
+        """Start a new history for the current request."""
+        self._history.set(deque([], self._maxlen))
+
+    @property
+    def last_sent(self):
+        return self._buffer[-1]['sent'] if self._buffer else None
+
+    @property
+    def last_received(self):
+        return self._buffer[-1]['received'] if self._buffer else None
+
+
+class TimedTransport(Transport):
+    """Transport that records the network round trip of each call."""
+
+    def post_xml(self, address, envelope, headers):
+        with timed(OUTBOUND, 'network'):
+            return super().post_xml(address, envelope, headers)
+
+
+class TimedAsyncTransport(AsyncTransport):
+    """AsyncTransport that records the network round trip of each call."""
+
+    async def post_xml(self, address, envelope, headers):
+        with timed(OUTBOUND, 'network'):
+            return await super().post_xml(address, envelope, headers)
+
+
+class PooledClient:
+    """
+    A zeep client together with the plugins whose state belongs to it.
+
+    Attributes:
+        soap: The zeep.Client instance
+        service: The ServiceProxy bound to the configured endpoint address
+        history: The per-thread RequestHistoryPlugin attached to ``soap``
+        template: The EnvelopeTemplate of the Submit operation, or None
+    """
+
+    def __init__(self, soap, service, history, template=None):
+        self.soap = soap
+        self.service = service
+        self.history = history
+        self.template = template
+
+
+def create_session():
+    """Create the requests session used by the transport, with connection pooling."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_client(wsdl=REQUESTING_MEMBER_WSDL):
+    """
+    Build a new client for the RequestingMemberSubmitService.
+
+    Args:
+        wsdl: The WSDL location
+
+    Returns:
+        A PooledClient
+    """
+    history = RequestHistoryPlugin()
+    transport = TimedTransport(session=create_session(), operation_timeout=OPERATION_TIMEOUT)
+    soap = zeep.Client(
+        wsdl=load_document(wsdl, transport),
+        service_name=SERVICE_NAME,
+        port_name=PORT_NAME,
+        transport=transport,
+        wsse=BinarySignatureTimestamp(PRIVATE_KEY_FILE, PUBLIC_KEY_FILE, ''),
+        plugins=[encryptPlugin(), history]
+    )
+    # Bind the service now so the first request does not pay for it
+    if SERVICE_ADDRESS:
+        port = soap.wsdl.services[SERVICE_NAME].ports[PORT_NAME]
+        service = soap.create_service(port.binding.name.text, SERVICE_ADDRESS)
+    else:
+        service = soap.service
+    return PooledClient(soap, service, history, install_template(soap, service._binding))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(wsdl=REQUESTING_MEMBER_WSDL):
+    """
+    Return the client for this worker process, creating it on first use.
+
+    Clients are keyed on the process id so that a client created before a
+    fork (e.g. with gunicorn ``preload_app``) is never shared with a worker
+    along with its HTTP connections.
+
+    Args:
+        wsdl: The WSDL location
+
+    Returns:
+        A PooledClient
+    """
+    if not CLIENT_POOLING:
+        return create_client(wsdl)
+
+    key = (os.getpid(), wsdl)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = create_client(wsdl)
+                _clients[key] = client
+    return client
+
+
+def create_async_client(wsdl=REQUESTING_MEMBER_WSDL):
+    """
+    Build a new asyncio client for the RequestingMemberSubmitService.
+
+    Signing (BinarySignatureTimestamp) and encryption (encryptPlugin) run in
+    the same way as for the sync client; only the HTTP call is awaited.
+
+    Args:
+        wsdl: The WSDL location
+
+    Returns:
+        A PooledClient whose ``service`` operations are coroutines
+    """
+    history = RequestHistoryPlugin()
+    limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=POOL_MAXSIZE)
+    transport = TimedAsyncTransport(
+        client=httpx.AsyncClient(limits=limits, timeout=OPERATION_TIMEOUT),
+        operation_timeout=OPERATION_TIMEOUT,
+    )
+    soap = zeep.AsyncClient(
+        wsdl=load_document(wsdl, transport),
+        service_name=SERVICE_NAME,
+        port_name=PORT_NAME,
+        transport=transport,
+        wsse=BinarySignatureTimestamp(PRIVATE_KEY_FILE, PUBLIC_KEY_FILE, ''),
+        plugins=[encryptPlugin(), history]
+    )
+    if SERVICE_ADDRESS:
+        port = soap.wsdl.services[SERVICE_NAME].ports[PORT_NAME]
+        service = AsyncServiceProxy(soap, port.binding, address=SERVICE_ADDRESS)
+    else:
+        service = soap.service
+    return PooledClient(soap, service, history, install_template(soap, service._binding))
+
+
+_async_clients = {}
+
+
+def get_async_client(wsdl=REQUESTING_MEMBER_WSDL):
+    """
+    Return the asyncio client for this process and running event loop.
+
+    The httpx connection pool belongs to the event loop it was created on,
+    so clients are keyed on the loop as well as the process id.
+
+    Args:
+        wsdl: The WSDL location
+
+    Returns:
+        A PooledClient
+    """
+    key = (os.getpid(), id(asyncio.get_running_loop()), wsdl)
+    client = _async_clients.get(key)
+    if client is None:
+        client = create_async_client(wsdl)
+        _async_clients[key] = client
+    return client
+
+
+async def close_async_clients():
+    """Close the connection pools of this process's asyncio clients."""
+    pid = os.getpid()
+    for key in [key for key in _async_clients if key[0] == pid]:
+        await _async_clients.pop(key).soap.transport.aclose()
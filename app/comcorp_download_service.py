@@ -1,22 +1,32 @@
 import os
-from flask import request, jsonify, Response
+import json
+import time
+import contextvars
+import itertools
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from flask import request, jsonify, Response, stream_with_context
 from functools import wraps
-import zeep
-from zeep.plugins import HistoryPlugin
-from lxml import etree
 import logging
-import base64
 
 from app import app
-from app.constants import REQUESTING_MEMBER_WSDL, PRIVATE_KEY_FILE, PUBLIC_KEY_FILE
-from app.plugin import encryptPlugin
-from app.signature_service import BinarySignatureTimestamp
-from app.object_service import getHeader, getDecryptedBody
+from app import debug_capture
+from app import result_cache, serialization
+from app.client_service import get_client
+from app.envelope_template import submit_arguments
+from app.object_service import getHeader
+from app.metrics import OUTBOUND, timed
+from app.result_model import result_to_model
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Concurrent Submit calls per bulk request (keep within COMCORP_POOL_MAXSIZE)
+BULK_CONCURRENCY = int(os.getenv('COMCORP_BULK_CONCURRENCY', '8'))
+# Maximum number of items in one bulk request
+BULK_MAX_ITEMS = int(os.getenv('COMCORP_BULK_MAX_ITEMS', '1000'))
+# Seconds a bulk request may run before its unfinished items are reported as
+# errors; keep it below the gunicorn worker timeout (config/gunicorn_config.py)
+BULK_DEADLINE_SECONDS = float(os.getenv('COMCORP_BULK_DEADLINE_SECONDS', '100'))
+
 def check_auth(username, password):
     """Check if the provided username and password match the environment variables."""
     expected_username = os.getenv('BASIC_AUTH_USERNAME')
@@ -42,6 +52,37 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
+def submit_download_request(payload, header=None):
+    """
+    Submit one IDXConsumerSubmitMessage to Comcorp.
+
+    Args:
+        payload: The download request parameters (see comcorp_download_request)
+        header: A SecureXHeader built by getHeader, to share it between
+                requests; built here if not given
+
+    Returns:
+        A tuple (response_data, history) where history is the client's
+        RequestHistoryPlugin, holding this thread's last sent/received envelopes
+    """
+    # Get the pooled SOAP client for this worker
+    with timed(OUTBOUND, 'client'):
+        client = get_client()
+    history = client.history
+    history.reset()
+
+    # Get header and body
+    with timed(OUTBOUND, 'build'):
+        args, kwargs = submit_arguments(client, payload, header)
+
+    # Make SOAP request (signing, encryption and the network round trip are
+    # timed by the client)
+    result = client.service.Submit(*args, **kwargs)
+
+    with timed(OUTBOUND, 'serialize'):
+        return result_to_model(result), history
+
+
 @app.route('/comcorp-download-request', methods=['POST'])
 @requires_auth
 def comcorp_download_request():
@@ -69,10 +110,20 @@ def comcorp_download_request():
             }
         ]
     }
+
+    With ``?debug=true`` (if DEBUG_CAPTURE_REQUEST_FLAG=1) or when sampled
+    (see app.debug_capture) the response's ``debug`` field holds the
+    request and response XML; such responses are streamed (see
+    serialization.streamed).
     
     Returns:
-        JSON response containing the SOAP response or error details
+        JSON response containing the SOAP response (its ``data`` keeps the
+        structure of the WSDL response type) or error details; MessagePack
+        with ``Accept: application/msgpack`` if msgpack is installed
     """
+    # Capture the request and response XML if asked to (?debug=true) or sampled
+    debug_capture.start(debug_capture.is_flag_set(request.args.get('debug')))
+
     try:
         # Get the JSON payload
         payload = request.json
@@ -82,63 +133,212 @@ def comcorp_download_request():
                 'message': 'No JSON payload provided'
             }), 400
         
-        logger.info(f"Received request with payload: {payload}")
-        
-        # Initialize SOAP client
-        encrypt_plugin = encryptPlugin()
-        history = HistoryPlugin()
-        wsdl = REQUESTING_MEMBER_WSDL
-        private_key_filename = PRIVATE_KEY_FILE
-        public_key_filename = PUBLIC_KEY_FILE
+        logger.info("Received request with payload: %s", payload)
         
-        soap = zeep.Client(
-            wsdl=wsdl, 
-            service_name="ConsumerDecryptedService",
-            port_name="CustomBinding_IConsumerDecryptedService",
-            wsse=BinarySignatureTimestamp(private_key_filename, public_key_filename, ''),
-            plugins=[encrypt_plugin, history]
-        )
+        # Repeated queries may be answered from the result cache (if enabled);
+        # captured requests always go to Comcorp
+        bypass = debug_capture.active() or result_cache.bypass_requested(request.headers.get('Cache-Control'))
+        response_data, history, outcome = result_cache.fetch(
+            payload, lambda: submit_download_request(payload), bypass)
         
-        # Get header and body
-        header = getHeader(soap)
-        body = getDecryptedBody(soap, payload)
-        
-        # Make SOAP request
-        result = soap.service.Submit(body, _soapheaders={'Header': header})
-        
-        # Convert result to a serializable format
-        response_data = {}
-        
-        # Process the result based on its type
-        if hasattr(result, '__dict__'):
-            # If result is an object with attributes
-            for key, value in result.__dict__.items():
-                if key.startswith('_'):
-                    continue
-                response_data[key] = str(value)
-        else:
-            # If result is a simple type
-            response_data['result'] = str(result)
-        
-        # Add request and response XML for debugging
+        # Add request and response XML for debugging (captured requests only);
+        # it is pretty-printed while the response is streamed
         debug_info = {}
         try:
-            for hist_type, hist in [('request', history.last_sent), ('response', history.last_received)]:
-                if hist and 'envelope' in hist:
-                    debug_info[f'{hist_type}_xml'] = etree.tostring(hist['envelope'], encoding='unicode', pretty_print=True)
+            debug_info = debug_capture.history_debug_info(history, streamed=True)
         except (IndexError, TypeError) as e:
             logger.error(f"Error extracting request/response XML: {str(e)}")
         
-        # Return the response
-        return jsonify({
+        # Return the response (MessagePack if asked for and available)
+        mimetype = serialization.negotiate(request.headers.get('Accept'))
+        body = {
             'status': 'success',
             'data': response_data,
             'debug': debug_info
-        })
+        }
+        if serialization.streamed(mimetype, debug_info):
+            response = Response(serialization.iter_chunks(body), mimetype=mimetype)
+        else:
+            response = Response(serialization.encode(body, mimetype), mimetype=mimetype)
+        if outcome:
+            response.headers['X-Cache'] = outcome.upper()
+        return response
     
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+def submit_bulk_item(index, payload, header, bypass_cache=False):
+    """
+    Submit one item of a bulk request and describe the outcome.
+
+    Args:
+        index: The position of the item in the request
+        payload: The item's download request parameters
+        header: The SecureXHeader shared by the items
+        bypass_cache: Submit the item even if its result is cached
+
+    Returns:
+        A result dict with the index, status, data or message, and elapsed_ms
+    """
+    started = time.perf_counter()
+    try:
+        if not isinstance(payload, dict) or not payload:
+            raise ValueError('Item is not a JSON object')
+        response_data, _, _ = result_cache.fetch(
+            payload, lambda: submit_download_request(payload, header), bypass_cache)
+        item = {'index': index, 'status': 'success', 'data': response_data}
+    except Exception as e:
+        logger.error(f"Error processing bulk item {index}: {str(e)}")
+        item = {'index': index, 'status': 'error', 'message': str(e)}
+    item['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return item
+
+
+class InvalidItem:
+    """A bulk item that could not be decoded."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def read_ndjson(stream):
+    """Yield the items of an NDJSON stream; unparseable lines yield an error marker."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidItem(str(e))
+
+
+def _deadline_error(index):
+    return {'index': index, 'status': 'error', 'message': 'Bulk request deadline exceeded', 'elapsed_ms': 0}
+
+
+def _wait_completed(pending, deadline):
+    """Wait for at least one pending item (or the deadline); remove and yield the completed ones' results."""
+    done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+    for future in done:
+        del pending[future]
+        yield future.result()
+
+
+def bulk_results(items, header, concurrency=BULK_CONCURRENCY, bypass_cache=False, deadline=None):
+    """
+    Submit items concurrently and yield their results as they complete.
+
+    At most ``concurrency`` items are submitted at a time and only a bounded
+    number are read ahead. The caller enforces BULK_MAX_ITEMS. Items not
+    completed by the deadline yield an error result; those still running
+    finish in the background (and fill the result cache).
+
+    Args:
+        items: An iterable of download request payloads
+        header: The SecureXHeader shared by the items
+        concurrency: The maximum number of concurrent Submit calls
+        bypass_cache: Submit the items even if their results are cached
+        deadline: time.monotonic() value by which to stop (default:
+                  BULK_DEADLINE_SECONDS from now)
+
+    Yields:
+        Result dicts (see submit_bulk_item)
+    """
+    if deadline is None:
+        deadline = time.monotonic() + BULK_DEADLINE_SECONDS
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bulk-submit')
+    # future -> item index
+    pending = {}
+    try:
+        for index, payload in enumerate(items):
+            if isinstance(payload, InvalidItem):
+                yield {'index': index, 'status': 'error', 'message': f'Invalid JSON: {payload.message}', 'elapsed_ms': 0}
+                continue
+            if time.monotonic() >= deadline:
+                yield _deadline_error(index)
+                continue
+            # Run each item in a copy of the request's context (debug capture)
+            context = contextvars.copy_context()
+            pending[executor.submit(context.run, submit_bulk_item, index, payload, header, bypass_cache)] = index
+            if len(pending) >= concurrency * 2:
+                yield from _wait_completed(pending, deadline)
+        while pending and time.monotonic() < deadline:
+            yield from _wait_completed(pending, deadline)
+        for index in sorted(pending.values()):
+            yield _deadline_error(index)
+    finally:
+        # Drop the items not started yet; don't wait for the running ones
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.route('/comcorp-download-request/bulk', methods=['POST'])
+@requires_auth
+def comcorp_download_request_bulk():
+    """
+    Bulk REST endpoint for comcorp-download-request.
+
+    Accepts a JSON array of download request payloads (as for
+    /comcorp-download-request), or one payload per line with the
+    application/x-ndjson content type, and submits them concurrently.
+    A request with more than BULK_MAX_ITEMS items is rejected with a 413
+    before any item is submitted, and items not completed within
+    BULK_DEADLINE_SECONDS are reported as errors so the response ends before
+    the worker timeout.
+
+    Returns:
+        An NDJSON stream with one line per item, in completion order:
+        {"index": 0, "status": "success", "data": {...}, "elapsed_ms": 812.4}
+        {"index": 1, "status": "error", "message": "...", "elapsed_ms": 95.0}
+        followed by a summary line:
+        {"summary": {"total": 2, "succeeded": 1, "failed": 1, "elapsed_ms": 830.2}}
+    """
+    debug_capture.start(debug_capture.is_flag_set(request.args.get('debug')))
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        # Read one line past the limit to tell whether there are too many items
+        items = list(itertools.islice(read_ndjson(request.stream), BULK_MAX_ITEMS + 1))
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return jsonify({
+                'status': 'error',
+                'message': 'Expected a JSON array or an NDJSON body'
+            }), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({
+            'status': 'error',
+            'message': f'More than {BULK_MAX_ITEMS} items'
+        }), 413
+
+    # The SecureXHeader is the same for every item; build it once
+    try:
+        header = getHeader(get_client().soap)
+    except Exception as e:
+        logger.error(f"Error building the SecureXHeader: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+    bypass_cache = debug_capture.active() or result_cache.bypass_requested(request.headers.get('Cache-Control'))
+
+    def generate():
+        started = time.perf_counter()
+        total = succeeded = 0
+        for item in bulk_results(items, header, bypass_cache=bypass_cache):
+            total += 1
+            succeeded += item['status'] == 'success'
+            yield serialization.dumps(item) + b'\n'
+        yield serialization.dumps({'summary': {
+            'total': total,
+            'succeeded': succeeded,
+            'failed': total - succeeded,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }}) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 REQUESTING_MEMBER_WSDL = 'RequestingMemberSubmitService.wsdl'
@@ -9,6 +10,9 @@ PUBLIC_KEY_PATH = Path('../certs/comcorp_uat.crt')
 PRIVATE_KEY_FILE = '../certs/private_key.pem'
 PUBLIC_KEY_FILE = '../certs/comcorp.cer'
 
+# Capture the XML of every request (see app.debug_capture); keep off in production
+WSSE_DEBUG = os.getenv('WSSE_DEBUG', '0') == '1'
+
 # Load the keys into memory
 with open(PRIVATE_KEY_PATH, 'r') as key_file:
     PRIVATE_KEY = key_file.read()
@@ -30,4 +34,12 @@ WSSE_NS = WSS_BASE + 'oasis-200401-wss-wssecurity-secext-1.0.xsd'
 WSU_NS = WSS_BASE + 'oasis-200401-wss-wssecurity-utility-1.0.xsd'
 
 BASE64B = WSS_BASE + 'oasis-200401-wss-soap-message-security-1.0#Base64Binary'
-X509TOKEN = WSS_BASE + 'oasis-200401-wss-x509-token-profile-1.0#X509v3'
\ No newline at end of file
+X509TOKEN = WSS_BASE + 'oasis-200401-wss-x509-token-profile-1.0#X509v3'
+
+# Comcorp contract namespaces
+SECUREX_NS = 'http://SecureX.Common/V1'
+PROVIDER_SUBMIT_NS = 'http://SecureX.ProviderSubmitService/V1'
+AVX_NS = 'http://AvX.Contract/V1'
+FICAX_NS = 'http://FicaX.Contract/V1'
+IDX_NS = 'http://IDX.Contract/V1'
+IVX_NS = 'http://IVX.Contract/V1'
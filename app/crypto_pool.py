@@ -0,0 +1,136 @@
+"""
+Process pool for decrypting inbound WS-Security envelopes.
+
+Unwrapping the session key (RSA-OAEP) and decrypting a multi-MB body
+(AES-GCM) is CPU-bound and holds the request worker for the whole time.
+``decrypt`` hands large envelopes to a pool of processes, each of which loads
+the private key once (in its initializer) and keeps it in its key store; the
+request thread just waits on the result. Small envelopes are decrypted inline,
+where pickling and IPC would cost more than the crypto; ``decrypt_element``
+decrypts a parsed envelope in place unless it goes to the pool (decided by the
+length of the raw request), so only pooled envelopes are serialized and parsed
+again.
+
+The pool is created on first use in each process, so gunicorn workers each get
+their own pool. Its processes are started by a forkserver rather than forked
+from the (multi-threaded) web worker; they import the app and load the key
+themselves (scripts using the pool need an ``if __name__ == '__main__'``
+guard). ``CRYPTO_POOL_PROCESSES=0`` (the default) decrypts everything inline.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lxml import etree
+
+from app.constants import PRIVATE_KEY_FILE
+from app import crypto_wsse
+from app.key_store import get_private_key
+
+logger = logging.getLogger(__name__)
+
+# Number of decryption processes per web worker; 0 decrypts inline
+CRYPTO_POOL_PROCESSES = int(os.getenv('CRYPTO_POOL_PROCESSES', '0'))
+# Envelopes smaller than this are decrypted inline
+CRYPTO_POOL_MIN_BYTES = int(os.getenv('CRYPTO_POOL_MIN_BYTES', '65536'))
+# multiprocessing start method for the pool processes; 'fork' is not safe
+# in a threaded web worker (a lock held by another thread stays locked in the child)
+CRYPTO_POOL_START_METHOD = os.getenv('CRYPTO_POOL_START_METHOD', 'forkserver')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _init_process(keyfile):
+    """Load the private key once in a new pool process."""
+    get_private_key(keyfile)
+
+
+def _decrypt(envelope, keyfile):
+    return crypto_wsse.decrypt(envelope, keyfile)
+
+
+def get_pool(processes=None, keyfile=PRIVATE_KEY_FILE):
+    """
+    Return this process's decryption pool, creating it if needed.
+
+    Args:
+        processes: Number of pool processes (default: CRYPTO_POOL_PROCESSES)
+        keyfile: The private key the pool processes preload
+
+    Returns:
+        A ProcessPoolExecutor
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ProcessPoolExecutor(
+                max_workers=processes or CRYPTO_POOL_PROCESSES,
+                mp_context=multiprocessing.get_context(CRYPTO_POOL_START_METHOD),
+                initializer=_init_process,
+                initargs=(keyfile,),
+            )
+            _pool_pid = pid
+            logger.info(f"Started crypto pool with {processes or CRYPTO_POOL_PROCESSES} processes")
+        return _pool
+
+
+def shutdown():
+    """Stop this process's pool, if it has one."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = _pool_pid = None
+
+
+def decrypt(envelope, keyfile=PRIVATE_KEY_FILE):
+    """
+    Decrypt a serialized SOAP envelope, in the pool if it is large enough.
+
+    Args:
+        envelope: The serialized envelope (bytes)
+        keyfile: Path to the PEM private key the session key was wrapped for
+
+    Returns:
+        The serialized decrypted envelope
+    """
+    if CRYPTO_POOL_PROCESSES <= 0 or len(envelope) < CRYPTO_POOL_MIN_BYTES:
+        return crypto_wsse.decrypt(envelope, keyfile)
+    return _decrypt_in_pool(envelope, keyfile)
+
+
+def decrypt_element(envelope, keyfile=PRIVATE_KEY_FILE, size=None):
+    """
+    Decrypt a parsed SOAP envelope, in the pool if it is large enough.
+
+    Args:
+        envelope: The SOAP envelope as an lxml Element
+        keyfile: Path to the PEM private key the session key was wrapped for
+        size: Length in bytes of the raw envelope the tree was parsed from
+              (e.g. the request's Content-Length); None decrypts inline
+
+    Returns:
+        The decrypted envelope: ``envelope`` itself, decrypted in place, or
+        a new tree parsed from the pool's result
+    """
+    if CRYPTO_POOL_PROCESSES <= 0 or size is None or size < CRYPTO_POOL_MIN_BYTES:
+        return crypto_wsse.decrypt_element(envelope, keyfile)
+    return etree.fromstring(_decrypt_in_pool(etree.tostring(envelope), keyfile))
+
+
+def _decrypt_in_pool(envelope, keyfile):
+    try:
+        return get_pool(keyfile=keyfile).submit(_decrypt, envelope, keyfile).result()
+    except BrokenProcessPool:
+        # A pool process died; start a new pool for the next request
+        logger.error("Crypto pool is broken, restarting it")
+        shutdown()
+        raise
@@ -7,17 +7,32 @@ admittedly painful, will likely assist in understanding the code in this
 module.
 """
 import base64
+import copy
 
 from lxml import etree
-from OpenSSL import crypto
 import xmlsec
 
-from app.constants import BASE64B, X509TOKEN, DS_NS, ENC_NS, SOAP_NS, WSSE_NS
+from app.constants import BASE64B, X509TOKEN, DS_NS, ENC_NS, WSSE_NS
+from app import session_keys
+from app.key_store import get_certificate, get_private_key
 from app.xml import ensure_id, ns
+from app.xpaths import BODY, ENCRYPTED_DATA, ENCRYPTED_KEY_PATH, REFERENCE_LIST, SECURITY_PATH, IdIndex
 
 
 def encrypt(envelope, certfile):
+    """Encrypt serialized SOAP ``envelope``; return the serialized result.
+    Parses ``envelope`` and delegates to ``encrypt_element``, which has the
+    details. Prefer ``encrypt_element`` when the envelope is already a tree.
+    """
+    doc = etree.fromstring(envelope)
+    encrypt_element(doc, certfile)
+    return etree.tostring(doc)
+
+
+def encrypt_element(doc, certfile):
     """Encrypt body contents of given SOAP envelope using given X509 cert.
+    ``doc`` is the soap:Envelope element; it is encrypted in place (no
+    serialization round-trip) and returned.
     Currently only encrypts the first child node of the body, so doesn't really
     support a body with multiple child nodes (the later ones won't be
     encrypted), and doesn't support encryption of multiple nodes.
@@ -91,23 +106,13 @@ def encrypt(envelope, certfile):
     the Signature node would also be present in the header, but we aren't
     encrypting it and for simplicity it's omitted in this example.)
     """
-    doc = etree.fromstring(envelope)
-    for child in doc.iter():
-        print(child.tag, child.text)
-
-    header = doc.find(ns(SOAP_NS, 'Header'))
-    print('header: ', header)
-
-    security = header.find(ns(WSSE_NS, 'Security'))
-    print('security: ', security)
+    security = doc.find(SECURITY_PATH)
 
-    # Create a keys manager and load the cert into it.
-    manager = xmlsec.KeysManager()
-    key = xmlsec.Key.from_file(certfile, xmlsec.KeyFormat.CERT_PEM, None)
-    manager.add_key(key)
+    # Get the cert (loaded once per process) and its keys manager.
+    cert = get_certificate(certfile)
 
     # Encrypt first child node of the soap:Body.
-    body = doc.find(ns(SOAP_NS, 'Body'))
+    body = doc.find(BODY)
     target = body[0]
 
     # Create the EncryptedData node we will replace the target node with,
@@ -121,25 +126,47 @@ def encrypt(envelope, certfile):
         ns='xenc',
     )
     xmlsec.template.encrypted_data_ensure_cipher_value(enc_data)
-    key_info = xmlsec.template.encrypted_data_ensure_key_info(
-        enc_data, ns='dsig')
-    enc_key = xmlsec.template.add_encrypted_key(
-        key_info, xmlsec.Transform.RSA_OAEP)
-    xmlsec.template.encrypted_data_ensure_cipher_value(enc_key)
-
-    enc_ctx = xmlsec.EncryptionContext(manager)
-    # Generate a per-session DES key (will be encrypted using the cert).
-    enc_ctx.key = xmlsec.Key.generate(
-        xmlsec.KeyData.AES, 256, xmlsec.KeyDataType.SESSION)
-    # Ask XMLSec to actually do the encryption.
-    enc_data = enc_ctx.encrypt_xml(enc_data, target)
-
-    # XMLSec inserts the EncryptedKey node directly within EncryptedData,
-    # but WSSE wants it in the Security header instead, and referencing the
-    # EncryptedData as well as the actual cert in a BinarySecurityToken.
-
-    # Move the EncryptedKey node up into the wsse:Security header.
-    security.insert(0, enc_key)
+
+    # With session key reuse enabled (app.session_keys), the key and its
+    # EncryptedKey may come from an earlier message; the data is still
+    # encrypted with a new random GCM nonce.
+    session = session_keys.acquire(cert)
+    if session is not None and session.wrapped is not None:
+        enc_ctx = xmlsec.EncryptionContext()
+        enc_ctx.key = session.key
+        enc_data = enc_ctx.encrypt_xml(enc_data, target)
+        enc_key = copy.deepcopy(session.wrapped)
+        security.insert(0, enc_key)
+    else:
+        key_info = xmlsec.template.encrypted_data_ensure_key_info(
+            enc_data, ns='dsig')
+        enc_key = xmlsec.template.add_encrypted_key(
+            key_info, xmlsec.Transform.RSA_OAEP)
+        xmlsec.template.encrypted_data_ensure_cipher_value(enc_key)
+
+        enc_ctx = cert.encryption_context()
+        # Generate a per-session AES key (will be encrypted using the cert).
+        if session is not None:
+            enc_ctx.key = session.key
+        else:
+            enc_ctx.key = xmlsec.Key.generate(
+                xmlsec.KeyData.AES, 256, xmlsec.KeyDataType.SESSION)
+        # Ask XMLSec to actually do the encryption.
+        enc_data = enc_ctx.encrypt_xml(enc_data, target)
+
+        # XMLSec inserts the EncryptedKey node directly within EncryptedData,
+        # but WSSE wants it in the Security header instead, and referencing the
+        # EncryptedData as well as the actual cert in a BinarySecurityToken.
+
+        # Move the EncryptedKey node up into the wsse:Security header.
+        security.insert(0, enc_key)
+
+        # Remove the now-empty KeyInfo node from EncryptedData (it used to
+        # contain EncryptedKey, but we moved that up into the Security header).
+        enc_data.remove(key_info)
+
+        if session is not None:
+            session.wrapped = copy.deepcopy(enc_key)
 
     # Create a wsse:BinarySecurityToken node containing the cert and add it
     # to the Security header.
@@ -153,55 +180,67 @@ def encrypt(envelope, certfile):
     # Add a DataReference from the EncryptedKey node to the EncryptedData.
     add_data_reference(enc_key, enc_data)
 
-    # Remove the now-empty KeyInfo node from EncryptedData (it used to
-    # contain EncryptedKey, but we moved that up into the Security header).
-    enc_data.remove(key_info)
+    return doc
+
 
+def decrypt(envelope, keyfile):
+    """Decrypt serialized SOAP ``envelope``; return the serialized result.
+    Parses ``envelope`` and delegates to ``decrypt_element``, which has the
+    details. Prefer ``decrypt_element`` when the envelope is already a tree.
+    """
+    doc = etree.fromstring(envelope)
+    decrypt_element(doc, keyfile)
     return etree.tostring(doc)
 
 
-def decrypt(envelope, keyfile):
+def decrypt_element(doc, keyfile):
     """Decrypt all EncryptedData, using EncryptedKey from Security header.
-    EncryptedKey should be a session key encrypted for given ``keyfile``.
-    Expects XML similar to the example in the ``encrypt`` docstring.
+    ``doc`` is the soap:Envelope element; it is decrypted in place and
+    returned. EncryptedKey should be a session key encrypted for given
+    ``keyfile``. Expects XML similar to the example in the ``encrypt_element``
+    docstring.
     """
-    # Create a key manager and load our key into it.
-    manager = xmlsec.KeysManager()
-    key = xmlsec.Key.from_file(keyfile, xmlsec.KeyFormat.PEM)
-    manager.add_key(key)
+    # Get our key (loaded once per process) and its keys manager.
+    key = get_private_key(keyfile)
 
-    doc = etree.fromstring(envelope)
-    header = doc.find(ns(SOAP_NS, 'Header'))
-    security = header.find(ns(WSSE_NS, 'Security'))
-    enc_key = security.find(ns(ENC_NS, 'EncryptedKey'))
+    enc_key = doc.find(ENCRYPTED_KEY_PATH)
+    if enc_key is None:
+        raise ValueError('No EncryptedKey found in the Security header')
 
     # Find each referenced encrypted block (each DataReference in the
-    # ReferenceList of the EncryptedKey) and decrypt it.
-    ref_list = enc_key.find(ns(ENC_NS, 'ReferenceList'))
+    # ReferenceList of the EncryptedKey) and decrypt it. The blocks are
+    # looked up in an index of the document's Ids, built with one scan.
+    ids = IdIndex(doc)
+    ref_list = enc_key.find(REFERENCE_LIST)
     for ref in ref_list:
         # Find the EncryptedData node referenced by this DataReference.
         ref_uri = ref.get('URI')
         referenced_id = ref_uri[1:]
-        enc_data = doc.xpath(
-            "//enc:EncryptedData[@Id='%s']" % referenced_id,
-            namespaces={'enc': ENC_NS},
-        )[0]
+        enc_data = ids.get(referenced_id, ENCRYPTED_DATA)
+        if enc_data is None:
+            # Nested in a block decrypted since the index was built
+            ids = IdIndex(doc)
+            enc_data = ids.get(referenced_id, ENCRYPTED_DATA)
+            if enc_data is None:
+                raise ValueError(f'No EncryptedData found for {ref_uri}')
 
         # XMLSec doesn't understand WSSE, therefore it doesn't understand
         # SecurityTokenReference. It expects to find EncryptedKey within the
         # KeyInfo of the EncryptedData. So we get rid of the
         # SecurityTokenReference and replace it with the EncryptedKey before
         # trying to decrypt.
-        key_info = enc_data.find(ns(DS_NS, 'KeyInfo'))
-        key_info.remove(key_info[0])
+        # (``encrypt`` removes the KeyInfo altogether, so recreate it if needed.)
+        key_info = xmlsec.template.encrypted_data_ensure_key_info(enc_data)
+        for child in list(key_info):
+            key_info.remove(child)
         key_info.append(enc_key)
 
         # When XMLSec decrypts, it automatically replaces the EncryptedData
         # node with the decrypted contents.
-        ctx = xmlsec.EncryptionContext(manager)
+        ctx = key.encryption_context()
         ctx.decrypt(enc_data)
 
-    return etree.tostring(doc)
+    return doc
 
 
 def add_data_reference(enc_key, enc_data):
@@ -269,11 +308,8 @@ def create_binary_security_token(certfile):
     node.set('EncodingType', BASE64B)
     node.set('ValueType', X509TOKEN)
 
-    # Set the node contents.
-    with open(certfile) as fh:
-        cert = crypto.load_certificate(crypto.FILETYPE_PEM, fh.read())
-        node.text = base64.b64encode(
-            crypto.dump_certificate(crypto.FILETYPE_ASN1, cert))
+    # Set the node contents (the base64 DER is computed once per cert).
+    node.text = get_certificate(certfile).bst_text
 
     return node
 
@@ -0,0 +1,301 @@
+"""
+Sampled capture of request/response XML for debugging.
+
+Capturing full envelopes is expensive (serialization, pretty-printing and I/O
+proportional to the message size), so it is off unless a request asks for it
+with ``?debug=true`` (download endpoints only, and only with
+``DEBUG_CAPTURE_REQUEST_FLAG=1``) or is picked by
+``DEBUG_CAPTURE_SAMPLE_RATE``. Captures are logged at DEBUG to the
+``app.debug_capture`` logger, whose level (``DEBUG_CAPTURE_LEVEL``) switches
+them off entirely. Records go through a queue: the request thread only takes
+a compact snapshot of the element, and pretty-printing and writing happen on
+a listener thread. Captures are written to ``DEBUG_CAPTURE_FILE``, or stderr;
+the queue holds at most ``DEBUG_CAPTURE_QUEUE_SIZE`` captures and
+``DEBUG_CAPTURE_QUEUE_BYTES`` of serialized XML, and drops further captures.
+
+``WSSE_DEBUG=1`` (the former debug switch) captures every request.
+
+The XML returned in a download response's ``debug`` field can be produced
+piece by piece (iter_pretty), so a large envelope is streamed into the
+response instead of being held as one string.
+"""
+import copy
+import itertools
+import logging
+import os
+import queue
+import random
+from contextvars import ContextVar
+
+from lxml import etree
+
+from app.constants import WSSE_DEBUG
+from app.logging_config import QueueLogHandler
+from app.serialization import StreamedText
+
+# Fraction of requests captured without asking (0.0 - 1.0)
+DEBUG_CAPTURE_SAMPLE_RATE = float(os.getenv('DEBUG_CAPTURE_SAMPLE_RATE', '1' if WSSE_DEBUG else '0'))
+# Set to 1 to capture download requests that ask with ?debug=true (the
+# unauthenticated ProviderResponseService callback endpoint never honors it)
+DEBUG_CAPTURE_REQUEST_FLAG = os.getenv('DEBUG_CAPTURE_REQUEST_FLAG', '0') == '1'
+# Captures are logged at DEBUG; set to INFO or above to disable them
+DEBUG_CAPTURE_LEVEL = os.getenv('DEBUG_CAPTURE_LEVEL', 'DEBUG').upper()
+# Where captures are written (default: stderr)
+DEBUG_CAPTURE_FILE = os.getenv('DEBUG_CAPTURE_FILE')
+# Captures queued for writing at most; further captures are dropped
+DEBUG_CAPTURE_QUEUE_SIZE = int(os.getenv('DEBUG_CAPTURE_QUEUE_SIZE', '1000'))
+# Bytes of serialized XML queued for writing at most; further captures are dropped
+DEBUG_CAPTURE_QUEUE_BYTES = int(os.getenv('DEBUG_CAPTURE_QUEUE_BYTES', str(64 * 1024 * 1024)))
+
+# Levels of the envelope below which iter_pretty writes each subtree in one piece
+DEBUG_STREAM_DEPTH = 4
+# Characters of XML collected before iter_pretty yields them
+DEBUG_STREAM_CHUNK_SIZE = 16384
+# Elements from which iter_pretty streams the XML; smaller elements are
+# pretty-printed in one piece, which is several times faster
+DEBUG_STREAM_MIN_ELEMENTS = 20000
+INDENT = '  '
+
+capture_logger = logging.getLogger(__name__)
+capture_logger.setLevel(DEBUG_CAPTURE_LEVEL)
+capture_logger.propagate = False
+
+_capturing = ContextVar('debug_capture', default=None)
+
+
+class PrettyXml:
+    """A serialized element, pretty-printed only when formatted."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, element):
+        self.data = etree.tostring(element)
+
+    def __str__(self):
+        parser = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+        return etree.tostring(etree.fromstring(self.data, parser), encoding='unicode', pretty_print=True)
+
+
+def _snapshot_bytes(record):
+    """The bytes of serialized XML a capture record holds."""
+    return sum(len(arg.data) for arg in record.args or () if isinstance(arg, PrettyXml))
+
+
+class _SnapshotQueue(queue.Queue):
+    """A queue that also refuses records once it holds ``maxbytes`` of XML."""
+
+    def __init__(self, maxsize=0, maxbytes=DEBUG_CAPTURE_QUEUE_BYTES):
+        super().__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.bytes = 0
+
+    def put(self, item, block=True, timeout=None):
+        size = _snapshot_bytes(item) if isinstance(item, logging.LogRecord) else 0
+        with self.mutex:
+            if size and self.bytes + size > self.maxbytes:
+                raise queue.Full
+            self.bytes += size
+        try:
+            super().put(item, block, timeout)
+        except queue.Full:
+            with self.mutex:
+                self.bytes -= size
+            raise
+
+    def _get(self):
+        item = super()._get()
+        if isinstance(item, logging.LogRecord):
+            self.bytes -= _snapshot_bytes(item)
+        return item
+
+
+class _SnapshotQueueHandler(QueueLogHandler):
+    """Queue records without formatting them, so PrettyXml is rendered by the listener."""
+
+    def _new_queue(self, maxsize):
+        return _SnapshotQueue(maxsize)
+
+    def prepare(self, record):
+        return record
+
+
+def _install_handler():
+    if DEBUG_CAPTURE_FILE:
+        handler = logging.FileHandler(DEBUG_CAPTURE_FILE, delay=True)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(message)s'))
+    capture_logger.addHandler(_SnapshotQueueHandler([handler], DEBUG_CAPTURE_QUEUE_SIZE))
+
+
+_install_handler()
+
+
+def start(requested=False):
+    """
+    Decide whether the current request is captured.
+
+    Args:
+        requested: Whether the request asked for capture (``debug=true``)
+
+    Returns:
+        True if the request's XML is captured
+    """
+    capturing = capture_logger.isEnabledFor(logging.DEBUG) and (
+        (requested and DEBUG_CAPTURE_REQUEST_FLAG)
+        or (DEBUG_CAPTURE_SAMPLE_RATE > 0 and random.random() < DEBUG_CAPTURE_SAMPLE_RATE))
+    _capturing.set(capturing)
+    return capturing
+
+
+def is_flag_set(value):
+    """Interpret a ``debug`` query parameter."""
+    return (value or '').lower() in ('1', 'true', 'yes')
+
+
+def active():
+    """Whether the current request is captured (outside a request: only with a sample rate of 1)."""
+    capturing = _capturing.get()
+    if capturing is None:
+        return DEBUG_CAPTURE_SAMPLE_RATE >= 1 and capture_logger.isEnabledFor(logging.DEBUG)
+    return capturing
+
+
+def capture(label, element, **context):
+    """
+    Capture an element of the current request, if it is being captured.
+
+    Args:
+        label: What the element is, e.g. 'encrypted request'
+        element: An lxml Element; serialized now, pretty-printed later
+        **context: Extra values to log with it (e.g. HTTP headers)
+    """
+    if not active() or element is None:
+        return
+    capture_logger.debug('%s%s\n%s', label, f' {context}' if context else '', PrettyXml(element))
+
+
+def pretty(element):
+    """Pretty-print an element for a response's debug field."""
+    return etree.tostring(element, encoding='unicode', pretty_print=True)
+
+
+def _declaration(prefix, uri):
+    """A namespace declaration the way lxml serializes it."""
+    uri = uri.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+    return f' xmlns="{uri}"' if prefix is None else f' xmlns:{prefix}="{uri}"'
+
+
+def _drop_declarations(xml, declared):
+    """Remove the declarations in ``declared`` (made by an ancestor) from the start tag of serialized XML."""
+    head_end = xml.index('>')
+    head = xml[:head_end]
+    if ' xmlns' not in head:
+        return xml
+    for declaration in declared:
+        head = head.replace(declaration, '', 1)
+    return head + xml[head_end:]
+
+
+def _tags(elem, declared):
+    """The start and end tag of elem, without the namespace declarations in ``declared``."""
+    shallow = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+    shallow.text = ''
+    xml = _drop_declarations(etree.tostring(shallow, encoding='unicode'), declared)
+    end = xml.rindex('</')
+    return xml[:end], xml[end:]
+
+
+def _element_only(elem):
+    """Whether an element has child elements and no text between them."""
+    return (len(elem) > 0 and not (elem.text and elem.text.strip())
+            and not any(child.tail and child.tail.strip() for child in elem))
+
+
+def _piece(elem, level, declared):
+    """The XML of the subtree elem, indented to level."""
+    if not isinstance(elem.tag, str):
+        return etree.tostring(elem, encoding='unicode', with_tail=False)
+    if len(elem):
+        elem = copy.deepcopy(elem)
+        etree.indent(elem, INDENT, level=level)
+    return _drop_declarations(etree.tostring(elem, encoding='unicode', with_tail=False), declared)
+
+
+def _pieces(elem, level, depth, declared):
+    """Yield the XML of elem indented to level: tag by tag above depth, else in one piece."""
+    if not (level < depth and isinstance(elem.tag, str) and _element_only(elem)):
+        yield _piece(elem, level, declared)
+        return
+    start, end = _tags(elem, declared)
+    yield start
+    # The namespaces in scope in elem's children
+    declared = [_declaration(prefix, uri) for prefix, uri in elem.nsmap.items()]
+    indent = '\n' + INDENT * (level + 1)
+    for child in elem:
+        if level + 1 < depth and isinstance(child.tag, str) and _element_only(child):
+            yield indent
+            yield from _pieces(child, level + 1, depth, declared)
+        else:
+            yield indent + _piece(child, level + 1, declared)
+    yield '\n' + INDENT * level + end
+
+
+def iter_pretty(element, depth=DEBUG_STREAM_DEPTH, min_elements=DEBUG_STREAM_MIN_ELEMENTS):
+    """
+    Pretty-print an element piece by piece.
+
+    An element with fewer than ``min_elements`` elements is pretty-printed in
+    one piece. Otherwise the elements of the top ``depth`` levels are written
+    tag by tag and every subtree below them in one piece, each declaring only
+    the namespaces not declared above it; the text is handed out about every
+    DEBUG_STREAM_CHUNK_SIZE characters. Either way the text is that of
+    pretty() (for elements without whitespace between their children).
+
+    Args:
+        element: An lxml Element
+        depth: The number of levels written tag by tag
+        min_elements: The number of elements from which the XML is streamed
+
+    Yields:
+        str chunks of the pretty-printed XML
+    """
+    if sum(1 for _ in itertools.islice(element.iter(), min_elements)) < min_elements:
+        yield pretty(element)
+        return
+    parts = []
+    size = 0
+    for piece in _pieces(element, 0, depth, ()):
+        parts.append(piece)
+        size += len(piece)
+        if size >= DEBUG_STREAM_CHUNK_SIZE:
+            yield ''.join(parts)
+            parts.clear()
+            size = 0
+    parts.append('\n')
+    yield ''.join(parts)
+
+
+def history_debug_info(history, streamed=False):
+    """
+    Return the debug field of a download response.
+
+    Args:
+        history: The RequestHistoryPlugin of the request's client
+        streamed: Return the XML as serialization.StreamedText values,
+                  pretty-printed while the response is written
+
+    Returns:
+        A dict with request_xml and response_xml if the request is captured,
+        else an empty dict
+    """
+    debug_info = {}
+    if not active():
+        return debug_info
+    for hist_type, hist in [('request', history.last_sent), ('response', history.last_received)]:
+        if hist and 'envelope' in hist:
+            if streamed:
+                debug_info[f'{hist_type}_xml'] = StreamedText(iter_pretty(hist['envelope']))
+            else:
+                debug_info[f'{hist_type}_xml'] = pretty(hist['envelope'])
+    return debug_info
@@ -0,0 +1,215 @@
+"""
+Pre-rendered envelopes for outbound IDXConsumerSubmitMessage requests.
+
+zeep renders every request by validating and walking its object tree
+(SecureXHeader, IDXConsumerSubmitMessage, ArrayOfEntity, Entity). Instead, a
+client renders the Submit envelope once, with marker values, when it is
+created; the result is the skeleton (header, empty wsse:Security, body) plus
+the position and XSD type of each leaf value, and an Entity element to copy
+per PhysicalEntity. A request is then a deep copy of the skeleton with the
+leaf texts filled in, handed to zeep's Submit in place of the body, so the
+plugins (encryption, history), signing and transport run as before.
+
+The template is checked against zeep's own rendering when it is built and is
+not used if they differ. Payloads with null values also go through zeep.
+Set ``COMCORP_ENVELOPE_TEMPLATES=0`` to always render with zeep.
+"""
+import copy
+import logging
+import os
+
+from zeep.wsdl.utils import etree_to_string
+from zeep.wsdl.messages.base import SerializedMessage
+from zeep.wsse.utils import get_security_header
+
+from app.object_service import BODY_FIELDS, ENTITY_FIELDS, HEADER_VALUES, getHeader, getDecryptedBody
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to render every request with zeep
+ENVELOPE_TEMPLATES = os.getenv('COMCORP_ENVELOPE_TEMPLATES', '1') == '1'
+
+OPERATION = 'Submit'
+MARKER = '@@template:%s@@'
+SAMPLE_PAYLOAD = {
+    'AccountNumber': '1234567890', 'AccountType': 'Current', 'BranchCode': '250655',
+    'DateFrom': '2024-01-01', 'DateTo': '2024-03-31', 'EmailAddress': 'a@example.com',
+    'JointAccount': 'N',
+    'PhysicalEntities': [
+        {'IdentificationNo': '8001015009087', 'IdentificationType': 'SAID', 'Initials': 'J', 'Name': 'Doe'},
+        {'IdentificationNo': '8202025009088', 'IdentificationType': 'SAID', 'Name': 'Roe'},
+    ],
+}
+
+
+class PrerenderedMessage:
+    """A request rendered from a template, passed to Submit in place of the body."""
+
+    __slots__ = ('serialized',)
+
+    def __init__(self, serialized):
+        self.serialized = serialized
+
+
+def _path(root, elem):
+    """The child indices leading from root to elem."""
+    path = []
+    while elem is not root:
+        parent = elem.getparent()
+        path.append(parent.index(elem))
+        elem = parent
+    return tuple(reversed(path))
+
+
+def _at(root, path):
+    for index in path:
+        root = root[index]
+    return root
+
+
+def _leaves(root, names, xsd_types):
+    """Find the marker leaves of the given fields under root: (name, path, xsd type)."""
+    positions = {elem.text: elem for elem in root.iter() if elem.text and elem.text.startswith('@@template:')}
+    return tuple((name, _path(root, positions[MARKER % name]), xsd_types[name]) for name in names)
+
+
+def _element_types(xsd_type):
+    return {name: element.type for name, element in xsd_type.elements}
+
+
+class EnvelopeTemplate:
+    """
+    The pre-rendered Submit envelope of a client.
+
+    Args:
+        soap: The zeep Client (or AsyncClient)
+        binding: The binding the client's service calls
+    """
+
+    def __init__(self, soap, binding):
+        self.operation = binding.get(OPERATION)
+        marked = dict({name: MARKER % name for name in BODY_FIELDS},
+                      PhysicalEntities=[{name: MARKER % name for name in ENTITY_FIELDS}])
+        header = getHeader(soap)
+        header_type = header._xsd_type
+        for name in HEADER_VALUES:
+            header[name] = MARKER % name
+        body = getDecryptedBody(soap, marked)
+
+        serialized = self.operation.input.serialize(body, _soapheaders={'Header': header})
+        envelope = serialized.content
+        get_security_header(envelope)
+        self.headers = serialized.headers
+
+        body_type = body._xsd_type
+        self.header_leaves = _leaves(envelope, HEADER_VALUES, _element_types(header_type))
+        self.body_leaves = _leaves(envelope, BODY_FIELDS, _element_types(body_type))
+
+        entity = next(elem for elem in envelope.iter() if elem.text == MARKER % ENTITY_FIELDS[0]).getparent()
+        array = entity.getparent()
+        entity_type = body.PhysicalEntities.Entity[0]._xsd_type
+        self.entity_leaves = _leaves(entity, ENTITY_FIELDS, _element_types(entity_type))
+        array.remove(entity)
+        self.entity = entity
+        self.array_path = _path(envelope, array)
+        self.skeleton = envelope
+
+    def render(self, payload, header):
+        """
+        Render a request.
+
+        Args:
+            payload: The download request parameters
+            header: The SecureXHeader object (see object_service.getHeader)
+
+        Returns:
+            A PrerenderedMessage, or None if the payload has null values (which
+            zeep leaves out), so it must be rendered by zeep
+        """
+        values = [payload.get(name, '') for name in BODY_FIELDS]
+        entities = [[entity.get(name, '') for name in ENTITY_FIELDS]
+                    for entity in payload.get('PhysicalEntities') or []]
+        if None in values or any(None in entity for entity in entities):
+            return None
+
+        envelope = copy.deepcopy(self.skeleton)
+        for name, path, xsd_type in self.header_leaves:
+            _at(envelope, path).text = xsd_type.xmlvalue(header[name])
+        for (name, path, xsd_type), value in zip(self.body_leaves, values):
+            _at(envelope, path).text = xsd_type.xmlvalue(value)
+        array = _at(envelope, self.array_path)
+        for entity_values in entities:
+            entity = copy.deepcopy(self.entity)
+            for (name, path, xsd_type), value in zip(self.entity_leaves, entity_values):
+                _at(entity, path).text = xsd_type.xmlvalue(value)
+            array.append(entity)
+        return PrerenderedMessage(SerializedMessage(path=None, headers=dict(self.headers), content=envelope))
+
+    def matches_zeep(self, soap, payload=SAMPLE_PAYLOAD):
+        """Whether a payload renders exactly as zeep renders it."""
+        header = getHeader(soap)
+        expected = self.operation.input.serialize(
+            getDecryptedBody(soap, payload), _soapheaders={'Header': header}).content
+        get_security_header(expected)
+        return etree_to_string(expected) == etree_to_string(self.render(payload, header).serialized.content)
+
+
+def install(soap, binding):
+    """
+    Build the Submit template of a client and let its operation accept
+    PrerenderedMessages.
+
+    Args:
+        soap: The zeep Client (or AsyncClient)
+        binding: The binding the client's service calls
+
+    Returns:
+        The EnvelopeTemplate, or None if templates are disabled or the
+        template does not render as zeep does
+    """
+    if not ENVELOPE_TEMPLATES:
+        return None
+    try:
+        template = EnvelopeTemplate(soap, binding)
+        if not template.matches_zeep(soap):
+            logger.warning("Envelope template differs from the zeep rendering; not using it")
+            return None
+    except Exception as e:
+        logger.warning(f"Could not build the envelope template: {str(e)}")
+        return None
+
+    operation = template.operation
+    if not getattr(operation, 'accepts_prerendered', False):
+        create = operation.create
+
+        def create_prerendered(*args, **kwargs):
+            if args and isinstance(args[0], PrerenderedMessage):
+                return args[0].serialized
+            return create(*args, **kwargs)
+
+        operation.create = create_prerendered
+        operation.accepts_prerendered = True
+    return template
+
+
+def submit_arguments(client, payload, header=None):
+    """
+    Build the arguments of a Submit call.
+
+    Args:
+        client: The PooledClient
+        payload: The download request parameters
+        header: A SecureXHeader built by getHeader; built here if not given
+
+    Returns:
+        A tuple (args, kwargs): a PrerenderedMessage if the client has a
+        template for the payload, the zeep body and header otherwise
+    """
+    soap = client.soap
+    if header is None:
+        header = getHeader(soap)
+    if client.template is not None:
+        message = client.template.render(payload, header)
+        if message is not None:
+            return (message,), {}
+    return (getDecryptedBody(soap, payload),), {'_soapheaders': {'Header': header}}
@@ -0,0 +1,29 @@
+"""
+Gunicorn logger class writing access.log and error.log from a thread.
+
+Gunicorn's own logger writes every access and error record synchronously
+from the worker; this one moves the handlers it sets up behind queues (see
+app.logging_config). Enabled in config/gunicorn_config.py with
+``logger_class = 'app.gunicorn_logging.QueuedLogger'``.
+"""
+from gunicorn import glogging, util
+
+from app.logging_config import file_handlers, queue_handlers, reopen_files
+
+
+class QueuedLogger(glogging.Logger):
+
+    def setup(self, cfg):
+        super().setup(cfg)
+        queue_handlers(self.error_log)
+        queue_handlers(self.access_log)
+
+    def reopen_files(self):
+        super().reopen_files()
+        reopen_files()
+
+    def close_on_exec(self):
+        super().close_on_exec()
+        for handler in file_handlers():
+            if handler.stream:
+                util.close_on_exec(handler.stream.fileno())
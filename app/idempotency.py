@@ -0,0 +1,290 @@
+"""
+Duplicate detection for ProviderResponseService callbacks.
+
+Comcorp retries a callback until it gets an ack, so the same message can
+arrive several times. A callback is identified by the references in its
+SecureX Header (ExchangeReference, ProviderReference, ConsumerReference), the
+QName of the message in its SOAP Body and a SHA-256 digest of the raw bytes
+from the Body on, so a message that reuses the references of another is not
+taken for it. The key is read from the raw envelope with an incremental parse
+that stops at the message (key_from_bytes), or, for a request parsed from its
+stream, from the parsed Header and a BodyDigestReader over the stream.
+
+Callers look a callback up only once its security header has been verified.
+Once a callback has been processed successfully its key is remembered in a
+bounded LRU in the worker and in a SQLite database (WAL mode) shared by the
+workers on the host; a duplicate gets the same ack without its body being
+decrypted or handled again.
+
+Only successful outcomes are remembered, so a callback that failed is
+processed again when it is retried. Lookups are counted in
+``comcorp_idempotency_lookups_total`` on /metrics.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from lxml import etree
+
+from app.constants import SECUREX_NS
+from app.metrics import IDEMPOTENCY_LOOKUPS
+from app.xpaths import BODY
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to process every callback, duplicates included
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', '1') == '1'
+IDEMPOTENCY_DB = os.getenv('IDEMPOTENCY_DB', 'idempotency.sqlite3')
+# Keys remembered in memory per worker
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# Seconds a processed callback is remembered
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', str(7 * 24 * 3600)))
+
+MEMORY_HIT = 'memory_hit'
+STORE_HIT = 'store_hit'
+MISS = 'miss'
+
+SECUREX_HEADER_TAG = f"{{{SECUREX_NS}}}Header"
+REFERENCE_TAGS = {
+    f"{{{SECUREX_NS}}}ExchangeReference": 0,
+    f"{{{SECUREX_NS}}}ProviderReference": 1,
+    f"{{{SECUREX_NS}}}ConsumerReference": 2,
+}
+
+# The start tag of the SOAP Body in the raw envelope; the digest covers the
+# bytes from there to the end (a Body-like tag earlier in the Header only
+# makes the digest cover more)
+BODY_START = re.compile(rb'<(?:[\w.-]{1,64}:)?Body[\s/>]')
+# Bytes kept between reads to find a Body start tag split across them
+BODY_START_MAX = 72
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    key TEXT PRIMARY KEY,
+    success INTEGER NOT NULL,
+    processed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_at ON processed (processed_at);
+"""
+# Records between deletions of expired keys
+PRUNE_EVERY = 1000
+
+
+class LRUCache:
+    """A thread-safe, size-bounded mapping of key to (success, processed_at)."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_cache = LRUCache(IDEMPOTENCY_CACHE_SIZE)
+_local = threading.local()
+_records = 0
+
+
+def get_connection(path=None):
+    """Return this thread's connection to the idempotency database (per process)."""
+    path = path or IDEMPOTENCY_DB
+    key = (os.getpid(), path)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(key)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        connections[key] = connection
+    return connection
+
+
+def _key(references, message_tag, digest):
+    if not any(references):
+        return None
+    return '|'.join([reference or '' for reference in references] + [message_tag or '', digest or ''])
+
+
+def body_digest(content):
+    """The hex SHA-256 of ``content`` from the SOAP Body start tag on, or None."""
+    match = BODY_START.search(content)
+    if match is None:
+        return None
+    return hashlib.sha256(memoryview(content)[match.start():]).hexdigest()
+
+
+class BodyDigestReader:
+    """
+    A file-like wrapper that computes body_digest of a stream as it is read.
+
+    Args:
+        stream: The wrapped file-like object (e.g. the WSGI input stream)
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._hash = hashlib.sha256()
+        self._pending = b''
+        self._in_body = False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if self._in_body:
+            self._hash.update(data)
+        elif data:
+            pending = self._pending + data
+            match = BODY_START.search(pending)
+            if match is None:
+                self._pending = pending[-BODY_START_MAX:]
+            else:
+                self._in_body = True
+                self._pending = b''
+                self._hash.update(memoryview(pending)[match.start():])
+        return data
+
+    def hexdigest(self):
+        """The digest of the bytes read so far from the Body on, or None before the Body."""
+        return self._hash.hexdigest() if self._in_body else None
+
+
+def key_from_bytes(content):
+    """
+    Read the idempotency key of a raw callback without parsing its message.
+
+    Args:
+        content: The raw SOAP envelope bytes
+
+    Returns:
+        The key, or None if the envelope has no SecureX references (or is
+        not well-formed up to the Body)
+    """
+    references = [None, None, None]
+    message_tag = None
+    body = None
+    context = etree.iterparse(io.BytesIO(content), events=('start', 'end'), huge_tree=True,
+                              resolve_entities=False, no_network=True)
+    try:
+        for event, elem in context:
+            if event == 'start':
+                if elem.tag == BODY:
+                    body = elem
+                elif body is not None and elem.getparent() is body:
+                    message_tag = elem.tag
+                    break
+                continue
+            if body is not None:
+                # An empty Body
+                break
+            index = REFERENCE_TAGS.get(elem.tag)
+            if index is not None and references[index] is None and elem.getparent().tag == SECUREX_HEADER_TAG:
+                references[index] = (elem.text or '').strip()
+    except etree.XMLSyntaxError:
+        return None
+    return _key(references, message_tag, body_digest(content))
+
+
+def key_from_record(record, digest):
+    """
+    Return the idempotency key of a parsed envelope.
+
+    Args:
+        record: The EnvelopeRecord of the envelope (app.message_extract)
+        digest: The body_digest of the raw envelope (BodyDigestReader.hexdigest)
+
+    Returns:
+        The key, or None
+    """
+    if record.securex_header is None:
+        return None
+    references = [None, None, None]
+    for child in record.securex_header:
+        index = REFERENCE_TAGS.get(child.tag)
+        if index is not None and references[index] is None:
+            references[index] = (child.text or '').strip()
+    message_tag = record.message.tag if record.message is not None else None
+    return _key(references, message_tag, digest)
+
+
+def lookup(key, path=None):
+    """
+    Return the remembered ack of a processed callback.
+
+    Args:
+        key: The idempotency key (None is never found)
+        path: The database (default: IDEMPOTENCY_DB)
+
+    Returns:
+        The remembered success value, or None if the callback is new
+    """
+    if not IDEMPOTENCY_ENABLED or key is None:
+        return None
+    now = time.time()
+    cached = _cache.get(key)
+    if cached is not None and now - cached[1] < IDEMPOTENCY_TTL:
+        IDEMPOTENCY_LOOKUPS.labels(MEMORY_HIT).inc()
+        return cached[0]
+
+    try:
+        row = get_connection(path).execute(
+            "SELECT success, processed_at FROM processed WHERE key = ? AND processed_at > ?",
+            (key, now - IDEMPOTENCY_TTL),
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Idempotency lookup failed: {str(e)}")
+        row = None
+    if row is None:
+        IDEMPOTENCY_LOOKUPS.labels(MISS).inc()
+        return None
+    success, processed_at = bool(row[0]), row[1]
+    _cache.put(key, (success, processed_at))
+    IDEMPOTENCY_LOOKUPS.labels(STORE_HIT).inc()
+    return success
+
+
+def record(key, success, path=None):
+    """
+    Remember the outcome of a processed callback; failures are not remembered.
+
+    Args:
+        key: The idempotency key (None is ignored)
+        success: The ack sent for the callback
+        path: The database (default: IDEMPOTENCY_DB)
+    """
+    global _records
+    if not IDEMPOTENCY_ENABLED or key is None or not success:
+        return
+    now = time.time()
+    _cache.put(key, (True, now))
+    try:
+        connection = get_connection(path)
+        connection.execute(
+            "INSERT OR REPLACE INTO processed (key, success, processed_at) VALUES (?, ?, ?)",
+            (key, 1, now),
+        )
+        _records += 1
+        if _records % PRUNE_EVERY == 0:
+            connection.execute("DELETE FROM processed WHERE processed_at <= ?", (now - IDEMPOTENCY_TTL,))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not record processed callback: {str(e)}")
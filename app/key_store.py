@@ -0,0 +1,136 @@
+"""
+Process-wide registry of certificate and key material for crypto_wsse.
+
+Certificates and private keys are read and parsed once per process. The
+BinarySecurityToken text for a certificate is precomputed at load time, and
+callers get a fresh xmlsec context per message from the shared KeysManager.
+Files are re-read when their mtime changes, so a rotated certificate is picked
+up without restarting the workers.
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+
+from OpenSSL import crypto
+import xmlsec
+
+# Minimum number of seconds between mtime checks of a loaded file
+KEY_RELOAD_CHECK_INTERVAL = float(os.getenv('KEY_RELOAD_CHECK_INTERVAL', '5'))
+
+
+class CertificateMaterial:
+    """
+    A loaded X509 certificate.
+
+    Attributes:
+        path: The certificate file
+        key: The xmlsec.Key holding the certificate
+        manager: An xmlsec.KeysManager containing ``key``
+        bst_text: Base64 DER of the certificate, for a BinarySecurityToken
+        fingerprint: SHA-256 hex digest of the DER certificate
+    """
+
+    def __init__(self, path, data):
+        self.path = path
+        self.key = xmlsec.Key.from_memory(data, xmlsec.KeyFormat.CERT_PEM, None)
+        self.manager = xmlsec.KeysManager()
+        self.manager.add_key(self.key)
+        cert = crypto.load_certificate(crypto.FILETYPE_PEM, data)
+        der = crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)
+        self.bst_text = base64.b64encode(der).decode('ascii')
+        self.fingerprint = hashlib.sha256(der).hexdigest()
+
+    def encryption_context(self):
+        """Return a new EncryptionContext for encrypting to this certificate."""
+        return xmlsec.EncryptionContext(self.manager)
+
+
+class PrivateKeyMaterial:
+    """
+    A loaded PEM private key.
+
+    Attributes:
+        path: The key file
+        key: The xmlsec.Key holding the private key
+        manager: An xmlsec.KeysManager containing ``key``
+    """
+
+    def __init__(self, path, data):
+        self.path = path
+        self.key = xmlsec.Key.from_memory(data, xmlsec.KeyFormat.PEM, None)
+        self.manager = xmlsec.KeysManager()
+        self.manager.add_key(self.key)
+
+    def encryption_context(self):
+        """Return a new EncryptionContext for decrypting with this key."""
+        return xmlsec.EncryptionContext(self.manager)
+
+
+class _Entry:
+    __slots__ = ('material', 'mtime', 'checked')
+
+    def __init__(self, material, mtime, checked):
+        self.material = material
+        self.mtime = mtime
+        self.checked = checked
+
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def _get(kind, path):
+    key = (kind, os.path.abspath(path))
+    entry = _entries.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked < KEY_RELOAD_CHECK_INTERVAL:
+        return entry.material
+
+    mtime = os.stat(path).st_mtime_ns
+    if entry is not None and entry.mtime == mtime:
+        entry.checked = now
+        return entry.material
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.mtime == mtime:
+            entry.checked = now
+            return entry.material
+        with open(path, 'rb') as fh:
+            material = kind(path, fh.read())
+        _entries[key] = _Entry(material, mtime, now)
+        return material
+
+
+def get_certificate(certfile):
+    """
+    Return the CertificateMaterial for ``certfile``, loading it if needed.
+
+    Args:
+        certfile: Path to a PEM encoded X509 certificate
+
+    Returns:
+        A CertificateMaterial
+    """
+    return _get(CertificateMaterial, certfile)
+
+
+def get_private_key(keyfile):
+    """
+    Return the PrivateKeyMaterial for ``keyfile``, loading it if needed.
+
+    Args:
+        keyfile: Path to a PEM encoded private key
+
+    Returns:
+        A PrivateKeyMaterial
+    """
+    return _get(PrivateKeyMaterial, keyfile)
+
+
+def clear():
+    """Forget all loaded material, forcing the next lookup to read the files."""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,226 @@
+"""
+Central logging configuration: records are queued, and written by a thread.
+
+Every module logs through ``logging.getLogger(__name__)``; configure_logging
+gives the root logger a QueueHandler, so a request thread only formats the
+message and puts it on a bounded queue, and a QueueListener thread does the
+(possibly slow) writing. A full queue drops records instead of blocking.
+Gunicorn workers are forked, so the handler starts its listener in every
+process on first use.
+
+Large XML must not be serialized whole into the log: use preview(), which
+renders at most ``LOG_PREVIEW_BYTES`` characters of an element, and only if
+the record is actually emitted.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import weakref
+
+from lxml import etree
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Where the application log is written (default: stderr)
+LOG_FILE = os.getenv('LOG_FILE')
+# Records queued for writing at most; further records are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Characters of an XML element rendered by preview()
+LOG_PREVIEW_BYTES = int(os.getenv('LOG_PREVIEW_BYTES', '256'))
+
+_queue_handlers = weakref.WeakSet()
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    A non-blocking QueueHandler that writes through its own QueueListener.
+
+    Args:
+        handlers: The handlers the listener writes records to
+        maxsize: The queue size; records are dropped when it is full
+    """
+
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(self._new_queue(maxsize))
+        self.targets = list(handlers)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._queue_pid = os.getpid()
+        self._lock = threading.Lock()
+        _queue_handlers.add(self)
+
+    def _new_queue(self, maxsize):
+        return queue.Queue(maxsize)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._queue_pid != os.getpid():
+                # A forked worker inherits the queue (and whatever the parent
+                # had not written yet) but not the listener thread
+                self.queue = self._new_queue(self.queue.maxsize)
+                self._queue_pid = os.getpid()
+            self._listener = logging.handlers.QueueListener(
+                self.queue, *self.targets, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f'{dropped} log records dropped (queue full)'}))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Stop the listener after writing the queued records (restarted on next use)."""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self._listener = None
+                self._pid = None
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def reopen(self):
+        """Reopen the listener's log files (after rotation)."""
+        for handler in self.targets:
+            if isinstance(handler, logging.FileHandler):
+                handler.acquire()
+                try:
+                    if handler.stream:
+                        handler.close()
+                        handler.stream = handler._open()
+                finally:
+                    handler.release()
+
+
+def _after_fork_in_child():
+    for handler in list(_queue_handlers):
+        handler._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def queue_handlers(logger):
+    """
+    Move a logger's handlers behind a QueueLogHandler.
+
+    Args:
+        logger: The logger whose handlers should be written from a thread
+    """
+    handlers = [h for h in logger.handlers if not isinstance(h, QueueLogHandler)]
+    if not handlers:
+        return
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueLogHandler(handlers))
+
+
+def configure_logging(level=None, fmt=None):
+    """
+    Configure the root logger to write through a queue (once per process).
+
+    Args:
+        level: The log level (default LOG_LEVEL)
+        fmt: The log record format (default LOG_FORMAT)
+    """
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+    for existing in root.handlers:
+        if isinstance(existing, QueueLogHandler):
+            if fmt:
+                for target in existing.targets:
+                    target.setFormatter(logging.Formatter(fmt))
+            return
+    handler = logging.FileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt or LOG_FORMAT))
+    root.addHandler(QueueLogHandler([handler]))
+
+
+def flush():
+    """Write out every queued record of this process; call before a worker exits."""
+    for handler in list(_queue_handlers):
+        handler.flush()
+
+
+def reopen_files():
+    """Reopen the log files written by the queue listeners."""
+    for handler in list(_queue_handlers):
+        handler.reopen()
+
+
+def file_handlers():
+    """Return the FileHandlers the queue listeners write to."""
+    return [target for handler in list(_queue_handlers) for target in handler.targets
+            if isinstance(target, logging.FileHandler)]
+
+
+def _head(element, limit):
+    """Render the start of an element without serializing all of it."""
+    parts = []
+    size = 0
+    for event, elem in etree.iterwalk(element, events=('start', 'end')):
+        if not isinstance(elem.tag, str):
+            continue
+        name = etree.QName(elem).localname
+        if event == 'start':
+            piece = f'<{name}>{(elem.text or "")[:limit]}'
+        else:
+            tail = elem.tail if elem is not element else None
+            piece = f'</{name}>{(tail or "")[:limit]}'
+        parts.append(piece)
+        size += len(piece)
+        if size > limit:
+            return ''.join(parts)[:limit] + '...'
+    return ''.join(parts)
+
+
+class LogPreview:
+    """A size-capped rendering of an element (or text), made when formatted."""
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit or LOG_PREVIEW_BYTES
+
+    def __str__(self):
+        value = self.value
+        if value is None:
+            return 'None'
+        if isinstance(value, bytes):
+            value = value[:self.limit + 1].decode('utf-8', 'replace')
+        if isinstance(value, str):
+            return value if len(value) <= self.limit else value[:self.limit] + '...'
+        return _head(value, self.limit)
+
+
+def preview(value, limit=None):
+    """
+    Wrap a value for a log message, rendered only if the record is emitted.
+
+        logger.info("Data: %s", preview(record.data))
+
+    Args:
+        value: An lxml Element, str or bytes
+        limit: Characters to render at most (default LOG_PREVIEW_BYTES)
+
+    Returns:
+        A LogPreview
+    """
+    return LogPreview(value, limit)
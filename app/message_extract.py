@@ -0,0 +1,330 @@
+"""
+One-pass extraction of the fields ProviderResponseService handlers need.
+
+Each ``extract_*`` function walks the message subtree exactly once and fills a
+typed record, instead of running a separate ``.find(".//...")`` descendant
+search (each a full walk of the subtree) per field.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from lxml import etree
+
+from app.constants import (SOAP_NS, WSSE_NS, WSU_NS, DS_NS, ENC_NS,
+                           SECUREX_NS, AVX_NS, FICAX_NS, IDX_NS, IVX_NS)
+
+
+def _tag(namespace, localname):
+    return f"{{{namespace}}}{localname}"
+
+
+HEADER = _tag(SOAP_NS, 'Header')
+BODY = _tag(SOAP_NS, 'Body')
+SECUREX_HEADER = _tag(SECUREX_NS, 'Header')
+SECURITY = _tag(WSSE_NS, 'Security')
+TIMESTAMP = _tag(WSU_NS, 'Timestamp')
+CREATED = _tag(WSU_NS, 'Created')
+EXPIRES = _tag(WSU_NS, 'Expires')
+SIGNATURE = _tag(DS_NS, 'Signature')
+ENCRYPTED_DATA = _tag(ENC_NS, 'EncryptedData')
+SECUREX_DOCUMENT = _tag(SECUREX_NS, 'Document')
+SECUREX_CONTENT = _tag(SECUREX_NS, 'Content')
+
+
+@dataclass
+class EnvelopeRecord:
+    """The SOAP structure of a callback envelope."""
+    header: Optional[etree._Element] = None
+    securex_header: Optional[etree._Element] = None
+    security: Optional[etree._Element] = None
+    timestamp_created: Optional[str] = None
+    timestamp_expires: Optional[str] = None
+    has_timestamp: bool = False
+    signature: Optional[etree._Element] = None
+    body: Optional[etree._Element] = None
+    message: Optional[etree._Element] = None
+    encrypted_data: List[etree._Element] = field(default_factory=list)
+
+
+def extract_envelope(envelope):
+    """
+    Collect the Header, Security and Body parts of ``envelope``.
+
+    Only the Header, the Security header and the top level of the Body are
+    visited; the message content is never walked.
+
+    Args:
+        envelope: The SOAP envelope as an lxml Element
+
+    Returns:
+        An EnvelopeRecord
+    """
+    record = EnvelopeRecord()
+    for part in envelope:
+        if part.tag == HEADER and record.header is None:
+            record.header = part
+        elif part.tag == BODY and record.body is None:
+            record.body = part
+
+    if record.header is not None:
+        for child in record.header:
+            if child.tag == SECURITY and record.security is None:
+                record.security = child
+            elif child.tag == SECUREX_HEADER and record.securex_header is None:
+                record.securex_header = child
+            elif child.tag == ENCRYPTED_DATA:
+                record.encrypted_data.append(child)
+
+    if record.security is not None:
+        for elem in record.security.iter(TIMESTAMP, CREATED, EXPIRES, SIGNATURE, ENCRYPTED_DATA):
+            if elem.tag == TIMESTAMP:
+                record.has_timestamp = True
+            elif elem.tag == CREATED and record.timestamp_created is None:
+                record.timestamp_created = elem.text
+            elif elem.tag == EXPIRES and record.timestamp_expires is None:
+                record.timestamp_expires = elem.text
+            elif elem.tag == SIGNATURE and record.signature is None:
+                record.signature = elem
+            elif elem.tag == ENCRYPTED_DATA:
+                record.encrypted_data.append(elem)
+
+    if record.body is not None:
+        for child in record.body:
+            if not isinstance(child.tag, str):
+                continue
+            if record.message is None:
+                record.message = child
+            if child.tag == ENCRYPTED_DATA:
+                record.encrypted_data.append(child)
+
+    return record
+
+
+def _first(record, elem, fields):
+    """Set the field mapped to ``elem.tag`` unless an earlier element already set it."""
+    name = fields[elem.tag]
+    if getattr(record, name) is None:
+        setattr(record, name, elem)
+
+
+@dataclass
+class AvxRecord:
+    response_detail: Optional[etree._Element] = None
+    serialized_response: Optional[etree._Element] = None
+
+
+AVX_FIELDS = {
+    _tag(AVX_NS, 'AvxResponseDetail'): 'response_detail',
+    _tag(AVX_NS, 'SerializedAvxRespose'): 'serialized_response',
+}
+
+
+def extract_avx(message):
+    """Extract an AvXProviderSubmitMessage into an AvxRecord."""
+    record = AvxRecord()
+    for elem in message.iter(*AVX_FIELDS):
+        _first(record, elem, AVX_FIELDS)
+    return record
+
+
+@dataclass
+class FicaRecord:
+    data: Optional[etree._Element] = None
+    documents: Optional[etree._Element] = None
+    serialized_data: Optional[etree._Element] = None
+    serialized_elements: Optional[etree._Element] = None
+    # The base64 Content of each Document inside the first Documents element
+    document_contents: List[etree._Element] = field(default_factory=list)
+
+
+FICA_FIELDS = {
+    _tag(FICAX_NS, 'Data'): 'data',
+    _tag(FICAX_NS, 'Documents'): 'documents',
+    _tag(FICAX_NS, 'SerializedData'): 'serialized_data',
+    _tag(FICAX_NS, 'SerializedElements'): 'serialized_elements',
+}
+
+
+def extract_fica(message):
+    """Extract a FicaProviderSubmitMessage into a FicaRecord."""
+    record = FicaRecord()
+    for elem in message.iter(SECUREX_CONTENT, *FICA_FIELDS):
+        if elem.tag == SECUREX_CONTENT:
+            if elem.getparent().tag == SECUREX_DOCUMENT and _within(elem, record.documents):
+                record.document_contents.append(elem)
+        else:
+            _first(record, elem, FICA_FIELDS)
+    return record
+
+
+@dataclass
+class StatementRecord:
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    # None when the statement has no Transactions element
+    transaction_count: Optional[int] = None
+
+
+@dataclass
+class IdxRecord:
+    account_name: Optional[etree._Element] = None
+    account_number: Optional[etree._Element] = None
+    account_type: Optional[etree._Element] = None
+    data: Optional[etree._Element] = None
+    images: Optional[etree._Element] = None
+    statements: List[StatementRecord] = field(default_factory=list)
+    # None when the message has no Images element
+    image_count: Optional[int] = None
+    statement_images: List[etree._Element] = field(default_factory=list)
+
+
+IDX_FIELDS = {
+    _tag(IDX_NS, 'AccountName'): 'account_name',
+    _tag(IDX_NS, 'AccountNumber'): 'account_number',
+    _tag(IDX_NS, 'AccountType'): 'account_type',
+    _tag(IDX_NS, 'Data'): 'data',
+    _tag(IDX_NS, 'Images'): 'images',
+}
+IDX_STATEMENT_DATA = _tag(IDX_NS, 'StatementData')
+IDX_DATE_FROM = _tag(IDX_NS, 'DateFrom')
+IDX_DATE_TO = _tag(IDX_NS, 'DateTo')
+IDX_TRANSACTIONS = _tag(IDX_NS, 'Transactions')
+IDX_TRANSACTION = _tag(IDX_NS, 'Transaction')
+IDX_STATEMENT_IMAGE = _tag(IDX_NS, 'StatementImage')
+
+
+def extract_idx(message):
+    """
+    Extract an IDXProviderSubmitMessage into an IdxRecord.
+
+    Statements are the StatementData elements inside the first Data element;
+    transactions are counted inside the first Transactions element of each
+    statement, and images inside the first Images element.
+    """
+    record = IdxRecord()
+    statement = None
+    statement_elem = None
+    transactions_elem = None
+
+    for event, elem in etree.iterwalk(message, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'end':
+            if elem is statement_elem:
+                statement = statement_elem = transactions_elem = None
+            elif elem is transactions_elem:
+                transactions_elem = None
+            continue
+
+        if tag in IDX_FIELDS:
+            _first(record, elem, IDX_FIELDS)
+            if elem is record.images:
+                record.image_count = 0
+        if tag == IDX_STATEMENT_DATA and statement_elem is None and _within(elem, record.data):
+            statement = StatementRecord()
+            statement_elem = elem
+            record.statements.append(statement)
+        elif statement is not None:
+            if tag == IDX_DATE_FROM and statement.date_from is None:
+                statement.date_from = elem.text
+            elif tag == IDX_DATE_TO and statement.date_to is None:
+                statement.date_to = elem.text
+            elif tag == IDX_TRANSACTIONS and statement.transaction_count is None:
+                statement.transaction_count = 0
+                transactions_elem = elem
+            elif tag == IDX_TRANSACTION and transactions_elem is not None:
+                statement.transaction_count += 1
+        if tag == IDX_STATEMENT_IMAGE and _within(elem, record.images):
+            record.image_count += 1
+            record.statement_images.append(elem)
+
+    return record
+
+
+def _within(elem, ancestor):
+    """Whether ``ancestor`` (if any) is a proper ancestor of ``elem``."""
+    if ancestor is None:
+        return False
+    parent = elem.getparent()
+    while parent is not None:
+        if parent is ancestor:
+            return True
+        parent = parent.getparent()
+    return False
+
+
+@dataclass
+class PayslipRecord:
+    timestamp: Optional[str] = None
+    # None when the payslip has no Fields element
+    field_count: Optional[int] = None
+
+
+@dataclass
+class IvxRecord:
+    data: Optional[etree._Element] = None
+    images: Optional[etree._Element] = None
+    serialized_data: Optional[etree._Element] = None
+    serialized_images: Optional[etree._Element] = None
+    payslips: List[PayslipRecord] = field(default_factory=list)
+    # None when the message has no Images element
+    document_count: Optional[int] = None
+    # The base64 Content of each Document inside the first Images element
+    document_contents: List[etree._Element] = field(default_factory=list)
+
+
+IVX_FIELDS = {
+    _tag(IVX_NS, 'Data'): 'data',
+    _tag(IVX_NS, 'Images'): 'images',
+    _tag(IVX_NS, 'SerializedData'): 'serialized_data',
+    _tag(IVX_NS, 'SerializedImages'): 'serialized_images',
+}
+IVX_PAYSLIP_DATA = _tag(IVX_NS, 'PayslipData')
+IVX_TIMESTAMP = _tag(IVX_NS, 'TimeStamp')
+SECUREX_FIELDS = _tag(SECUREX_NS, 'Fields')
+SECUREX_KEY_VALUE_PAIR = _tag(SECUREX_NS, 'KeyValuePair')
+
+
+def extract_ivx(message):
+    """
+    Extract an IVXProviderSubmitMessage into an IvxRecord.
+
+    Payslips are the PayslipData elements inside the first Data element;
+    fields are counted inside the first Fields element of each payslip, and
+    documents inside the first Images element.
+    """
+    record = IvxRecord()
+    payslip = None
+    payslip_elem = None
+    fields_elem = None
+
+    for event, elem in etree.iterwalk(message, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'end':
+            if elem is payslip_elem:
+                payslip = payslip_elem = fields_elem = None
+            elif elem is fields_elem:
+                fields_elem = None
+            continue
+
+        if tag in IVX_FIELDS:
+            _first(record, elem, IVX_FIELDS)
+            if elem is record.images:
+                record.document_count = 0
+        if tag == IVX_PAYSLIP_DATA and payslip_elem is None and _within(elem, record.data):
+            payslip = PayslipRecord()
+            payslip_elem = elem
+            record.payslips.append(payslip)
+        elif payslip is not None:
+            if tag == IVX_TIMESTAMP and payslip.timestamp is None:
+                payslip.timestamp = elem.text
+            elif tag == SECUREX_FIELDS and payslip.field_count is None:
+                payslip.field_count = 0
+                fields_elem = elem
+            elif tag == SECUREX_KEY_VALUE_PAIR and fields_elem is not None:
+                payslip.field_count += 1
+        if tag == SECUREX_DOCUMENT and _within(elem, record.images):
+            record.document_count += 1
+        elif tag == SECUREX_CONTENT and elem.getparent().tag == SECUREX_DOCUMENT and _within(elem, record.images):
+            record.document_contents.append(elem)
+
+    return record
@@ -0,0 +1,85 @@
+"""
+Prometheus metrics for the hot paths, served from /metrics.
+
+Every stage of an outbound Comcorp call (client acquisition, body build,
+signing, encryption, network round trip, result serialization) and of an
+inbound callback (parse, verify_security, decrypt, signature verification,
+handler dispatch) is timed into one histogram labelled by direction and stage.
+Callback duplicate detection counts its cache hits and misses.
+
+Under gunicorn every worker is a separate process, so the metrics are kept in
+prometheus_client's multiprocess mode: each process writes its samples to
+memory-mapped files in ``PROMETHEUS_MULTIPROC_DIR`` and /metrics aggregates
+them. The gunicorn config sets the directory, clears it on start and marks
+exited workers dead. Without ``PROMETHEUS_MULTIPROC_DIR`` the metrics are
+per process.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Histogram, generate_latest, multiprocess)
+
+OUTBOUND = 'outbound'
+INBOUND = 'inbound'
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    'comcorp_stage_seconds',
+    'Time spent per processing stage',
+    ['direction', 'stage'],
+    buckets=STAGE_BUCKETS,
+)
+
+# Callback duplicate detection (app/idempotency.py): memory_hit, store_hit or miss
+IDEMPOTENCY_LOOKUPS = Counter(
+    'comcorp_idempotency_lookups',
+    'Callback idempotency lookups by result',
+    ['result'],
+)
+
+# Download request result cache (app/result_cache.py): hit, miss, coalesced or bypass
+RESULT_CACHE_REQUESTS = Counter(
+    'comcorp_result_cache_requests',
+    'Download request result cache lookups by outcome',
+    ['result'],
+)
+
+
+def observe(direction, stage, seconds):
+    """Record ``seconds`` spent in a stage."""
+    STAGE_SECONDS.labels(direction, stage).observe(seconds)
+
+
+@contextmanager
+def timed(direction, stage):
+    """
+    Time the enclosed block as a stage.
+
+    Args:
+        direction: OUTBOUND or INBOUND
+        stage: The stage name, e.g. 'sign' or 'parse'
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(direction, stage).observe(time.perf_counter() - started)
+
+
+def render():
+    """
+    Render the metrics of every worker in the Prometheus text format.
+
+    Returns:
+        A tuple (body, content_type)
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,20 +1,37 @@
-import zeep
-import zeep.xsd
-import lxml.builder
-from lxml import etree as ET
+from functools import lru_cache
+
+
+HEADER_VALUES = dict(ConsumerBusinessUnit='your_business_unit_here',
+                     ConsumerReference='your_reference_here',
+                     ExchangeReference='your_exchange_reference_here',
+                     InitiatingIP='your_ip_here',
+                     ProductId='your_product_id_here',
+                     ProviderBusinessUnit='your_business_unit_here',
+                     ProviderReference='your_reference_here',
+                     TransactionStatus='your_status_here')
+
+# The fields of IDXConsumerSubmitMessage and of Entity taken from the payload
+BODY_FIELDS = ('AccountNumber', 'AccountType', 'BranchCode', 'DateFrom', 'DateTo',
+               'EmailAddress', 'JointAccount')
+ENTITY_FIELDS = ('IdentificationNo', 'IdentificationType', 'Initials', 'Name')
+
+
+@lru_cache(maxsize=None)
+def _get_type(types, name):
+    """Resolve a type once per WSDL document (the lookup walks every schema)."""
+    return types.get_type(name)
+
+
+def get_type(Client, name):
+    """Return ``Client.get_type(name)``, cached per WSDL document."""
+    return _get_type(Client.wsdl.types, name)
+
 
 def getHeader(Client):
     soap = Client
 
-    secureXHeader = soap.get_type('ns3:SecureXHeader')
-    header = secureXHeader(ConsumerBusinessUnit='your_business_unit_here',
-                           ConsumerReference='your_reference_here', 
-                           ExchangeReference='your_exchange_reference_here',
-                           InitiatingIP='your_ip_here',
-                           ProductId='your_product_id_here',
-                           ProviderBusinessUnit='your_business_unit_here',
-                           ProviderReference='your_reference_here',
-                           TransactionStatus='your_status_here')
+    secureXHeader = get_type(soap, 'ns3:SecureXHeader')
+    header = secureXHeader(**HEADER_VALUES)
     
     return header
 
@@ -46,33 +63,22 @@ def getDecryptedBody(Client, params=None):
         return
     
     # Create entities
-    Entity = soap.get_type('ns1:Entity')
+    Entity = get_type(soap, 'ns1:Entity')
     entities = []
     
     # If PhysicalEntities is provided, use them
     if 'PhysicalEntities' in params and params['PhysicalEntities']:
         for entity_data in params['PhysicalEntities']:
-            entity = Entity(
-                IdentificationNo=entity_data.get('IdentificationNo', ''),
-                IdentificationType=entity_data.get('IdentificationType', ''),
-                Initials=entity_data.get('Initials', ''),
-                Name=entity_data.get('Name', '')
-            )
+            entity = Entity(**{name: entity_data.get(name, '') for name in ENTITY_FIELDS})
             entities.append(entity)
 
-    ArrayOfEntity = soap.get_type('ns1:ArrayOfEntity')
+    ArrayOfEntity = get_type(soap, 'ns1:ArrayOfEntity')
     array_of_entity = ArrayOfEntity(Entity=entities)
 
-    IDXConsumerSubmitMessage = soap.get_type('ns1:IDXConsumerSubmitMessage')
+    IDXConsumerSubmitMessage = get_type(soap, 'ns1:IDXConsumerSubmitMessage')
     body = IDXConsumerSubmitMessage(
-        AccountNumber=params.get('AccountNumber', ''),
-        AccountType=params.get('AccountType', ''),
-        BranchCode=params.get('BranchCode', ''),
-        DateFrom=params.get('DateFrom', ''),
-        DateTo=params.get('DateTo', ''),
-        EmailAddress=params.get('EmailAddress', ''),
-        JointAccount=params.get('JointAccount', ''),
-        PhysicalEntities=array_of_entity
+        PhysicalEntities=array_of_entity,
+        **{name: params.get(name, '') for name in BODY_FIELDS}
     )
     
     return body
\ No newline at end of file
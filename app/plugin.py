@@ -1,32 +1,27 @@
-from lxml import etree
 from zeep import Plugin
 from zeep.wsse.utils import get_security_header
-from app.crypto_wsse import encrypt
-from app.constants import PRIVATE_KEY_FILE, PUBLIC_KEY_FILE
+from app.crypto_wsse import encrypt_element
+from app.constants import PUBLIC_KEY_FILE
+from app.debug_capture import capture
+from app.metrics import OUTBOUND, timed
 
 class encryptPlugin(Plugin):
 
     def ingress(self, envelope, http_headers, operation):
-        #print(etree.tostring(envelope, pretty_print=True))
+        capture('response', envelope, headers=http_headers)
         return envelope, http_headers
 
     def egress(self, envelope, http_headers, operation, binding_options):
-        # Format the request body as pretty printed XML
-        xml = etree.tostring( envelope, pretty_print = True, encoding = 'unicode')
+        # Make sure the envelope has a security header for encrypt_element
+        # to add its token and key to (the wsse signature, which would
+        # otherwise create it, is only applied after the plugins)
+        get_security_header(envelope)
+        capture('request', envelope)
 
-        # Get the security header from the envelope
-        security = get_security_header(envelope)
-        print(security)
+        # Encrypt the envelope tree in place, without serializing it
+        with timed(OUTBOUND, 'encrypt'):
+            encrypted_envelope = encrypt_element(envelope, PUBLIC_KEY_FILE)
 
-        # Convert the envelope to a string before passing it to the encrypt function
-        envelope_str = etree.tostring(envelope, encoding='unicode', pretty_print=True)
-        encrypted_envelope = encrypt(envelope_str, PUBLIC_KEY_FILE)
-
-        # Ensure the envelope is an Element object after encryption
-        if isinstance(encrypted_envelope, (bytes, str)):
-            encrypted_envelope = etree.fromstring(encrypted_envelope)
-
-        xml = etree.tostring(encrypted_envelope, pretty_print=True, encoding='unicode')
-        print( f'\nRequest\n-------\nHeaders:\n{http_headers}\n\nBody:\n{xml}' )
+        capture('encrypted request', encrypted_envelope, headers=http_headers)
 
         return encrypted_envelope, http_headers
\ No newline at end of file
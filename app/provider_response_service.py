@@ -1,22 +1,22 @@
 from flask import request, Response, jsonify
 import zeep
-from zeep.wsse.signature import BinarySignature
+from zeep.exceptions import SignatureVerificationFailed
 from lxml import etree
-import xmlsec
-import base64
-from OpenSSL import crypto
-import uuid
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
 
-from app.constants import PROVIDER_RESPONSE_WSDL, PRIVATE_KEY_FILE, PUBLIC_KEY_FILE, WSSE_NS, WSU_NS, SOAP_NS, DS_NS, ENC_NS
-from app.signature_service import BinarySignatureTimestamp
-from app.crypto_wsse import decrypt
-from app.xml import ns, ensure_id
+from app.constants import PROVIDER_RESPONSE_WSDL, PRIVATE_KEY_FILE
+from app.constants import AVX_NS, FICAX_NS, IDX_NS, IVX_NS
+from app import blob_store, crypto_pool, debug_capture, idempotency, soap_responses
+from app.trust_store import REQUIRE_SIGNATURE, verify_envelope
+from app.wsdl_cache import load_document
+from app.stream_ingest import STREAMING_INGEST, ingest
+from app.message_extract import extract_envelope, extract_avx, extract_fica, extract_idx, extract_ivx
+from app.callback_queue import ASYNC_ACK, enqueue
+from app.metrics import INBOUND, timed, render as render_metrics
+from app.logging_config import preview
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Import the Flask app instance from the package
@@ -24,95 +24,150 @@ from app import app
 
 # Load the WSDL
 wsdl_path = f"wsdl/{PROVIDER_RESPONSE_WSDL}"
-client = zeep.Client(wsdl=wsdl_path)
+client = zeep.Client(wsdl=load_document(wsdl_path))
 
-def verify_security(envelope):
+# Message handlers, keyed on the (namespace, localname) of the Body content.
+# Every handler is also registered under (None, localname), which is used
+# when the message arrives in a namespace we have not registered.
+MESSAGE_HANDLERS = {}
+
+
+def message_handler(namespace, localname):
+    """
+    Register a function as the handler for a ProviderResponseService message.
+
+    Args:
+        namespace: The namespace of the message element, or None for any
+        localname: The local name of the message element
+    """
+    def register(handler):
+        MESSAGE_HANDLERS[(namespace, localname)] = handler
+        MESSAGE_HANDLERS.setdefault((None, localname), handler)
+        return handler
+    return register
+
+
+def get_message_handler(message):
+    """
+    Look up the handler for a message element.
+
+    Args:
+        message: The message element (the content of the SOAP Body)
+
+    Returns:
+        The handler function, or None if the message type is unknown
+    """
+    qname = etree.QName(message)
+    handler = MESSAGE_HANDLERS.get((qname.namespace, qname.localname))
+    if handler is None:
+        handler = MESSAGE_HANDLERS.get((None, qname.localname))
+    return handler
+
+
+def parse_timestamp(value):
+    """Parse a wsu:Created/Expires value as an aware UTC datetime."""
+    parsed = datetime.fromisoformat(value.strip().rstrip('Z'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=pytz.UTC)
+    return parsed
+
+def verify_security(envelope, record=None, check_timestamp=True):
     """
     Verify the WS-Security elements of the SOAP envelope.
     
     Args:
         envelope: The SOAP envelope as an lxml Element
+        record: The EnvelopeRecord of ``envelope``, if already extracted
+        check_timestamp: Whether to reject an expired timestamp; False for
+                         queued callbacks, whose timestamp was checked on receipt
         
     Returns:
         A tuple (success, error_message)
     """
     try:
+        if record is None:
+            record = extract_envelope(envelope)
+
         # Find the Security header
-        header = envelope.find(f".//{{{SOAP_NS}}}Header")
-        if header is None:
+        if record.header is None:
             return False, "No Header element found in the request"
             
-        security = header.find(f".//{{{WSSE_NS}}}Security")
-        if security is None:
+        if record.security is None:
             return False, "No Security element found in the request"
             
         # Verify timestamp
-        timestamp = security.find(f".//{{{WSU_NS}}}Timestamp")
-        if timestamp is not None:
-            created = timestamp.find(f".//{{{WSU_NS}}}Created")
-            expires = timestamp.find(f".//{{{WSU_NS}}}Expires")
+        if record.has_timestamp and check_timestamp:
+            created = record.timestamp_created
+            expires = record.timestamp_expires
             
             if created is not None and expires is not None:
-                created_time = datetime.fromisoformat(created.text.rstrip('Z'))
-                expires_time = datetime.fromisoformat(expires.text.rstrip('Z'))
+                expires_time = parse_timestamp(expires)
                 now = datetime.now(pytz.UTC)
                 
                 if now > expires_time:
                     return False, "Security timestamp has expired"
                     
-                logger.info(f"Timestamp verified: Created={created.text}, Expires={expires.text}")
-        
-        # In a production environment, you would also verify the signature
-        # using the BinarySignature class from zeep.wsse.signature
-        # For now, we'll just log that we would verify it
-        signature = security.find(f".//{{{DS_NS}}}Signature")
-        if signature is not None:
-            logger.info("Signature found, would verify in production")
-        
-        # In a production environment, you would also decrypt any encrypted parts
-        # using the decrypt function from crypto_wsse
-        # For now, we'll just log that we would decrypt it
-        encrypted_data = envelope.find(f".//{{{ENC_NS}}}EncryptedData")
-        if encrypted_data is not None:
-            logger.info("EncryptedData found, would decrypt in production")
+                logger.info("Timestamp verified: Created=%s, Expires=%s", created, expires)
+
+        if record.signature is None and REQUIRE_SIGNATURE:
+            return False, "No Signature element found in the request"
         
         return True, None
     except Exception as e:
         return False, str(e)
 
-def process_submit_request(envelope):
+def process_submit_request(envelope, check_timestamp=True, verified=False, size=None):
     """
     Process the Submit operation request from the SOAP envelope.
     
     Args:
         envelope: The SOAP envelope as an lxml Element
+        check_timestamp: Whether to reject an expired security timestamp
+        verified: Whether verify_security has already passed for the envelope
+        size: Length in bytes of the raw envelope, if known; large encrypted
+              envelopes are decrypted in the crypto pool
         
     Returns:
         A boolean response indicating success
     """
     try:
+        record = extract_envelope(envelope)
+
         # Verify security
-        security_verified, error_message = verify_security(envelope)
-        if not security_verified:
-            logger.error(f"Security verification failed: {error_message}")
-            return False
-        
-        # Extract the header
-        header_elem = envelope.find(f".//{{{SOAP_NS}}}Header")
-        if header_elem is not None:
-            # Extract SecureXHeader
-            securex_header = header_elem.find(".//{http://SecureX.Common/V1}Header")
-            if securex_header is not None:
-                logger.info(f"Received SecureXHeader: {etree.tostring(securex_header)}")
+        if not verified:
+            with timed(INBOUND, 'verify_security'):
+                security_verified, error_message = verify_security(envelope, record, check_timestamp)
+            if not security_verified:
+                logger.error(f"Security verification failed: {error_message}")
+                return False
+
+        # Decrypt the encrypted parts (in the crypto pool for large envelopes)
+        if record.encrypted_data:
+            with timed(INBOUND, 'decrypt'):
+                envelope = crypto_pool.decrypt_element(envelope, PRIVATE_KEY_FILE, size)
+            record = extract_envelope(envelope)
+            logger.info("Decrypted EncryptedData")
+
+        # Verify the signature over the decrypted message
+        if record.signature is not None:
+            try:
+                with timed(INBOUND, 'verify_signature'):
+                    verify_envelope(envelope, record.signature)
+            except SignatureVerificationFailed as e:
+                logger.error(f"Signature verification failed: {str(e)}")
+                return False
+        
+        # Extract SecureXHeader
+        if record.securex_header is not None:
+            logger.info("Received SecureXHeader: %s", preview(record.securex_header))
         
         # Extract the body
-        body_elem = envelope.find(f".//{{{SOAP_NS}}}Body")
-        if body_elem is None:
+        if record.body is None:
             logger.error("No Body element found in the request")
             return False
         
         # Process the body content based on the message type
-        body_content = body_elem.find(".//*")
+        body_content = record.message
         if body_content is None:
             logger.error("No content found in Body element")
             return False
@@ -121,23 +176,20 @@ def process_submit_request(envelope):
         tag_name = etree.QName(body_content).localname
         namespace = etree.QName(body_content).namespace
         
-        logger.info(f"Processing message of type: {tag_name} in namespace {namespace}")
-        
-        # Process based on message type
-        if "AvXProviderSubmitMessage" in tag_name:
-            return process_avx_message(body_content)
-        elif "FicaProviderSubmitMessage" in tag_name:
-            return process_fica_message(body_content)
-        elif "IDXProviderSubmitMessage" in tag_name:
-            return process_idx_message(body_content)
-        elif "IVXProviderSubmitMessage" in tag_name:
-            return process_ivx_message(body_content)
-        else:
+        logger.info("Processing message of type: %s in namespace %s", tag_name, namespace)
+        
+        # Dispatch to the handler registered for the message type
+        handler = get_message_handler(body_content)
+        if handler is None:
             logger.error(f"Unknown message type: {tag_name}")
             return False
+        with timed(INBOUND, 'dispatch'):
+            return handler(body_content)
     except Exception as e:
         logger.error(f"Error processing Submit request: {str(e)}")
         return False
+
+@message_handler(AVX_NS, "AvXProviderSubmitMessage")
 def process_avx_message(message):
     """
     Process an AvXProviderSubmitMessage.
@@ -150,26 +202,26 @@ def process_avx_message(message):
     """
     try:
         logger.info("Processing AvXProviderSubmitMessage")
+        record = extract_avx(message)
         
         # Extract AvxResponseDetail if present
-        avx_response_detail = message.find(".//{http://AvX.Contract/V1}AvxResponseDetail")
-        if avx_response_detail is not None:
-            logger.info(f"AvxResponseDetail: {etree.tostring(avx_response_detail)}")
+        if record.response_detail is not None:
+            logger.info("AvxResponseDetail: %s", preview(record.response_detail))
             
             # Process the response details
-            for child in avx_response_detail:
-                logger.info(f"  {etree.QName(child).localname}: {child.text}")
+            for child in record.response_detail:
+                logger.info("  %s: %s", etree.QName(child).localname, child.text)
         
         # Extract SerializedAvxRespose if present
-        serialized_response = message.find(".//{http://AvX.Contract/V1}SerializedAvxRespose")
-        if serialized_response is not None:
-            logger.info(f"SerializedAvxRespose: {etree.tostring(serialized_response)}")
+        if record.serialized_response is not None:
+            logger.info("SerializedAvxRespose: %s", preview(record.serialized_response))
         
         return True
     except Exception as e:
         logger.error(f"Error processing AvXProviderSubmitMessage: {str(e)}")
         return False
 
+@message_handler(FICAX_NS, "FicaProviderSubmitMessage")
 def process_fica_message(message):
     """
     Process a FicaProviderSubmitMessage.
@@ -182,32 +234,35 @@ def process_fica_message(message):
     """
     try:
         logger.info("Processing FicaProviderSubmitMessage")
+        record = extract_fica(message)
+
+        # Move the document contents to the blob store
+        documents = blob_store.store_elements(record.document_contents, 'documents')
+        for ref in documents:
+            logger.info("Document stored as %s (%s bytes)", ref.digest, ref.size)
         
         # Extract Data if present
-        data = message.find(".//{http://FicaX.Contract/V1}Data")
-        if data is not None:
-            logger.info(f"Data: {etree.tostring(data)}")
+        if record.data is not None:
+            logger.info("Data: %s", preview(record.data))
         
         # Extract Documents if present
-        documents = message.find(".//{http://FicaX.Contract/V1}Documents")
-        if documents is not None:
-            logger.info(f"Documents: {etree.tostring(documents)}")
+        if record.documents is not None:
+            logger.info("Documents: %s", preview(record.documents))
         
         # Extract SerializedData if present
-        serialized_data = message.find(".//{http://FicaX.Contract/V1}SerializedData")
-        if serialized_data is not None:
-            logger.info(f"SerializedData: {etree.tostring(serialized_data)}")
+        if record.serialized_data is not None:
+            logger.info("SerializedData: %s", preview(record.serialized_data))
         
         # Extract SerializedElements if present
-        serialized_elements = message.find(".//{http://FicaX.Contract/V1}SerializedElements")
-        if serialized_elements is not None:
-            logger.info(f"SerializedElements: {etree.tostring(serialized_elements)}")
+        if record.serialized_elements is not None:
+            logger.info("SerializedElements: %s", preview(record.serialized_elements))
         
         return True
     except Exception as e:
         logger.error(f"Error processing FicaProviderSubmitMessage: {str(e)}")
         return False
 
+@message_handler(IDX_NS, "IDXProviderSubmitMessage")
 def process_idx_message(message):
     """
     Process an IDXProviderSubmitMessage.
@@ -220,50 +275,89 @@ def process_idx_message(message):
     """
     try:
         logger.info("Processing IDXProviderSubmitMessage")
+        record = extract_idx(message)
+
+        # Move the statement images to the blob store
+        images = blob_store.store_elements(record.statement_images, 'statement images')
+        for ref in images:
+            logger.info("Statement image stored as %s (%s bytes)", ref.digest, ref.size)
         
         # Extract account information
-        account_name = message.find(".//{http://IDX.Contract/V1}AccountName")
-        if account_name is not None:
-            logger.info(f"AccountName: {account_name.text}")
+        if record.account_name is not None:
+            logger.info("AccountName: %s", record.account_name.text)
         
-        account_number = message.find(".//{http://IDX.Contract/V1}AccountNumber")
-        if account_number is not None:
-            logger.info(f"AccountNumber: {account_number.text}")
+        if record.account_number is not None:
+            logger.info("AccountNumber: %s", record.account_number.text)
         
-        account_type = message.find(".//{http://IDX.Contract/V1}AccountType")
-        if account_type is not None:
-            logger.info(f"AccountType: {account_type.text}")
+        if record.account_type is not None:
+            logger.info("AccountType: %s", record.account_type.text)
         
         # Extract Data if present
-        data = message.find(".//{http://IDX.Contract/V1}Data")
-        if data is not None:
-            logger.info(f"Data: {etree.tostring(data)}")
+        if record.data is not None:
+            logger.info("Data: %s", preview(record.data))
             
             # Process statement data
-            for statement_data in data.findall(".//{http://IDX.Contract/V1}StatementData"):
-                date_from = statement_data.find(".//{http://IDX.Contract/V1}DateFrom")
-                date_to = statement_data.find(".//{http://IDX.Contract/V1}DateTo")
-                
-                if date_from is not None and date_to is not None:
-                    logger.info(f"Statement period: {date_from.text} to {date_to.text}")
+            for statement in record.statements:
+                if statement.date_from is not None and statement.date_to is not None:
+                    logger.info("Statement period: %s to %s", statement.date_from, statement.date_to)
                 
                 # Process transactions
-                transactions = statement_data.find(".//{http://IDX.Contract/V1}Transactions")
-                if transactions is not None:
-                    transaction_count = len(transactions.findall(".//{http://IDX.Contract/V1}Transaction"))
-                    logger.info(f"Found {transaction_count} transactions")
+                if statement.transaction_count is not None:
+                    logger.info("Found %s transactions", statement.transaction_count)
         
         # Extract Images if present
-        images = message.find(".//{http://IDX.Contract/V1}Images")
-        if images is not None:
-            image_count = len(images.findall(".//{http://IDX.Contract/V1}StatementImage"))
-            logger.info(f"Found {image_count} statement images")
+        if record.image_count is not None:
+            logger.info("Found %s statement images", record.image_count)
         
         return True
     except Exception as e:
         logger.error(f"Error processing IDXProviderSubmitMessage: {str(e)}")
         return False
 
+def process_streamed_idx_message(envelope, streamed):
+    """
+    Finish processing an IDXProviderSubmitMessage ingested by stream_ingest.
+
+    Args:
+        envelope: The SOAP envelope, without the already processed
+                  transactions and statement images
+        streamed: The StreamedIdxMessage collected while parsing
+
+    Returns:
+        A boolean indicating success
+    """
+    try:
+        if streamed.security_error:
+            return False
+
+        # Extract SecureXHeader
+        securex_header = extract_envelope(envelope).securex_header
+        if securex_header is not None:
+            logger.info("Received SecureXHeader: %s", preview(securex_header))
+
+        logger.info("Processing IDXProviderSubmitMessage (streamed)")
+        if streamed.account_name is not None:
+            logger.info("AccountName: %s", streamed.account_name)
+        if streamed.account_number is not None:
+            logger.info("AccountNumber: %s", streamed.account_number)
+        if streamed.account_type is not None:
+            logger.info("AccountType: %s", streamed.account_type)
+
+        for date_from, date_to, transaction_count in streamed.statements:
+            if date_from is not None and date_to is not None:
+                logger.info("Statement period: %s to %s", date_from, date_to)
+            logger.info("Found %s transactions", transaction_count)
+
+        logger.info("Found %s statement images", len(streamed.images))
+        for ref in streamed.images:
+            logger.info("Statement image stored as %s (%s bytes)", ref.digest, ref.size)
+
+        return True
+    except Exception as e:
+        logger.error(f"Error processing IDXProviderSubmitMessage: {str(e)}")
+        return False
+
+@message_handler(IVX_NS, "IVXProviderSubmitMessage")
 def process_ivx_message(message):
     """
     Process an IVXProviderSubmitMessage.
@@ -276,39 +370,40 @@ def process_ivx_message(message):
     """
     try:
         logger.info("Processing IVXProviderSubmitMessage")
+        record = extract_ivx(message)
+
+        # Move the documents and serialized images to the blob store
+        documents = blob_store.store_elements(record.document_contents, 'documents')
+        for ref in documents:
+            logger.info("Document stored as %s (%s bytes)", ref.digest, ref.size)
+        if record.serialized_images is not None:
+            for ref in blob_store.store_elements([record.serialized_images], 'serialized images'):
+                logger.info("SerializedImages stored as %s (%s bytes)", ref.digest, ref.size)
         
         # Extract Data if present
-        data = message.find(".//{http://IVX.Contract/V1}Data")
-        if data is not None:
-            logger.info(f"Data: {etree.tostring(data)}")
+        if record.data is not None:
+            logger.info("Data: %s", preview(record.data))
             
             # Process payslip data
-            for payslip_data in data.findall(".//{http://IVX.Contract/V1}PayslipData"):
-                timestamp = payslip_data.find(".//{http://IVX.Contract/V1}TimeStamp")
-                if timestamp is not None:
-                    logger.info(f"Payslip timestamp: {timestamp.text}")
+            for payslip in record.payslips:
+                if payslip.timestamp is not None:
+                    logger.info("Payslip timestamp: %s", payslip.timestamp)
                 
                 # Process fields
-                fields = payslip_data.find(".//{http://SecureX.Common/V1}Fields")
-                if fields is not None:
-                    field_count = len(fields.findall(".//{http://SecureX.Common/V1}KeyValuePair"))
-                    logger.info(f"Found {field_count} fields")
+                if payslip.field_count is not None:
+                    logger.info("Found %s fields", payslip.field_count)
         
         # Extract Images if present
-        images = message.find(".//{http://IVX.Contract/V1}Images")
-        if images is not None:
-            document_count = len(images.findall(".//{http://SecureX.Common/V1}Document"))
-            logger.info(f"Found {document_count} documents")
+        if record.document_count is not None:
+            logger.info("Found %s documents", record.document_count)
         
         # Extract SerializedData if present
-        serialized_data = message.find(".//{http://IVX.Contract/V1}SerializedData")
-        if serialized_data is not None:
-            logger.info(f"SerializedData: {etree.tostring(serialized_data)}")
+        if record.serialized_data is not None:
+            logger.info("SerializedData: %s", preview(record.serialized_data))
         
-        # Extract SerializedImages if present
-        serialized_images = message.find(".//{http://IVX.Contract/V1}SerializedImages")
-        if serialized_images is not None:
-            logger.info(f"SerializedImages: {etree.tostring(serialized_images)}")
+        # Extract SerializedImages if present (and not moved to the blob store)
+        if record.serialized_images is not None and record.serialized_images.text:
+            logger.info("SerializedImages: %s", preview(record.serialized_images))
         
         return True
     except Exception as e:
@@ -322,63 +417,9 @@ def create_response(success):
         success: A boolean indicating whether the operation was successful
         
     Returns:
-        An lxml Element containing the SOAP response
-    """
-    # Create the SOAP envelope
-    envelope = etree.Element(f"{{{SOAP_NS}}}Envelope", nsmap={
-        'soap': SOAP_NS,
-        'wsu': WSU_NS,
-        'wsse': WSSE_NS,
-        'ds': DS_NS,
-        'xenc': ENC_NS
-    })
-    
-    # Create the body
-    body = etree.SubElement(envelope, f"{{{SOAP_NS}}}Body")
-    
-    # Create the response element
-    value_elem = etree.SubElement(body, "{http://SecureX.ProviderSubmitService/V1}Value")
-    value_elem.text = "true" if success else "false"
-    
-    return envelope
-def add_security_header(envelope):
+        The serialized SOAP response (pre-rendered, see app.soap_responses)
     """
-    Add WS-Security header to the SOAP envelope.
-    
-    Args:
-        envelope: The SOAP envelope as an lxml Element
-        
-    Returns:
-        The modified envelope
-    """
-    # Create the header if it doesn't exist
-    header = envelope.find(f".//{{{SOAP_NS}}}Header")
-    if header is None:
-        header = etree.Element(f"{{{SOAP_NS}}}Header")
-        envelope.insert(0, header)
-    
-    # Create the Security element
-    security = etree.SubElement(header, f"{{{WSSE_NS}}}Security")
-    security.set(f"{{{SOAP_NS}}}mustUnderstand", "1")
-    
-    # Add timestamp
-    utc = pytz.UTC
-    created = datetime.now(utc)
-    expires = created + timedelta(minutes=5)
-    
-    timestamp = etree.SubElement(security, f"{{{WSU_NS}}}Timestamp")
-    ensure_id(timestamp)
-    
-    created_elem = etree.SubElement(timestamp, f"{{{WSU_NS}}}Created")
-    created_elem.text = created.replace(microsecond=0).isoformat() + 'Z'
-    
-    expires_elem = etree.SubElement(timestamp, f"{{{WSU_NS}}}Expires")
-    expires_elem.text = expires.replace(microsecond=0).isoformat() + 'Z'
-    
-    # In a production environment, you would also add a signature
-    # using the BinarySignatureTimestamp class
-    
-    return envelope
+    return soap_responses.ack(success)
 def create_fault_response(code, errors):
     """
     Create a SOAP fault response.
@@ -388,79 +429,94 @@ def create_fault_response(code, errors):
         errors: A list of error messages
         
     Returns:
-        An lxml Element containing the SOAP fault response
+        The serialized SOAP fault response, with a WS-Security header
+        (pre-rendered, see app.soap_responses)
     """
-    # Create the SOAP envelope
-    envelope = etree.Element(f"{{{SOAP_NS}}}Envelope", nsmap={
-        'soap': SOAP_NS,
-        'wsu': WSU_NS,
-        'wsse': WSSE_NS,
-        'ds': DS_NS,
-        'xenc': ENC_NS
-    })
-    
-    # Create the body
-    body = etree.SubElement(envelope, f"{{{SOAP_NS}}}Body")
-    
-    # Create the fault element
-    fault = etree.SubElement(body, f"{{{SOAP_NS}}}Fault")
-    
-    # Add fault code and reason
-    code_elem = etree.SubElement(fault, "Code")
-    code_elem.text = str(code)
-    
-    # Add fault details
-    detail = etree.SubElement(fault, "Detail")
-    securex_fault = etree.SubElement(detail, "{http://SecureX.Fault/V1}SecureXFault")
-    
-    # Add code and errors
-    code_elem = etree.SubElement(securex_fault, "Code")
-    code_elem.text = str(code)
-    
-    errors_elem = etree.SubElement(securex_fault, "Errors")
-    for error in errors:
-        error_elem = etree.SubElement(errors_elem, "string")
-        error_elem.text = error
-    
-    # Add security header
-    envelope = add_security_header(envelope)
-    
-    return envelope
+    return soap_responses.fault(code, errors)
+
 @app.route('/ProviderResponseService', methods=['POST'])
 def provider_response_service():
     """
     Handle incoming SOAP requests for the ProviderResponseService.
     """
+    # Capture the callback XML if sampled; the endpoint is not authenticated,
+    # so a ?debug=true from the caller is not honored
+    debug_capture.start()
+
     try:
-        # Get the request content
-        content = request.data
-        
-        # Parse the SOAP envelope
-        envelope = etree.fromstring(content)
-        
-        # Process the request
-        success = process_submit_request(envelope)
-        
-        # Create the response
-        response_envelope = create_response(success)
-        
-        # Convert the response to XML
-        response_xml = etree.tostring(response_envelope, encoding='utf-8', xml_declaration=True)
-        
+        if ASYNC_ACK or not STREAMING_INGEST:
+            # Parse the SOAP envelope and verify its security header
+            content = request.get_data()
+            with timed(INBOUND, 'parse'):
+                envelope = etree.fromstring(content)
+            debug_capture.capture('callback', envelope)
+            with timed(INBOUND, 'verify_security'):
+                verified, error_message = verify_security(envelope)
+
+            if not verified:
+                logger.error(f"Security verification failed: {error_message}")
+                success = False
+            else:
+                # Callbacks already processed (Comcorp retries) get the same
+                # ack without being processed again
+                with timed(INBOUND, 'idempotency'):
+                    key = idempotency.key_from_bytes(content)
+                    success = idempotency.lookup(key)
+                if success is not None:
+                    logger.info("Duplicate callback %s acknowledged without processing", key)
+                elif ASYNC_ACK:
+                    # Persist the callback and acknowledge; app.callback_worker
+                    # processes it later. The key is recorded by the callback
+                    # worker once the callback has been processed, so a retry
+                    # of a callback that fails there is queued again
+                    callback_id = enqueue(content)
+                    logger.info("Queued callback %s", callback_id)
+                    success = True
+                else:
+                    success = process_submit_request(envelope, verified=True, size=len(content))
+                    idempotency.record(key, success)
+        else:
+            # Parse the SOAP envelope incrementally from the request stream
+            # (the parse stage includes the streamed processing and the
+            # security header checks), hashing its Body for the idempotency key
+            stream = idempotency.BodyDigestReader(request.stream)
+            with timed(INBOUND, 'parse'):
+                envelope, streamed = ingest(stream, verify_security)
+
+            if streamed is not None and streamed.security_error:
+                # Rejected while parsing (including a missing Header)
+                success = False
+            else:
+                # The Header was verified while parsing
+                with timed(INBOUND, 'idempotency'):
+                    key = idempotency.key_from_record(extract_envelope(envelope), stream.hexdigest())
+                    success = idempotency.lookup(key)
+                if success is not None:
+                    logger.info("Duplicate callback %s acknowledged without processing", key)
+                else:
+                    if streamed is not None:
+                        with timed(INBOUND, 'dispatch'):
+                            success = process_streamed_idx_message(envelope, streamed)
+                    else:
+                        success = process_submit_request(envelope, verified=True, size=request.content_length)
+                    idempotency.record(key, success)
+
         # Return the response
-        return Response(response_xml, mimetype='application/soap+xml')
+        return Response(create_response(success), mimetype=soap_responses.MIMETYPE)
     
     except Exception as e:
         logger.error(f"Error handling request: {str(e)}")
         
-        # Create a fault response
-        fault_envelope = create_fault_response(500, [str(e)])
-        
-        # Convert the fault to XML
-        fault_xml = etree.tostring(fault_envelope, encoding='utf-8', xml_declaration=True)
-        
-        # Return the fault
-        return Response(fault_xml, mimetype='application/soap+xml', status=500)
+        # Return a fault response
+        return Response(create_fault_response(500, [str(e)]), mimetype=soap_responses.MIMETYPE, status=500)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics endpoint, aggregated across the gunicorn workers.
+    """
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -494,5 +550,5 @@ def health_check():
 
 # This is only used when running the file directly, not when imported
 if __name__ == '__main__':
-    logger.info(f"Starting ProviderResponseService on http://localhost:5000/ProviderResponseService")
+    logger.info("Starting ProviderResponseService on http://localhost:5000/ProviderResponseService")
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Cache of /comcorp-download-request results for repeated queries.
+
+Upstream services often resubmit the same download request within minutes,
+and each one costs a signed and encrypted round trip to Comcorp. With a TTL
+configured (``RESULT_CACHE_TTL``, or per AccountType with
+``RESULT_CACHE_TTL_BY_ACCOUNT_TYPE=Current=300,Savings=60``) results are kept
+in a size-bounded LRU per worker, keyed on a hash of the normalized payload.
+Identical requests that arrive while the first one is still in flight wait for
+it instead of making their own call.
+
+A request with ``Cache-Control: no-cache`` (or ``no-store``) always goes to
+Comcorp and refreshes the cached result. Failed calls are not cached.
+Outcomes are counted in ``comcorp_result_cache_requests_total`` on /metrics.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.metrics import RESULT_CACHE_REQUESTS
+
+
+def _parse_ttls(value):
+    ttls = {}
+    for item in (value or '').split(','):
+        account_type, _, ttl = item.partition('=')
+        if account_type.strip() and ttl.strip():
+            ttls[account_type.strip().lower()] = float(ttl)
+    return ttls
+
+
+# Seconds a result is cached; 0 disables the cache
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '0'))
+# Per AccountType overrides, e.g. "Current=300,Savings=60,CreditCard=0"
+RESULT_CACHE_TTL_BY_ACCOUNT_TYPE = _parse_ttls(os.getenv('RESULT_CACHE_TTL_BY_ACCOUNT_TYPE'))
+# Results cached per worker at most
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1000'))
+
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+BYPASS = 'bypass'
+
+# The payload fields sent to Comcorp (see object_service.getDecryptedBody)
+KEY_FIELDS = ('AccountNumber', 'AccountType', 'BranchCode', 'DateFrom', 'DateTo',
+              'EmailAddress', 'JointAccount')
+ENTITY_FIELDS = ('IdentificationNo', 'IdentificationType', 'Initials', 'Name')
+
+
+class TTLCache:
+    """A thread-safe LRU whose entries expire after a per-entry TTL."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_cache = TTLCache(RESULT_CACHE_SIZE)
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_async = {}
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def payload_key(payload):
+    """
+    Return the cache key of a download request payload.
+
+    Only the fields sent to Comcorp count; values are stripped and the
+    PhysicalEntities are compared as a set.
+    """
+    entities = sorted(
+        [_text(entity.get(name)) for name in ENTITY_FIELDS]
+        for entity in payload.get('PhysicalEntities') or [] if isinstance(entity, dict)
+    )
+    canonical = json.dumps([[_text(payload.get(name)) for name in KEY_FIELDS], entities],
+                           separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def ttl_for(payload):
+    """Return the cache TTL of a payload (by its AccountType); 0 means not cached."""
+    account_type = _text(payload.get('AccountType')).lower()
+    return RESULT_CACHE_TTL_BY_ACCOUNT_TYPE.get(account_type, RESULT_CACHE_TTL)
+
+
+def bypass_requested(cache_control):
+    """Whether a Cache-Control header value asks to bypass the cache."""
+    directives = {part.strip().lower() for part in (cache_control or '').split(',')}
+    return bool(directives & {'no-cache', 'no-store'})
+
+
+def fetch(payload, submit, bypass=False):
+    """
+    Return the result of a download request, from the cache if possible.
+
+    Args:
+        payload: The download request payload
+        submit: Called without arguments to make the request; returns a tuple
+                (response_data, history)
+        bypass: Make the request even if a result is cached
+
+    Returns:
+        A tuple (response_data, history, outcome); history is None unless
+        this call made the request, outcome is HIT, MISS, COALESCED, BYPASS,
+        or None when the payload is not cacheable
+    """
+    ttl = ttl_for(payload)
+    if ttl <= 0:
+        return submit() + (None,)
+
+    key = payload_key(payload)
+    if not bypass:
+        cached = _cache.get(key)
+        if cached is not None:
+            RESULT_CACHE_REQUESTS.labels(HIT).inc()
+            return cached, None, HIT
+
+    future = None
+    with _inflight_lock:
+        leader = _inflight.get(key)
+        if leader is None or bypass:
+            future = Future()
+            if leader is None:
+                _inflight[key] = future
+    if future is None:
+        RESULT_CACHE_REQUESTS.labels(COALESCED).inc()
+        return leader.result(), None, COALESCED
+
+    outcome = BYPASS if bypass else MISS
+    RESULT_CACHE_REQUESTS.labels(outcome).inc()
+    try:
+        response_data, history = submit()
+    except BaseException as e:
+        _finish(key, future)
+        future.set_exception(e)
+        raise
+    _cache.put(key, response_data, ttl)
+    _finish(key, future)
+    future.set_result(response_data)
+    return response_data, history, outcome
+
+
+def _finish(key, future):
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+async def fetch_async(payload, submit, bypass=False):
+    """
+    Asyncio version of fetch.
+
+    Args:
+        payload: The download request payload
+        submit: Called without arguments to get an awaitable of
+                (response_data, history)
+        bypass: Make the request even if a result is cached
+
+    Returns:
+        A tuple (response_data, history, outcome), as for fetch
+    """
+    ttl = ttl_for(payload)
+    if ttl <= 0:
+        return await submit() + (None,)
+
+    key = payload_key(payload)
+    if not bypass:
+        cached = _cache.get(key)
+        if cached is not None:
+            RESULT_CACHE_REQUESTS.labels(HIT).inc()
+            return cached, None, HIT
+
+    loop = asyncio.get_running_loop()
+    inflight_key = (id(loop), key)
+    leader = _inflight_async.get(inflight_key)
+    if leader is not None and not bypass:
+        RESULT_CACHE_REQUESTS.labels(COALESCED).inc()
+        return await asyncio.shield(leader), None, COALESCED
+
+    future = loop.create_future()
+    if leader is None:
+        _inflight_async[inflight_key] = future
+    outcome = BYPASS if bypass else MISS
+    RESULT_CACHE_REQUESTS.labels(outcome).inc()
+    try:
+        response_data, history = await submit()
+    except BaseException as e:
+        if _inflight_async.get(inflight_key) is future:
+            del _inflight_async[inflight_key]
+        future.set_exception(e)
+        # Nobody may be waiting; don't log "exception was never retrieved"
+        future.exception()
+        raise
+    _cache.put(key, response_data, ttl)
+    if _inflight_async.get(inflight_key) is future:
+        del _inflight_async[inflight_key]
+    future.set_result(response_data)
+    return response_data, history, outcome
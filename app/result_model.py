@@ -0,0 +1,112 @@
+"""
+Compact result model for Submit responses.
+
+zeep returns the response as CompoundValue objects, which keep their fields
+in a ``__values__`` dict. to_model converts them into instances of classes
+generated (once per XSD type) from the WSDL's response types: one
+``__slots__`` attribute per XSD element and attribute, no per-instance dict.
+Nested complex types become nested models and repeated elements lists, so the
+structure of the response is kept for serialization (see app.serialization).
+"""
+import keyword
+import re
+import threading
+
+from zeep.xsd.valueobjects import CompoundValue
+
+_INVALID = re.compile(r'\W|^(?=\d)')
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+class ResultModel:
+    """Base of the generated models; ``_keys`` are the XSD names of the slots."""
+
+    __slots__ = ()
+    _keys = ()
+
+    def __init__(self, *values):
+        for slot, value in zip(self.__slots__, values):
+            setattr(self, slot, value)
+
+    def items(self):
+        """Yield (XSD name, value) pairs in schema order."""
+        for key, slot in zip(self._keys, self.__slots__):
+            yield key, getattr(self, slot)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{key}={value!r}' for key, value in self.items())
+        return f'{type(self).__name__}({fields})'
+
+
+def _slot_name(name):
+    slot = _INVALID.sub('_', name)
+    return slot + '_' if keyword.iskeyword(slot) else slot
+
+
+def model_for(xsd_type):
+    """
+    Return the model class of an XSD complex type (generated on first use).
+
+    Args:
+        xsd_type: A zeep ComplexType
+
+    Returns:
+        A ResultModel subclass with a slot per element and attribute
+    """
+    entry = _models.get(id(xsd_type))
+    if entry is not None and entry[0] is xsd_type:
+        return entry[1]
+    with _models_lock:
+        entry = _models.get(id(xsd_type))
+        if entry is not None and entry[0] is xsd_type:
+            return entry[1]
+        keys = [name for name, _ in xsd_type.elements] + [name for name, _ in xsd_type.attributes]
+        name = _slot_name(getattr(xsd_type, 'name', None) or 'Result')
+        model = type(name, (ResultModel,), {
+            '__slots__': tuple(_slot_name(key) for key in keys),
+            '_keys': tuple(keys),
+            '__module__': __name__,
+        })
+        # Keep the type referenced so its id is not reused
+        _models[id(xsd_type)] = (xsd_type, model)
+        return model
+
+
+def to_model(value):
+    """
+    Convert a zeep value into result models.
+
+    Args:
+        value: A CompoundValue, list or simple value returned by zeep
+
+    Returns:
+        A ResultModel for a CompoundValue, a list for a list, or the value
+    """
+    if isinstance(value, CompoundValue):
+        values = value.__values__
+        model = model_for(value._xsd_type)
+        return model(*[to_model(values.get(key)) for key in model._keys])
+    if isinstance(value, list):
+        return [to_model(item) for item in value]
+    return value
+
+
+def result_to_model(result):
+    """
+    Convert the result of the Submit operation for the response.
+
+    Args:
+        result: The value returned by the Submit operation
+
+    Returns:
+        A ResultModel, or {'result': value} if the result is a simple value
+    """
+    if isinstance(result, CompoundValue):
+        return to_model(result)
+    return {'result': result}
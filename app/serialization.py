@@ -0,0 +1,220 @@
+"""
+Encoding of download responses as JSON, or as MessagePack on request.
+
+iter_json writes result models (app.result_model), dicts and lists straight
+to JSON text chunks: nested arrays are encoded item by item, without first
+being converted into dicts. When orjson is installed, dumps uses it instead
+(models are handed to it as dicts). MessagePack is available when msgpack is
+installed and the client asks for it with ``Accept: application/msgpack``.
+
+Large JSON responses can be streamed: iter_chunks writes iter_json's output
+in blocks of RESPONSE_CHUNK_SIZE bytes, and a StreamedText value (such as
+the debug XML of a download response) is encoded chunk by chunk while it is
+produced.
+"""
+import base64
+import datetime
+import decimal
+import math
+import os
+from json.encoder import encode_basestring_ascii
+
+from lxml import etree
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from app.result_model import ResultModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Set to 0 to encode JSON with iter_json even if orjson is installed
+RESPONSE_ORJSON = os.getenv('RESPONSE_ORJSON', '1') == '1'
+# Set to 1 to stream every JSON download response with iter_json (responses
+# with debug XML are always streamed)
+RESPONSE_STREAMING = os.getenv('RESPONSE_STREAMING', '0') == '1'
+# Bytes per block of a streamed response
+RESPONSE_CHUNK_SIZE = int(os.getenv('RESPONSE_CHUNK_SIZE', '65536'))
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+class StreamedText:
+    """
+    A string value produced in chunks, e.g. by debug_capture.iter_pretty.
+
+    The chunks are consumed when the value is encoded, so it can be encoded
+    only once.
+
+    Args:
+        chunks: An iterable of str
+    """
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+
+def _primitive(value):
+    """Convert a value JSON/MessagePack can't encode (or a model) into one it can."""
+    if isinstance(value, ResultModel):
+        return dict(value.items())
+    if isinstance(value, StreamedText):
+        return ''.join(value.chunks)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, etree._Element):
+        return etree.tostring(value, encoding='unicode')
+    return str(value)
+
+
+def iter_json(value):
+    """
+    Encode a value as JSON, chunk by chunk.
+
+    Args:
+        value: A ResultModel, dict, list or simple value (Decimals, dates and
+               lxml elements are written as strings, bytes as base64); a
+               StreamedText is written as a string, chunk by chunk
+
+    Yields:
+        str chunks of the JSON text
+    """
+    if isinstance(value, str):
+        yield encode_basestring_ascii(value)
+    elif value is None:
+        yield 'null'
+    elif value is True:
+        yield 'true'
+    elif value is False:
+        yield 'false'
+    elif isinstance(value, int):
+        yield int.__repr__(value)
+    elif isinstance(value, float):
+        yield float.__repr__(value) if math.isfinite(value) else 'null'
+    elif isinstance(value, StreamedText):
+        yield '"'
+        for chunk in value.chunks:
+            yield encode_basestring_ascii(chunk)[1:-1]
+        yield '"'
+    elif isinstance(value, (ResultModel, dict)):
+        separator = '{'
+        for key, item in value.items():
+            yield separator + encode_basestring_ascii(str(key)) + ':'
+            separator = ','
+            yield from iter_json(item)
+        yield '}' if separator == ',' else '{}'
+    elif isinstance(value, (list, tuple)):
+        separator = '['
+        for item in value:
+            yield separator
+            separator = ','
+            yield from iter_json(item)
+        yield ']' if separator == ',' else '[]'
+    elif isinstance(value, decimal.Decimal):
+        yield encode_basestring_ascii(str(value))
+    else:
+        yield from iter_json(_primitive(value))
+
+
+def dumps(value):
+    """Encode a value as JSON bytes (with orjson if available)."""
+    if orjson is not None and RESPONSE_ORJSON:
+        return orjson.dumps(value, default=_primitive)
+    return ''.join(iter_json(value)).encode('ascii')
+
+
+def iter_chunks(value, chunk_size=None):
+    """
+    Encode a value as JSON in blocks, for a streamed response.
+
+    Args:
+        value: The response data (see iter_json)
+        chunk_size: Bytes per block (default RESPONSE_CHUNK_SIZE); a block
+                    may be larger when a single string is
+
+    Yields:
+        bytes blocks of the JSON text
+    """
+    chunk_size = chunk_size or RESPONSE_CHUNK_SIZE
+    parts = []
+    size = 0
+    for part in iter_json(value):
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(parts).encode('ascii')
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts).encode('ascii')
+
+
+def packb(value):
+    """Encode a value as MessagePack bytes (msgpack must be installed)."""
+    return msgpack.packb(value, default=_primitive)
+
+
+def available_mimetypes():
+    """The response types that can be produced, JSON first."""
+    return (JSON_MIMETYPE,) + (MSGPACK_MIMETYPES if msgpack is not None else ())
+
+
+def negotiate(accept):
+    """
+    Choose the response type for an Accept header.
+
+    Args:
+        accept: The Accept header value (None or empty accepts anything)
+
+    Returns:
+        MSGPACK_MIMETYPE if the client prefers (and msgpack is installed),
+        JSON_MIMETYPE otherwise
+    """
+    if not accept:
+        return JSON_MIMETYPE
+    best = parse_accept_header(accept, MIMEAccept).best_match(available_mimetypes())
+    return MSGPACK_MIMETYPE if best in MSGPACK_MIMETYPES else JSON_MIMETYPE
+
+
+def streamed(mimetype, debug_info=None):
+    """
+    Whether a download response is streamed with iter_chunks.
+
+    Args:
+        mimetype: The negotiated response type
+        debug_info: The response's debug field
+
+    Returns:
+        True for JSON responses with debug XML, or all JSON responses with
+        RESPONSE_STREAMING=1
+    """
+    return mimetype == JSON_MIMETYPE and (RESPONSE_STREAMING or bool(debug_info))
+
+
+def encode(value, mimetype=JSON_MIMETYPE):
+    """
+    Encode a value in a negotiated response type.
+
+    Args:
+        value: The response data
+        mimetype: JSON_MIMETYPE or MSGPACK_MIMETYPE
+
+    Returns:
+        The encoded bytes
+    """
+    if mimetype == MSGPACK_MIMETYPE:
+        return packb(value)
+    return dumps(value)
@@ -0,0 +1,104 @@
+"""
+Optional reuse of the wrapped session key of outbound encryption.
+
+encrypt_element normally generates a new AES-256 session key per message and
+wraps it for the Comcorp certificate with RSA-OAEP; under batch load the RSA
+operation dominates encryption CPU. With reuse enabled, one session key and
+its EncryptedKey are used for up to ``COMCORP_SESSION_KEY_REUSE_MESSAGES``
+messages or ``COMCORP_SESSION_KEY_REUSE_SECONDS`` seconds, whichever comes
+first, per worker process and certificate. Every message is still encrypted
+with a fresh random AES-GCM nonce; only the RSA wrap is shared.
+
+Only enable this where the Comcorp contract accepts the same EncryptedKey in
+several messages. The limits are capped at SESSION_KEY_MAX_MESSAGES and
+SESSION_KEY_MAX_SECONDS, well below the 2**32 random-nonce bound of GCM.
+"""
+import logging
+import os
+import threading
+import time
+
+import xmlsec
+
+logger = logging.getLogger(__name__)
+
+# Hard limits of the reuse window
+SESSION_KEY_MAX_MESSAGES = 100000
+SESSION_KEY_MAX_SECONDS = 3600
+
+# Messages encrypted with one session key; 0 or 1 uses a new key per message
+SESSION_KEY_REUSE_MESSAGES = min(int(os.getenv('COMCORP_SESSION_KEY_REUSE_MESSAGES', '0')),
+                                 SESSION_KEY_MAX_MESSAGES)
+# Seconds a session key is used at most
+SESSION_KEY_REUSE_SECONDS = min(float(os.getenv('COMCORP_SESSION_KEY_REUSE_SECONDS', '60')),
+                                SESSION_KEY_MAX_SECONDS)
+
+SESSION_KEY_BYTES = 32
+
+_current = {}
+_lock = threading.Lock()
+
+
+class SessionKey:
+    """
+    A session key shared by the messages of one reuse window.
+
+    Attributes:
+        cert: The CertificateMaterial the key is wrapped for
+        key: The AES-256 xmlsec.Key
+        wrapped: The EncryptedKey element (without KeyInfo and ReferenceList),
+                 set by the first message encrypted with the key
+        uses: Messages encrypted with the key so far
+        expires_at: time.monotonic() after which the key is not used
+        pid: The process the key was generated in
+    """
+
+    __slots__ = ('cert', 'key', 'wrapped', 'uses', 'expires_at', 'pid')
+
+    def __init__(self, cert, lifetime):
+        self.cert = cert
+        self.key = xmlsec.Key.from_binary_data(xmlsec.KeyData.AES, os.urandom(SESSION_KEY_BYTES))
+        self.wrapped = None
+        self.uses = 0
+        self.expires_at = time.monotonic() + lifetime
+        self.pid = os.getpid()
+
+    def usable(self, cert):
+        return (self.cert is cert and self.pid == os.getpid() and self.uses < SESSION_KEY_REUSE_MESSAGES
+                and time.monotonic() < self.expires_at)
+
+
+def reuse_enabled():
+    """Whether session keys are shared between messages."""
+    return SESSION_KEY_REUSE_MESSAGES > 1 and SESSION_KEY_REUSE_SECONDS > 0
+
+
+def acquire(cert):
+    """
+    Return the session key for the next message encrypted to ``cert``.
+
+    A new key is started when the current one has been used for
+    SESSION_KEY_REUSE_MESSAGES messages, is SESSION_KEY_REUSE_SECONDS old, or
+    belongs to another process or an older copy of the certificate.
+
+    Args:
+        cert: The CertificateMaterial being encrypted to
+
+    Returns:
+        A SessionKey, or None if reuse is disabled
+    """
+    if not reuse_enabled():
+        return None
+    with _lock:
+        session = _current.get(cert.path)
+        if session is None or not session.usable(cert):
+            session = _current[cert.path] = SessionKey(cert, SESSION_KEY_REUSE_SECONDS)
+            logger.debug("New session key for %s", cert.path)
+        session.uses += 1
+        return session
+
+
+def clear():
+    """Forget the current session keys (the next message wraps a new one)."""
+    with _lock:
+        _current.clear()
@@ -1,35 +1,38 @@
-from zeep import Client
 from zeep.wsse.signature import BinarySignature
 from zeep.wsse import utils
-from datetime import datetime, timedelta
-import pytz
-import base64
-from app.constants import PRIVATE_KEY, PUBLIC_KEY
-from app.crypto_wsse import encode
+from zeep.exceptions import SignatureVerificationFailed
+from app.constants import PRIVATE_KEY_FILE
+from app.crypto_wsse import decrypt_element
+from app.trust_store import REQUIRE_SIGNATURE, find_signature, verify_envelope
+from app.metrics import OUTBOUND, timed
+from app.xpaths import ANY_ENCRYPTED_KEY_PATH
+from app.wsse_header import request_elements
 
 class BinarySignatureTimestamp(BinarySignature):
     def apply(self, envelope, headers):
-        security = utils.get_security_header(envelope)
-        
-        encoded_public_key = encode(PUBLIC_KEY)
-        binarySecurityToken = utils.WSU('BinarySecurityToken',encoded_public_key)
-        security.append(binarySecurityToken)
+        with timed(OUTBOUND, 'sign'):
+            security = utils.get_security_header(envelope)
+            
+            binarySecurityToken, timestamp = request_elements()
+            security.append(binarySecurityToken)
+            security.append(timestamp)
 
-        utc = pytz.UTC
-        created = datetime.now(utc)
-        expired = created + timedelta(seconds=1 * 60)
-
-        timestamp = utils.WSU('Timestamp')
-        timestamp.append(utils.WSU('Created', created.replace(microsecond=0).isoformat()+'Z'))
-        timestamp.append(utils.WSU('Expires', expired.replace(microsecond=0).isoformat()+'Z'))
-
-        security.append(timestamp)
-
-        super().apply(envelope, headers)
+            super().apply(envelope, headers)
         return envelope, headers
 
-# Override response verification and skip response verification for now...
-# Zeep does not supprt Signature verification with different certificate...
+# Override response verification: zeep verifies with our own certificate, but
+# Comcorp signs with theirs, so check against the trust store instead.
 # Ref. https://github.com/mvantellingen/python-zeep/pull/822/  "Add support for different signing and verification certificates #822"
     def verify(self, envelope):
+        signature = find_signature(envelope)
+        if signature is None:
+            if REQUIRE_SIGNATURE:
+                raise SignatureVerificationFailed("No Signature element found in the response")
+            return envelope
+
+        # The signature covers the plaintext Body, so decrypt it first
+        if envelope.find(ANY_ENCRYPTED_KEY_PATH) is not None:
+            decrypt_element(envelope, PRIVATE_KEY_FILE)
+
+        verify_envelope(envelope, signature)
         return envelope
\ No newline at end of file
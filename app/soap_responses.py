@@ -0,0 +1,181 @@
+"""
+Pre-serialized ProviderResponseService responses.
+
+A callback is answered with one of two acks (Value true or false) or with a
+SecureX fault. The envelopes are built with lxml once, at import, and kept
+as serialized bytes; the ack without a security header is returned as is.
+Where a response carries variable content (the fault code and errors, and
+the wsu:Id, Created and Expires of the wsse:Security header), the
+serialization holds a slot that is filled with escaped text when the
+response is rendered, so no tree is built or serialized per callback.
+"""
+import os
+import re
+
+from lxml import etree
+
+from app.constants import DS_NS, ENC_NS, SOAP_NS, WSSE_NS, WSU_NS
+from app.wsse_header import RESPONSE_TIMESTAMP_LIFETIME, response_security, timestamps
+from app.xml import ID_ATTR, get_unique_id
+
+# Set to 1 to add a wsse:Security header (with a Timestamp) to the acks too
+ACK_SECURITY_HEADER = os.getenv('PROVIDER_ACK_SECURITY_HEADER', '0') == '1'
+
+MIMETYPE = 'application/soap+xml'
+NSMAP = {
+    'soap': SOAP_NS,
+    'wsu': WSU_NS,
+    'wsse': WSSE_NS,
+    'ds': DS_NS,
+    'xenc': ENC_NS
+}
+VALUE = "{http://SecureX.ProviderSubmitService/V1}Value"
+SECUREX_FAULT = "{http://SecureX.Fault/V1}SecureXFault"
+
+MARKER = '@@response:%s@@'
+_SLOT = re.compile(rb'@@response:(\w+)@@')
+# Characters XML 1.0 does not allow; lxml refuses them, they are replaced here
+_INVALID_XML = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+
+class ByteTemplate:
+    """
+    A serialized document with named slots.
+
+    Args:
+        xml: The document serialized with ``MARKER % name`` in place of
+             each slot
+    """
+
+    __slots__ = ('parts',)
+
+    def __init__(self, xml):
+        parts = _SLOT.split(xml)
+        parts[1::2] = [name.decode('ascii') for name in parts[1::2]]
+        self.parts = tuple(parts)
+
+    def render(self, values):
+        """
+        Fill in the slots.
+
+        Args:
+            values: The escaped bytes of every slot, keyed on name
+
+        Returns:
+            The document bytes
+        """
+        if len(self.parts) == 1:
+            return self.parts[0]
+        parts = list(self.parts)
+        parts[1::2] = [values[name] for name in parts[1::2]]
+        return b''.join(parts)
+
+
+def escape(value):
+    """
+    Serialize a value as XML text content, the way lxml would.
+
+    Args:
+        value: Any value; it is converted with str()
+
+    Returns:
+        The escaped UTF-8 bytes
+    """
+    text = _INVALID_XML.sub('\ufffd', str(value))
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+    return text.encode('utf-8')
+
+
+def _envelope(security):
+    """Build an envelope (with a marked Security header if requested); return it and its Body."""
+    envelope = etree.Element(f"{{{SOAP_NS}}}Envelope", nsmap=NSMAP)
+    if security:
+        header = etree.SubElement(envelope, f"{{{SOAP_NS}}}Header")
+        header.append(response_security())
+        timestamp = header[0][0]
+        timestamp.set(ID_ATTR, MARKER % 'id')
+        timestamp[0].text = MARKER % 'created'
+        timestamp[1].text = MARKER % 'expires'
+    body = etree.SubElement(envelope, f"{{{SOAP_NS}}}Body")
+    return envelope, body
+
+
+def _template(envelope):
+    return ByteTemplate(etree.tostring(envelope, encoding='utf-8', xml_declaration=True))
+
+
+def _ack_template(success, security):
+    envelope, body = _envelope(security)
+    etree.SubElement(body, VALUE).text = "true" if success else "false"
+    return _template(envelope)
+
+
+def _fault_template(security):
+    envelope, body = _envelope(security)
+    fault = etree.SubElement(body, f"{{{SOAP_NS}}}Fault")
+    etree.SubElement(fault, "Code").text = MARKER % 'code'
+    detail = etree.SubElement(fault, "Detail")
+    securex_fault = etree.SubElement(detail, SECUREX_FAULT)
+    etree.SubElement(securex_fault, "Code").text = MARKER % 'code'
+    # The Errors element is rendered whole, so an empty list gives <Errors/>
+    securex_fault[-1].tail = MARKER % 'errors'
+    return _template(envelope)
+
+
+# The ack templates, keyed on (success, security header)
+ACKS = {(success, security): _ack_template(success, security)
+        for success in (True, False) for security in (False, True)}
+# The fault templates, keyed on whether they have a security header
+FAULTS = {security: _fault_template(security) for security in (False, True)}
+
+
+def render(template, security, **values):
+    """
+    Render a response template.
+
+    Args:
+        template: A ByteTemplate of ACKS or FAULTS
+        security: Whether the template has a Security header to fill in
+        **values: The escaped bytes of the other slots
+
+    Returns:
+        The response bytes
+    """
+    if security:
+        created, expires = timestamps(RESPONSE_TIMESTAMP_LIFETIME)
+        values.update(id=get_unique_id().encode('ascii'),
+                      created=created.encode('ascii'), expires=expires.encode('ascii'))
+    return template.render(values)
+
+
+def ack(success, security=ACK_SECURITY_HEADER):
+    """
+    Render the response to a Submit callback.
+
+    Args:
+        success: Whether the callback was processed
+        security: Whether to add a wsse:Security header
+
+    Returns:
+        The serialized envelope with the Value true or false
+    """
+    return render(ACKS[bool(success), security], security)
+
+
+def fault(code, errors, security=True):
+    """
+    Render a SecureX fault response.
+
+    Args:
+        code: The fault code
+        errors: A list of error messages
+        security: Whether to add a wsse:Security header
+
+    Returns:
+        The serialized fault envelope
+    """
+    if errors:
+        errors_xml = b''.join([b'<Errors>', *(b'<string>' + escape(error) + b'</string>' for error in errors), b'</Errors>'])
+    else:
+        errors_xml = b'<Errors/>'
+    return render(FAULTS[security], security, code=escape(code), errors=errors_xml)
@@ -0,0 +1,167 @@
+"""
+Streaming ingestion of ProviderResponseService callbacks.
+
+IDXProviderSubmitMessage callbacks carry bank statement transactions and
+base64 statement images that can run to many megabytes. Instead of reading the
+whole request into memory and building the full tree, ``ingest`` runs
+``lxml.etree.iterparse`` over the request stream, counts transactions as they
+are parsed and clears them straight away, and decodes statement images into the
+blob store (app/blob_store.py). Peak memory is bounded by the largest single element, not by the length
+of the statement.
+
+Other message types, encrypted bodies (which must be decrypted as a whole) and
+signed messages (whose signature covers the whole Body) are parsed as a
+complete tree and handed back to the caller.
+"""
+import logging
+import os
+
+from lxml import etree
+
+from app.blob_store import store_base64
+from app.constants import IDX_NS
+from app.xpaths import BODY, HEADER, SIGNATURE_PATH, STATEMENT_DATE_FROM_PATH, STATEMENT_DATE_TO_PATH
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to ingest ProviderResponseService callbacks from the request stream
+STREAMING_INGEST = os.getenv('PROVIDER_STREAMING_INGEST', '0') == '1'
+
+TRANSACTION_TAG = f"{{{IDX_NS}}}Transaction"
+STATEMENT_DATA_TAG = f"{{{IDX_NS}}}StatementData"
+STATEMENT_IMAGE_TAG = f"{{{IDX_NS}}}StatementImage"
+NO_HEADER_ERROR = "No Header element found in the request"
+ACCOUNT_TAGS = {
+    f"{{{IDX_NS}}}AccountName": 'account_name',
+    f"{{{IDX_NS}}}AccountNumber": 'account_number',
+    f"{{{IDX_NS}}}AccountType": 'account_type',
+}
+
+
+class StreamedIdxMessage:
+    """
+    What was extracted from an IDXProviderSubmitMessage while streaming it.
+
+    Attributes:
+        account_name, account_number, account_type: Account fields (or None)
+        statements: A list of (date_from, date_to, transaction_count) tuples
+        images: BlobRefs of the decoded statement images
+        security_error: Why the security header was rejected, or None
+    """
+
+    def __init__(self):
+        self.account_name = None
+        self.account_number = None
+        self.account_type = None
+        self.statements = []
+        self.images = []
+        self.security_error = None
+
+    @property
+    def transaction_count(self):
+        return sum(count for _, _, count in self.statements)
+
+
+def _discard(elem):
+    """Clear a processed element and drop the already-processed siblings before it."""
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _rejected(streamed, error_message):
+    """Mark ``streamed`` (created if None) as rejected by the security checks."""
+    if streamed is None:
+        streamed = StreamedIdxMessage()
+    streamed.security_error = error_message
+    return streamed
+
+
+def ingest(source, verify_security):
+    """
+    Parse a SOAP envelope incrementally from ``source``.
+
+    Args:
+        source: A file-like object (e.g. the WSGI input stream)
+        verify_security: Called with the envelope once the SOAP Header has
+            been parsed; returns a tuple (success, error_message). An envelope
+            without a Header is rejected without calling it.
+
+    Returns:
+        A tuple (envelope, message). ``message`` is a StreamedIdxMessage when
+        the body was an IDXProviderSubmitMessage that has been processed while
+        streaming (its transactions and images are no longer in ``envelope``),
+        or when the security checks rejected the envelope (``security_error``
+        is set). Otherwise ``message`` is None and ``envelope`` is the
+        complete tree.
+    """
+    context = etree.iterparse(
+        source,
+        events=('start', 'end'),
+        huge_tree=True,
+        resolve_entities=False,
+        no_network=True,
+    )
+
+    body = None
+    message = None
+    streamed = None
+    header_seen = False
+    signed = False
+    statement_count = 0
+
+    for event, elem in context:
+        if event == 'start':
+            if elem.tag == BODY:
+                body = elem
+                if not header_seen:
+                    # Nothing was verified; reject instead of streaming the Body
+                    logger.error(f"Security verification failed: {NO_HEADER_ERROR}")
+                    streamed = _rejected(streamed, NO_HEADER_ERROR)
+            elif message is None and body is not None and elem.getparent() is body:
+                message = elem
+                if streamed is None and not signed and "IDXProviderSubmitMessage" in etree.QName(elem).localname:
+                    streamed = StreamedIdxMessage()
+            continue
+
+        if elem.tag == HEADER:
+            header_seen = True
+            # The signature is verified over the complete Body, so keep it
+            envelope = elem.getparent()
+            signed = envelope.find(SIGNATURE_PATH) is not None
+            success, error_message = verify_security(envelope)
+            if not success:
+                # Keep parsing the complete tree; the caller rejects it anyway
+                logger.error(f"Security verification failed: {error_message}")
+                streamed = _rejected(streamed, error_message)
+            continue
+
+        if streamed is None or streamed.security_error:
+            continue
+
+        if elem.tag == TRANSACTION_TAG:
+            statement_count += 1
+            _discard(elem)
+        elif elem.tag == STATEMENT_DATA_TAG:
+            date_from = elem.find(STATEMENT_DATE_FROM_PATH)
+            date_to = elem.find(STATEMENT_DATE_TO_PATH)
+            streamed.statements.append((
+                date_from.text if date_from is not None else None,
+                date_to.text if date_to is not None else None,
+                statement_count,
+            ))
+            statement_count = 0
+            _discard(elem)
+        elif elem.tag == STATEMENT_IMAGE_TAG:
+            streamed.images.append(store_base64(elem.text))
+            _discard(elem)
+        elif elem.tag in ACCOUNT_TAGS and getattr(streamed, ACCOUNT_TAGS[elem.tag]) is None:
+            setattr(streamed, ACCOUNT_TAGS[elem.tag], elem.text)
+
+    if not header_seen and body is None:
+        logger.error(f"Security verification failed: {NO_HEADER_ERROR}")
+        streamed = _rejected(streamed, NO_HEADER_ERROR)
+
+    return context.root, streamed
@@ -0,0 +1,177 @@
+"""
+WS-Security signature verification against the trusted Comcorp certificates.
+
+The trusted certificates (``TRUSTED_CERT_FILES``, by default the production
+and UAT Comcorp certificates in ``certs/``) are loaded once per process
+through the key store and indexed by the SHA-256 fingerprint of their DER
+encoding. The certificate a message was signed with is identified by
+fingerprinting its BinarySecurityToken (or ds:X509Certificate), so a token
+seen before is matched with a dictionary lookup instead of being parsed, and
+a signing certificate different from the one we encrypt to is supported.
+Certificates that are not in the trust store are rejected.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import threading
+
+from lxml import etree
+import xmlsec
+from zeep.exceptions import SignatureVerificationFailed
+
+from app.constants import WSU_NS
+from app.key_store import get_certificate
+from app.xml import ns
+from app.xpaths import (BINARY_SECURITY_TOKEN, KEY_INFO, SIGNATURE_PATH, SIGNED_REFERENCES_PATH,
+                        TOKEN_REFERENCE_PATH, X509_CERTIFICATE_PATH, IdIndex)
+
+logger = logging.getLogger(__name__)
+
+# Comma separated PEM certificates whose signatures are accepted
+TRUSTED_CERT_FILES = os.getenv(
+    'TRUSTED_CERT_FILES', '../certs/comcorp.cer,../certs/comcorp_uat.crt').split(',')
+# Set to 1 to reject messages that are not signed
+REQUIRE_SIGNATURE = os.getenv('REQUIRE_SIGNATURE', '0') == '1'
+
+WSU_ID = ns(WSU_NS, 'Id')
+
+_anchors = ()
+_by_fingerprint = {}
+_index_lock = threading.Lock()
+
+
+def trusted_certificates():
+    """
+    Return the trusted certificates, indexed by fingerprint.
+
+    The key store reloads a certificate file when it changes; the index is
+    rebuilt whenever that happens.
+
+    Returns:
+        A dict mapping SHA-256 hex fingerprints to CertificateMaterial
+    """
+    global _anchors, _by_fingerprint
+    anchors = tuple(get_certificate(path.strip()) for path in TRUSTED_CERT_FILES if path.strip())
+    if anchors != _anchors:
+        with _index_lock:
+            _by_fingerprint = {cert.fingerprint: cert for cert in anchors}
+            _anchors = anchors
+    return _by_fingerprint
+
+
+def fingerprint(token_text):
+    """Return the SHA-256 hex fingerprint of a base64 DER certificate."""
+    return hashlib.sha256(base64.b64decode(''.join(token_text.split()))).hexdigest()
+
+
+def find_signature(envelope):
+    """Return the ds:Signature of the envelope's Security header, or None."""
+    return envelope.find(SIGNATURE_PATH)
+
+
+def _token_text(envelope, signature):
+    """Find the base64 certificate the signature's KeyInfo points at, if any."""
+    key_info = signature.find(KEY_INFO)
+    if key_info is None:
+        return None
+
+    certificate = key_info.find(X509_CERTIFICATE_PATH)
+    if certificate is not None:
+        return certificate.text
+
+    reference = key_info.find(TOKEN_REFERENCE_PATH)
+    if reference is not None and (reference.get('URI') or '').startswith('#'):
+        token_id = reference.get('URI')[1:]
+        for token in signature.getparent().iter(BINARY_SECURITY_TOKEN):
+            if token.get(WSU_ID) == token_id or token.get('Id') == token_id:
+                return token.text
+    return None
+
+
+def signing_certificates(envelope, signature):
+    """
+    Return the trusted certificates that may have produced ``signature``.
+
+    Args:
+        envelope: The SOAP envelope
+        signature: Its ds:Signature element
+
+    Returns:
+        A list of CertificateMaterial: the referenced certificate, or every
+        trusted certificate when the signature does not reference one
+
+    Raises:
+        SignatureVerificationFailed: if the referenced certificate is not trusted
+    """
+    trusted = trusted_certificates()
+    token_text = _token_text(envelope, signature)
+    if token_text is None:
+        return list(trusted.values())
+    try:
+        cert = trusted.get(fingerprint(token_text))
+    except (binascii.Error, ValueError):
+        raise SignatureVerificationFailed("Malformed signing certificate")
+    if cert is None:
+        raise SignatureVerificationFailed("Signing certificate is not trusted")
+    return [cert]
+
+
+def _register_references(ctx, envelope, signature):
+    """Register the ID attribute of every signed element; return the signed elements."""
+    signed = []
+    ids = IdIndex(envelope)
+    for ref in signature.iterfind(SIGNED_REFERENCES_PATH):
+        uri = ref.get('URI') or ''
+        if not uri.startswith('#'):
+            raise SignatureVerificationFailed(f"Unsupported reference URI: {uri}")
+        referenced_id = uri[1:]
+        matches = ids.get_all(referenced_id)
+        if len(matches) != 1:
+            raise SignatureVerificationFailed(f"Reference {uri} matches {len(matches)} elements")
+        target = matches[0]
+        if target.get(WSU_ID) == referenced_id:
+            ctx.register_id(target, 'Id', WSU_NS)
+        else:
+            ctx.register_id(target, 'Id')
+        signed.append(target)
+    return signed
+
+
+def verify_envelope(envelope, signature=None):
+    """
+    Verify the WS-Security signature of a (decrypted) SOAP envelope.
+
+    The signature must cover the SOAP Body and verify with a trusted
+    certificate.
+
+    Args:
+        envelope: The SOAP envelope as an lxml Element
+        signature: Its ds:Signature element, if already found
+
+    Returns:
+        The CertificateMaterial the envelope was signed with
+
+    Raises:
+        SignatureVerificationFailed: if the signature is missing or invalid
+    """
+    if signature is None:
+        signature = find_signature(envelope)
+    if signature is None:
+        raise SignatureVerificationFailed("No Signature element found")
+
+    candidates = signing_certificates(envelope, signature)
+    for cert in candidates:
+        ctx = xmlsec.SignatureContext()
+        signed = _register_references(ctx, envelope, signature)
+        if not any(etree.QName(elem).localname == 'Body' and elem.getparent() is envelope for elem in signed):
+            raise SignatureVerificationFailed("The SOAP Body is not signed")
+        ctx.key = cert.key
+        try:
+            ctx.verify(signature)
+        except xmlsec.Error:
+            continue
+        logger.info("Signature verified with %s", cert.path)
+        return cert
+    raise SignatureVerificationFailed("Signature does not verify with a trusted certificate")
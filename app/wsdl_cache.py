@@ -0,0 +1,213 @@
+"""
+On-disk cache of parsed WSDL documents.
+
+Parsing a WSDL and its imported XSDs into zeep's type registry is the most
+expensive part of starting a worker, and with ``workers = cpu_count*2+1`` every
+gunicorn worker used to pay it again. This module pickles the parsed
+``zeep.wsdl.Document`` to a cache file keyed on the content hash of the WSDL
+directory (and the zeep version), so workers load the type registry instead of
+re-parsing it. Loaded documents are also kept in memory per process, so with
+gunicorn ``preload_app`` the master loads them once and the workers share
+them copy-on-write.
+
+Run ``python -m app.wsdl_cache`` at build time to populate the cache.
+"""
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+import threading
+from pathlib import Path
+
+from lxml import etree
+import zeep
+from zeep.settings import Settings
+from zeep.transports import Transport
+from zeep.wsdl import Document
+
+from app.constants import REQUESTING_MEMBER_WSDL, PROVIDER_RESPONSE_WSDL
+from app.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+WSDL_CACHE_DIR = Path(os.getenv('WSDL_CACHE_DIR', '.wsdl_cache'))
+# Set to 0 to always parse the WSDL documents
+WSDL_CACHE_ENABLED = os.getenv('WSDL_CACHE_ENABLED', '1') != '0'
+
+# zeep builds a class per XSD type at parse time; these are not importable
+# so they have to be rebuilt from their name, bases and attributes.
+DYNAMIC_MODULES = ('zeep.xsd.dynamic_types', 'zeep.objects')
+
+
+def _rebuild_class(name, bases, attributes):
+    return type(name, bases, attributes)
+
+
+class _DocumentPickler(pickle.Pickler):
+    """Pickler that detaches the transport and settings and handles lxml/zeep types."""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Settings):
+            return 'settings'
+        if isinstance(obj, Transport):
+            return 'transport'
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, etree.QName):
+            return etree.QName, (obj.text,)
+        if isinstance(obj, etree._Element):
+            return etree.fromstring, (etree.tostring(obj),)
+        if isinstance(obj, type) and obj.__module__ in DYNAMIC_MODULES:
+            attributes = {
+                key: value for key, value in vars(obj).items()
+                if key not in ('__dict__', '__weakref__', '__doc__')
+            }
+            return _rebuild_class, (obj.__name__, obj.__bases__, attributes)
+        return NotImplemented
+
+
+class _DocumentUnpickler(pickle.Unpickler):
+    """Unpickler that re-attaches the given transport and settings."""
+
+    def __init__(self, file, transport, settings):
+        super().__init__(file)
+        self._persistent = {'transport': transport, 'settings': settings}
+
+    def persistent_load(self, pid):
+        return self._persistent[pid]
+
+
+def wsdl_hash(wsdl_path):
+    """
+    Hash the WSDL and every WSDL/XSD file next to it.
+
+    Imported schemas are resolved relative to the WSDL, so a change to any of
+    them must invalidate the cache.
+
+    Args:
+        wsdl_path: Path to the WSDL file
+
+    Returns:
+        The hex digest identifying this version of the WSDL
+    """
+    wsdl_path = Path(wsdl_path)
+    digest = hashlib.sha256(zeep.__version__.encode())
+    digest.update(f'{sys.version_info[0]}.{sys.version_info[1]}'.encode())
+    digest.update(wsdl_path.name.encode())
+    digest.update(wsdl_path.read_bytes())
+    for path in sorted(wsdl_path.resolve().parent.iterdir()):
+        if path.suffix.lower() in ('.wsdl', '.xsd') and path.name != wsdl_path.name:
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def cache_path(wsdl_path):
+    """Return the cache file for the current content of ``wsdl_path``."""
+    return WSDL_CACHE_DIR / f'{Path(wsdl_path).stem}-{wsdl_hash(wsdl_path)[:16]}.pickle'
+
+
+def dump_document(document, path):
+    """Pickle a parsed Document to ``path`` atomically."""
+    buffer = io.BytesIO()
+    _DocumentPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(document)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def load_cached_document(path, transport, settings):
+    """Load a pickled Document from ``path``, attaching transport and settings."""
+    with open(path, 'rb') as fh:
+        return _DocumentUnpickler(fh, transport, settings).load()
+
+
+def build(wsdl_path, transport=None, settings=None):
+    """
+    Parse ``wsdl_path`` and write it to the cache.
+
+    Args:
+        wsdl_path: Path to the WSDL file
+        transport: The zeep Transport to attach to the document
+        settings: The zeep Settings to parse with
+
+    Returns:
+        The parsed Document
+    """
+    transport = transport if transport is not None else Transport()
+    settings = settings or Settings()
+    document = Document(str(wsdl_path), transport, settings=settings)
+    if WSDL_CACHE_ENABLED:
+        path = cache_path(wsdl_path)
+        try:
+            dump_document(document, path)
+            logger.info(f"Cached WSDL {wsdl_path} in {path}")
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.warning(f"Could not cache WSDL {wsdl_path}: {str(e)}")
+    return document
+
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def load_document(wsdl_path, transport=None, settings=None):
+    """
+    Return the parsed Document for ``wsdl_path``.
+
+    Documents are kept in memory per process, then read from the cache file,
+    and only parsed (and cached) when neither is available. The transport is
+    only used to resolve imports while parsing; clients attach their own
+    transport for calls.
+
+    Args:
+        wsdl_path: Path to the WSDL file
+        transport: The zeep Transport to attach to the document
+        settings: The zeep Settings to parse with
+
+    Returns:
+        A zeep.wsdl.Document
+    """
+    key = str(wsdl_path)
+    document = _documents.get(key)
+    if document is not None:
+        return document
+
+    with _documents_lock:
+        document = _documents.get(key)
+        if document is not None:
+            return document
+
+        transport = transport if transport is not None else Transport()
+        settings = settings or Settings()
+        path = cache_path(wsdl_path) if WSDL_CACHE_ENABLED else None
+        if path is not None and path.exists():
+            try:
+                document = load_cached_document(path, transport, settings)
+                logger.info(f"Loaded WSDL {wsdl_path} from {path}")
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable WSDL cache {path}: {str(e)}")
+        if document is None:
+            document = build(wsdl_path, transport, settings)
+
+        _documents[key] = document
+        return document
+
+
+def main(argv=None):
+    """Populate the cache for the given WSDL files (default: both service WSDLs)."""
+    configure_logging()
+    paths = argv if argv else [REQUESTING_MEMBER_WSDL, f"wsdl/{PROVIDER_RESPONSE_WSDL}"]
+    for wsdl_path in paths:
+        if not Path(wsdl_path).exists():
+            logger.warning(f"Skipping missing WSDL {wsdl_path}")
+            continue
+        build(wsdl_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
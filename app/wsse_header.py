@@ -0,0 +1,106 @@
+"""
+WS-Security header elements for outbound requests and callback responses.
+
+Both the request signer (signature_service.BinarySignatureTimestamp) and the
+ProviderResponseService responses add a wsse:Security header with a
+wsu:Timestamp. The elements are built once here and deep-copied per message:
+the BinarySecurityToken text (the base64 of PUBLIC_KEY) is encoded once, and
+the Created/Expires texts are formatted once per second and lifetime, since
+they only have second resolution.
+
+The texts keep the format the services always sent, e.g.
+``2024-01-01T12:00:00+00:00Z``.
+"""
+import copy
+import time
+
+from lxml import etree
+from zeep.wsse import utils
+
+from app.constants import PUBLIC_KEY, SOAP_NS, WSSE_NS, WSU_NS
+from app.crypto_wsse import encode
+from app.xml import ensure_id
+
+# Lifetime of the Timestamp of signed outbound requests, in seconds
+REQUEST_TIMESTAMP_LIFETIME = 60
+# Lifetime of the Timestamp of ProviderResponseService responses, in seconds
+RESPONSE_TIMESTAMP_LIFETIME = 5 * 60
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00Z'
+
+ENCODED_PUBLIC_KEY = encode(PUBLIC_KEY)
+
+# lifetime -> (second, Created text, Expires text)
+_timestamps = {}
+
+
+def _request_elements():
+    token = utils.WSU('BinarySecurityToken', ENCODED_PUBLIC_KEY)
+    timestamp = utils.WSU('Timestamp')
+    timestamp.append(utils.WSU('Created'))
+    timestamp.append(utils.WSU('Expires'))
+    return token, timestamp
+
+
+def _response_security():
+    security = etree.Element(f"{{{WSSE_NS}}}Security", nsmap={'soap': SOAP_NS, 'wsse': WSSE_NS, 'wsu': WSU_NS})
+    security.set(f"{{{SOAP_NS}}}mustUnderstand", "1")
+    timestamp = etree.SubElement(security, f"{{{WSU_NS}}}Timestamp")
+    etree.SubElement(timestamp, f"{{{WSU_NS}}}Created")
+    etree.SubElement(timestamp, f"{{{WSU_NS}}}Expires")
+    return security
+
+
+_REQUEST_TOKEN, _REQUEST_TIMESTAMP = _request_elements()
+_RESPONSE_SECURITY = _response_security()
+
+
+def timestamps(lifetime):
+    """
+    Return the Created and Expires texts of a Timestamp created now.
+
+    Args:
+        lifetime: Seconds between Created and Expires
+
+    Returns:
+        A tuple (created, expires) of second-resolution UTC timestamps
+    """
+    second = int(time.time())
+    cached = _timestamps.get(lifetime)
+    if cached is None or cached[0] != second:
+        cached = _timestamps[lifetime] = (
+            second,
+            time.strftime(TIMESTAMP_FORMAT, time.gmtime(second)),
+            time.strftime(TIMESTAMP_FORMAT, time.gmtime(second + lifetime)),
+        )
+    return cached[1], cached[2]
+
+
+def _fill(timestamp, lifetime):
+    timestamp[0].text, timestamp[1].text = timestamps(lifetime)
+    return timestamp
+
+
+def request_elements():
+    """
+    Build the elements the signer adds to the wsse:Security header of a request.
+
+    Returns:
+        A tuple (BinarySecurityToken, Timestamp) of new elements
+    """
+    return (copy.deepcopy(_REQUEST_TOKEN),
+            _fill(copy.deepcopy(_REQUEST_TIMESTAMP), REQUEST_TIMESTAMP_LIFETIME))
+
+
+def response_security():
+    """
+    Build the wsse:Security header of a ProviderResponseService response.
+
+    Returns:
+        A new Security element (soap:mustUnderstand="1") holding a Timestamp
+        with a unique wsu:Id
+    """
+    security = copy.deepcopy(_RESPONSE_SECURITY)
+    timestamp = _fill(security[0], RESPONSE_TIMESTAMP_LIFETIME)
+    ensure_id(timestamp)
+    return security
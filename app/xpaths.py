@@ -0,0 +1,86 @@
+"""
+Precompiled XPath expressions and element paths for SOAP envelopes.
+
+The paths into the WS-Security header are built once here instead of being
+formatted on every call, and the XPath expressions are compiled once per
+process (their parameters are XPath variables, never formatted into the
+expression).
+
+IdIndex maps the Id and wsu:Id attributes of a document to their elements in
+a single pass, so resolving the N references of a ReferenceList or SignedInfo
+costs one scan of the document instead of N.
+"""
+from lxml import etree
+
+from app.constants import SOAP_NS, WSSE_NS, WSU_NS, DS_NS, ENC_NS, IDX_NS
+from app.xml import ns, ID_ATTR
+
+NAMESPACES = {'soap': SOAP_NS, 'wsse': WSSE_NS, 'wsu': WSU_NS, 'ds': DS_NS, 'enc': ENC_NS}
+
+HEADER = ns(SOAP_NS, 'Header')
+BODY = ns(SOAP_NS, 'Body')
+SECURITY = ns(WSSE_NS, 'Security')
+ENCRYPTED_KEY = ns(ENC_NS, 'EncryptedKey')
+ENCRYPTED_DATA = ns(ENC_NS, 'EncryptedData')
+REFERENCE_LIST = ns(ENC_NS, 'ReferenceList')
+SIGNATURE = ns(DS_NS, 'Signature')
+KEY_INFO = ns(DS_NS, 'KeyInfo')
+BINARY_SECURITY_TOKEN = ns(WSSE_NS, 'BinarySecurityToken')
+
+# ElementPath, relative to the soap:Envelope
+SECURITY_PATH = f"{HEADER}/{SECURITY}"
+ENCRYPTED_KEY_PATH = f"{SECURITY_PATH}/{ENCRYPTED_KEY}"
+SIGNATURE_PATH = f"{SECURITY_PATH}/{SIGNATURE}"
+ANY_ENCRYPTED_KEY_PATH = f".//{ENCRYPTED_KEY}"
+# ElementPath, relative to a ds:Signature (or its KeyInfo)
+SIGNED_REFERENCES_PATH = f"{ns(DS_NS, 'SignedInfo')}/{ns(DS_NS, 'Reference')}"
+X509_CERTIFICATE_PATH = f"{ns(DS_NS, 'X509Data')}/{ns(DS_NS, 'X509Certificate')}"
+TOKEN_REFERENCE_PATH = f"{ns(WSSE_NS, 'SecurityTokenReference')}/{ns(WSSE_NS, 'Reference')}"
+# ElementPath, relative to an IDX StatementData
+STATEMENT_DATE_FROM_PATH = f".//{ns(IDX_NS, 'DateFrom')}"
+STATEMENT_DATE_TO_PATH = f".//{ns(IDX_NS, 'DateTo')}"
+
+# Every element with an Id or wsu:Id attribute
+ID_ELEMENTS = etree.XPath('//*[@Id or @wsu:Id]', namespaces=NAMESPACES)
+
+
+class IdIndex:
+    """
+    The elements of a document by their Id and wsu:Id attributes.
+
+    Built with one scan of the document; elements added to the document
+    afterwards (e.g. by decryption) are not in the index.
+
+    Args:
+        doc: Any element of the document to index
+    """
+
+    def __init__(self, doc):
+        self._elements = {}
+        for elem in ID_ELEMENTS(doc):
+            for value in {elem.get('Id'), elem.get(ID_ATTR)}:
+                if value:
+                    self._elements.setdefault(value, []).append(elem)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def get_all(self, id_value):
+        """Return the list of elements with the given Id or wsu:Id."""
+        return self._elements.get(id_value, [])
+
+    def get(self, id_value, tag=None):
+        """
+        Return the first element with the given Id or wsu:Id.
+
+        Args:
+            id_value: The Id (without '#')
+            tag: Only consider elements with this tag
+
+        Returns:
+            The element, or None
+        """
+        for elem in self._elements.get(id_value, ()):
+            if tag is None or elem.tag == tag:
+                return elem
+        return None
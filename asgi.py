@@ -0,0 +1,4 @@
+from app import app
+from app.async_download_service import create_asgi_app
+
+application = create_asgi_app(app)
@@ -0,0 +1,122 @@
+"""
+Requests/sec of /comcorp-download-request with and without the pooled zeep client.
+
+Starts a local stand-in for the Comcorp endpoint, then runs gunicorn with
+``config/gunicorn_config.py`` twice - once with ``COMCORP_CLIENT_POOLING=0``
+(a new client per request, the old behaviour) and once with pooling enabled -
+and drives the endpoint at the given concurrency.
+
+Run it from the directory the app is normally started from (the one holding
+the WSDL files), e.g.:
+
+    python benchmarks/bench_client_pool.py --requests 200 --concurrency 8
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(ROOT, 'config', 'gunicorn_config.py')
+
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import start_stub  # noqa: E402
+
+PAYLOAD = {
+    "AccountNumber": "1234567890",
+    "AccountType": "Current",
+    "BranchCode": "250655",
+    "DateFrom": "2024-01-01",
+    "DateTo": "2024-03-31",
+    "EmailAddress": "test@example.com",
+    "JointAccount": "false",
+    "PhysicalEntities": [
+        {"IdentificationNo": "8001015009087", "IdentificationType": "SAID",
+         "Initials": "J", "Name": "Doe"}
+    ]
+}
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def drive(url, total, concurrency, auth):
+    body = json.dumps(PAYLOAD).encode()
+    headers = {'Content-Type': 'application/json', 'Authorization': auth}
+
+    def one(_):
+        req = urllib.request.Request(url, data=body, headers=headers, method='POST')
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def run(pooling, args):
+    env = dict(os.environ,
+               COMCORP_CLIENT_POOLING='1' if pooling else '0',
+               COMCORP_SERVICE_ADDRESS=f'http://127.0.0.1:{args.stub_port}/',
+               BASIC_AUTH_USERNAME='bench',
+               BASIC_AUTH_PASSWORD='bench',
+               PYTHONPATH=ROOT)
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG,
+           '--bind', f'127.0.0.1:{args.port}', '--pid', os.path.join(tempfile.gettempdir(), 'bench_gunicorn.pid'),
+           'wsgi:app']
+    if args.workers:
+        cmd[5:5] = ['--workers', str(args.workers)]
+    proc = subprocess.Popen(cmd, env=env)
+    try:
+        base = f'http://127.0.0.1:{args.port}'
+        wait_for(base + '/health')
+        auth = 'Basic ' + base64.b64encode(b'bench:bench').decode()
+        url = base + '/comcorp-download-request'
+        drive(url, args.concurrency * 2, args.concurrency, auth)  # warm up every worker
+        return drive(url, args.requests, args.concurrency, auth)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='override the gunicorn worker count')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stub-port', type=int, default=8766)
+    parser.add_argument('--wsdl', default='RequestingMemberSubmitService.wsdl')
+    args = parser.parse_args()
+
+    start_stub(args.stub_port, args.wsdl)
+    before = run(False, args)
+    after = run(True, args)
+    print(json.dumps({
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'per_request_client_rps': round(before, 1),
+        'pooled_client_rps': round(after, 1),
+        'speedup': round(after / before, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
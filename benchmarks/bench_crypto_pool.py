@@ -0,0 +1,61 @@
+"""
+Inbound decryption throughput, inline vs the crypto process pool.
+
+Encrypts synthetic IDX callbacks to a locally generated test key, then
+decrypts them from ``--threads`` concurrent request threads (as gthread
+workers would), first inline and then through app.crypto_pool.
+
+    python benchmarks/bench_crypto_pool.py --items 20000 --processes 4 --threads 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crypto_pool, crypto_wsse  # noqa: E402
+from benchmarks.envelopes import build_envelope  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+
+def throughput(decrypt, envelope, messages, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for result in executor.map(lambda _: decrypt(envelope), range(messages)):
+            assert b'EncryptedData' not in result
+    return messages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=20000, help='transactions per message')
+    parser.add_argument('--messages', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    keyfile, certfile = generate_keypair()
+    envelope = crypto_wsse.encrypt(build_envelope('idx', items=args.items), certfile)
+
+    crypto_pool.CRYPTO_POOL_PROCESSES = args.processes
+    crypto_pool.CRYPTO_POOL_MIN_BYTES = 0
+    crypto_pool.get_pool(args.processes, keyfile)
+    # Warm up every pool process (key loading happens in the initializer)
+    throughput(lambda data: crypto_pool.decrypt(data, keyfile), envelope, args.processes, args.processes)
+
+    results = {
+        'envelope_bytes': len(envelope),
+        'inline_msgs_per_s': throughput(
+            lambda data: crypto_wsse.decrypt(data, keyfile), envelope, args.messages, args.threads),
+        'pool_msgs_per_s': throughput(
+            lambda data: crypto_pool.decrypt(data, keyfile), envelope, args.messages, args.threads),
+    }
+    crypto_pool.shutdown()
+    print(json.dumps({k: round(v, 1) for k, v in results.items()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Encrypt/decrypt microbenchmark for app.crypto_wsse.
+
+Compares a cold key store (cert/key file read and PEM parsed on every call,
+which is what every call used to do) with the process-wide key store.
+
+    python benchmarks/bench_crypto_wsse.py --iterations 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crypto_wsse, key_store  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+ENVELOPE = b'''<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"
+    xmlns:wsse="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd">
+  <soap:Header><wsse:Security/></soap:Header>
+  <soap:Body>
+    <IDXConsumerSubmitMessage xmlns="http://IDX.Contract/V1">
+      <AccountNumber>1234567890</AccountNumber>
+      <AccountType>Current</AccountType>
+      <BranchCode>250655</BranchCode>
+    </IDXConsumerSubmitMessage>
+  </soap:Body>
+</soap:Envelope>'''
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    keyfile, certfile = generate_keypair()
+    encrypted = crypto_wsse.encrypt(ENVELOPE, certfile)
+
+    def cold(fn):
+        def run():
+            key_store.clear()
+            fn()
+        return run
+
+    def encrypt():
+        crypto_wsse.encrypt(ENVELOPE, certfile)
+
+    def decrypt():
+        crypto_wsse.decrypt(encrypted, keyfile)
+
+    results = {
+        'encrypt_cold_us': timed(cold(encrypt), args.iterations),
+        'encrypt_cached_us': timed(encrypt, args.iterations),
+        'decrypt_cold_us': timed(cold(decrypt), args.iterations),
+        'decrypt_cached_us': timed(decrypt, args.iterations),
+    }
+    print(json.dumps({k: round(v, 1) for k, v in results.items()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
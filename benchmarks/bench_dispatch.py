@@ -0,0 +1,47 @@
+"""
+Parse + dispatch time per ProviderResponseService message.
+
+Replays envelopes for every message type through etree.fromstring and
+process_submit_request, with logging disabled so that only parsing, field
+extraction and dispatch are measured.
+
+    python benchmarks/bench_dispatch.py --items 1000 --iterations 50
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.provider_response_service import process_submit_request  # noqa: E402
+from benchmarks.envelopes import MESSAGE_TYPES, build_envelope  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = {}
+    for message_type in MESSAGE_TYPES:
+        envelope = build_envelope(message_type, items=args.items)
+        assert process_submit_request(etree.fromstring(envelope)), message_type
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            process_submit_request(etree.fromstring(envelope))
+        results[message_type] = {
+            'bytes': len(envelope),
+            'parse_dispatch_ms': round((time.perf_counter() - start) / args.iterations * 1000, 3),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
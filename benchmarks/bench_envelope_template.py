@@ -0,0 +1,87 @@
+"""
+Outbound Submit envelope build time: zeep rendering vs the envelope template.
+
+For payloads with 1 to 50 PhysicalEntities, times building the request
+envelope (before plugins and signing) the way zeep does it (getDecryptedBody,
+then the operation's serializer) and from the app.envelope_template skeleton,
+and checks that both produce the same XML.
+
+Run it from the directory the app is normally started from (the one holding
+the WSDL files), e.g.:
+
+    python benchmarks/bench_envelope_template.py --entities 1 10 50 --iterations 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zeep.wsdl.utils import etree_to_string  # noqa: E402
+from zeep.wsse.utils import get_security_header  # noqa: E402
+
+from app.client_service import create_client  # noqa: E402
+from app.object_service import getHeader, getDecryptedBody  # noqa: E402
+
+
+def payload(entities):
+    return {
+        'AccountNumber': '1234567890', 'AccountType': 'Current', 'BranchCode': '250655',
+        'DateFrom': '2024-01-01', 'DateTo': '2024-03-31', 'EmailAddress': 'test@example.com',
+        'JointAccount': 'false',
+        'PhysicalEntities': [
+            {'IdentificationNo': f'80010150{index:05d}', 'IdentificationType': 'SAID',
+             'Initials': 'J', 'Name': f'Entity {index}'}
+            for index in range(entities)
+        ],
+    }
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entities', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    client = create_client()
+    if client.template is None:
+        sys.exit('The envelope template is disabled or could not be built')
+    soap = client.soap
+    operation = client.template.operation
+    header = getHeader(soap)
+
+    def zeep_render(data):
+        envelope = operation.input.serialize(
+            getDecryptedBody(soap, data), _soapheaders={'Header': header}).content
+        get_security_header(envelope)
+        return envelope
+
+    def template_render(data):
+        return client.template.render(data, header).serialized.content
+
+    results = {}
+    for entities in args.entities:
+        data = payload(entities)
+        if etree_to_string(zeep_render(data)) != etree_to_string(template_render(data)):
+            sys.exit(f'Template rendering differs from zeep for {entities} entities')
+        zeep_us = timed(lambda: zeep_render(data), args.iterations)
+        template_us = timed(lambda: template_render(data), args.iterations)
+        results[entities] = {
+            'zeep_us': round(zeep_us, 1),
+            'template_us': round(template_us, 1),
+            'speedup': round(zeep_us / template_us, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
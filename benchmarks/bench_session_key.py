@@ -0,0 +1,58 @@
+"""
+CPU per encrypted message with and without session key reuse.
+
+Encrypts the same envelope with a new RSA-wrapped session key per message
+(the default) and with app.session_keys reuse windows of several sizes, and
+reports the process CPU time per message. Every encrypted message is checked
+to decrypt with the private key.
+
+    python benchmarks/bench_session_key.py --messages 500 --windows 10 100 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crypto_wsse, session_keys  # noqa: E402
+from benchmarks.bench_crypto_wsse import ENVELOPE  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+
+def cpu_per_message(certfile, messages):
+    """Encrypt ``messages`` envelopes; return (CPU microseconds per message, the envelopes)."""
+    session_keys.clear()
+    encrypted = []
+    start = time.process_time()
+    for _ in range(messages):
+        encrypted.append(crypto_wsse.encrypt(ENVELOPE, certfile))
+    return (time.process_time() - start) / messages * 1e6, encrypted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--windows', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--bits', type=int, default=2048, help='RSA key size of the certificate')
+    args = parser.parse_args()
+
+    keyfile, certfile = generate_keypair(bits=args.bits)
+    session_keys.SESSION_KEY_REUSE_SECONDS = session_keys.SESSION_KEY_MAX_SECONDS
+
+    results = {}
+    for window in [0] + args.windows:
+        session_keys.SESSION_KEY_REUSE_MESSAGES = min(window, session_keys.SESSION_KEY_MAX_MESSAGES)
+        cpu_us, encrypted = cpu_per_message(certfile, args.messages)
+        for message in (encrypted[0], encrypted[-1]):
+            crypto_wsse.decrypt(message, keyfile)
+        results['no_reuse' if window == 0 else f'reuse_{window}'] = {
+            'cpu_us_per_message': round(cpu_us, 1),
+            'rsa_wraps': -(-args.messages // window) if window else args.messages,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-message cost of WS-Security signature verification.
+
+Signs synthetic callbacks with a locally generated test key and measures
+app.trust_store.verify_envelope with the trust store warm, against a cold
+store (certificates re-read and re-parsed for every message) and against the
+parse alone, so the cost verification adds to callback latency is visible.
+
+    python benchmarks/bench_signature.py --items 1 1000 --iterations 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree  # noqa: E402
+from zeep.wsse.signature import BinarySignature  # noqa: E402
+
+from app import key_store, trust_store  # noqa: E402
+from benchmarks.envelopes import build_envelope  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 1000])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    keyfile, certfile = generate_keypair()
+    _, other_certfile = generate_keypair(name='other')
+    # A second trusted certificate, like the production/UAT pair
+    trust_store.TRUSTED_CERT_FILES = [other_certfile, certfile]
+
+    results = {}
+    for items in args.items:
+        envelope = etree.fromstring(build_envelope('idx', items=items))
+        BinarySignature(keyfile, certfile).apply(envelope, {})
+        data = etree.tostring(envelope)
+
+        def parse():
+            etree.fromstring(data)
+
+        def verify():
+            trust_store.verify_envelope(etree.fromstring(data))
+
+        def verify_cold():
+            key_store.clear()
+            trust_store.verify_envelope(etree.fromstring(data))
+
+        results[items] = {
+            'bytes': len(data),
+            'parse_us': round(timed(parse, args.iterations), 1),
+            'parse_verify_us': round(timed(verify, args.iterations), 1),
+            'parse_verify_cold_us': round(timed(verify_cold, args.iterations), 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
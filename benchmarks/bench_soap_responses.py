@@ -0,0 +1,88 @@
+"""
+ProviderResponseService response time: lxml trees vs app.soap_responses.
+
+Times producing the serialized ack and fault responses by building and
+serializing an lxml envelope per response (as the endpoint used to) and by
+rendering the pre-serialized templates, and checks both produce the same XML.
+
+Run it from the directory the app is normally started from (it reads the
+certificates from ../certs):
+
+    python benchmarks/bench_soap_responses.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import soap_responses  # noqa: E402
+from app.constants import SOAP_NS  # noqa: E402
+from app.wsse_header import response_security  # noqa: E402
+
+ERRORS = ['Signature does not verify with a trusted certificate & <the> envelope was rejected']
+
+
+def built(success=None, errors=None, security=False):
+    envelope = etree.Element(f"{{{SOAP_NS}}}Envelope", nsmap=soap_responses.NSMAP)
+    if security:
+        etree.SubElement(envelope, f"{{{SOAP_NS}}}Header").append(response_security())
+    body = etree.SubElement(envelope, f"{{{SOAP_NS}}}Body")
+    if errors is None:
+        etree.SubElement(body, soap_responses.VALUE).text = "true" if success else "false"
+    else:
+        fault = etree.SubElement(body, f"{{{SOAP_NS}}}Fault")
+        etree.SubElement(fault, "Code").text = '500'
+        detail = etree.SubElement(fault, "Detail")
+        securex_fault = etree.SubElement(detail, soap_responses.SECUREX_FAULT)
+        etree.SubElement(securex_fault, "Code").text = '500'
+        errors_elem = etree.SubElement(securex_fault, "Errors")
+        for error in errors:
+            etree.SubElement(errors_elem, "string").text = error
+    return etree.tostring(envelope, encoding='utf-8', xml_declaration=True)
+
+
+def normalized(xml):
+    """The XML without the per-message wsu:Id."""
+    return re.sub(rb'id-[0-9a-f-]+', b'id', xml)
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = {
+        'ack': (lambda: built(True), lambda: soap_responses.ack(True, security=False)),
+        'ack_security': (lambda: built(True, security=True), lambda: soap_responses.ack(True, security=True)),
+        'fault': (lambda: built(errors=ERRORS, security=True), lambda: soap_responses.fault(500, ERRORS)),
+        'fault_no_errors': (lambda: built(errors=[], security=True), lambda: soap_responses.fault(500, [])),
+    }
+    results = {}
+    for name, (tree, template) in cases.items():
+        if normalized(tree()) != normalized(template()):
+            sys.exit(f'The {name} responses differ')
+        tree_us = timed(tree, args.iterations)
+        template_us = timed(template, args.iterations)
+        results[name] = {
+            'tree_us': round(tree_us, 2),
+            'template_us': round(template_us, 2),
+            'speedup': round(tree_us / template_us, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Peak memory of a download response with debug XML: one string vs streamed.
+
+Builds a response envelope with many statement lines and encodes a download
+response carrying it in the debug field, once the way it was done before
+(pretty() into a string, then serialization.encode) and once streamed
+(debug_capture.iter_pretty through serialization.iter_chunks; envelopes below
+DEBUG_STREAM_MIN_ELEMENTS are pretty-printed in one piece). Reports the peak
+Python allocation (tracemalloc) and time of each, and checks that streaming
+produces the same text as pretty().
+
+    python benchmarks/bench_streaming.py --lines 1000 10000 50000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import debug_capture, serialization  # noqa: E402
+
+SOAP_NS = 'http://www.w3.org/2003/05/soap-envelope'
+IDX_NS = 'http://IDX.Contract/V1'
+
+
+def envelope(lines):
+    root = etree.Element(f'{{{SOAP_NS}}}Envelope', nsmap={'s': SOAP_NS})
+    body = etree.SubElement(root, f'{{{SOAP_NS}}}Body')
+    response = etree.SubElement(body, f'{{{IDX_NS}}}IDXConsumerResponse', nsmap={None: IDX_NS})
+    etree.SubElement(response, f'{{{IDX_NS}}}Status').text = 'OK'
+    statement = etree.SubElement(response, f'{{{IDX_NS}}}Transactions')
+    for index in range(lines):
+        line = etree.SubElement(statement, f'{{{IDX_NS}}}Transaction')
+        etree.SubElement(line, f'{{{IDX_NS}}}Date').text = '2024-01-%02d' % (index % 28 + 1)
+        etree.SubElement(line, f'{{{IDX_NS}}}Description').text = f'Payment {index} & transfer'
+        etree.SubElement(line, f'{{{IDX_NS}}}Amount').text = '%d.%02d' % (index, index % 100)
+    return root
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    results = {}
+    for lines in args.lines:
+        env = envelope(lines)
+
+        def whole():
+            return len(serialization.encode({'status': 'success', 'debug': {'response_xml': debug_capture.pretty(env)}}))
+
+        def streamed():
+            body = {'status': 'success',
+                    'debug': {'response_xml': serialization.StreamedText(debug_capture.iter_pretty(env))}}
+            return sum(len(chunk) for chunk in serialization.iter_chunks(body))
+
+        streamed_xml = ''.join(debug_capture.iter_pretty(env, min_elements=0))
+        if streamed_xml != debug_capture.pretty(env):
+            sys.exit(f'The streamed XML differs for {lines} lines')
+        json.loads(b''.join(serialization.iter_chunks({'x': serialization.StreamedText(iter([streamed_xml]))})))
+
+        size, whole_peak, whole_s = measure(whole)
+        _, streamed_peak, streamed_s = measure(streamed)
+        results[lines] = {
+            'response_kb': size // 1024,
+            'whole_peak_kb': whole_peak // 1024,
+            'streamed_peak_kb': streamed_peak // 1024,
+            'whole_ms': round(whole_s * 1000, 1),
+            'streamed_ms': round(streamed_s * 1000, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
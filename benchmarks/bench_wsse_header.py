@@ -0,0 +1,92 @@
+"""
+WS-Security header build time: per-message construction vs app.wsse_header.
+
+Times building the token and Timestamp the request signer adds, and the
+Security header of a ProviderResponseService response, the way they were
+built per message before (encode PUBLIC_KEY, pytz datetimes, isoformat) and
+with the prebuilt elements of app.wsse_header, and checks both produce the
+same texts.
+
+Run it from the directory the app is normally started from (it reads the
+certificates from ../certs):
+
+    python benchmarks/bench_wsse_header.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from lxml import etree
+from zeep.wsse import utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import wsse_header  # noqa: E402
+from app.constants import PUBLIC_KEY, SOAP_NS, WSSE_NS, WSU_NS  # noqa: E402
+from app.crypto_wsse import encode  # noqa: E402
+from app.xml import ensure_id  # noqa: E402
+
+
+def built_request_elements():
+    token = utils.WSU('BinarySecurityToken', encode(PUBLIC_KEY))
+    created = datetime.now(pytz.UTC)
+    expired = created + timedelta(seconds=60)
+    timestamp = utils.WSU('Timestamp')
+    timestamp.append(utils.WSU('Created', created.replace(microsecond=0).isoformat() + 'Z'))
+    timestamp.append(utils.WSU('Expires', expired.replace(microsecond=0).isoformat() + 'Z'))
+    return token, timestamp
+
+
+def built_response_security():
+    header = etree.Element(f"{{{SOAP_NS}}}Header", nsmap={'soap': SOAP_NS, 'wsse': WSSE_NS, 'wsu': WSU_NS})
+    security = etree.SubElement(header, f"{{{WSSE_NS}}}Security")
+    security.set(f"{{{SOAP_NS}}}mustUnderstand", "1")
+    created = datetime.now(pytz.UTC)
+    expires = created + timedelta(minutes=5)
+    timestamp = etree.SubElement(security, f"{{{WSU_NS}}}Timestamp")
+    ensure_id(timestamp)
+    etree.SubElement(timestamp, f"{{{WSU_NS}}}Created").text = created.replace(microsecond=0).isoformat() + 'Z'
+    etree.SubElement(timestamp, f"{{{WSU_NS}}}Expires").text = expires.replace(microsecond=0).isoformat() + 'Z'
+    return security
+
+
+def texts(elements):
+    return [elem.text for root in elements for elem in root.iter()]
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = {
+        'request': (built_request_elements, wsse_header.request_elements),
+        'response': (lambda: (built_response_security(),), lambda: (wsse_header.response_security(),)),
+    }
+    results = {}
+    for name, (built, factory) in cases.items():
+        if texts(built()) != texts(factory()):
+            sys.exit(f'The {name} header texts differ')
+        built_us = timed(built, args.iterations)
+        factory_us = timed(factory, args.iterations)
+        results[name] = {
+            'built_us': round(built_us, 2),
+            'factory_us': round(factory_us, 2),
+            'speedup': round(built_us / factory_us, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
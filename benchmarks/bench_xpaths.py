@@ -0,0 +1,121 @@
+"""
+Reference resolution microbenchmark for envelopes with many EncryptedData blocks.
+
+Compares resolving every DataReference of the EncryptedKey with a formatted
+``//enc:EncryptedData[@Id=...]`` XPath per reference (one document scan per
+block, which is what crypto_wsse.decrypt_element used to do) with the
+app.xpaths IdIndex (one scan per document), and times decrypt_element on the
+same envelopes.
+
+    python benchmarks/bench_xpaths.py --blocks 1 10 100 1000 --iterations 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree  # noqa: E402
+import xmlsec  # noqa: E402
+
+from app import crypto_wsse  # noqa: E402
+from app.constants import ENC_NS, IDX_NS, WSSE_NS, WSU_NS  # noqa: E402
+from app.key_store import get_certificate  # noqa: E402
+from app.xml import ns  # noqa: E402
+from app.xpaths import ENCRYPTED_DATA, ENCRYPTED_KEY_PATH, REFERENCE_LIST, IdIndex  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+ENVELOPE = '''<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"
+    xmlns:wsse="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd">
+  <soap:Header><wsse:Security/></soap:Header>
+  <soap:Body><IDXProviderSubmitMessage xmlns="http://IDX.Contract/V1">{blocks}</IDXProviderSubmitMessage></soap:Body>
+</soap:Envelope>'''
+BLOCK = ('<Transaction><Date>2024-01-{day:02d}</Date><Description>Payment {index}</Description>'
+         '<Amount>{index}.00</Amount></Transaction>')
+
+
+def build_encrypted(blocks, certfile):
+    """
+    Build an envelope whose Transactions are encrypted as separate blocks.
+
+    Every block is encrypted with the same session key, which is transported
+    once in the Security header's EncryptedKey, with a DataReference per block.
+
+    Returns:
+        The serialized envelope
+    """
+    doc = etree.fromstring(ENVELOPE.format(blocks=''.join(
+        BLOCK.format(day=index % 28 + 1, index=index) for index in range(blocks))).encode())
+    security = doc.find('.//' + ns(WSSE_NS, 'Security'))
+    cert = get_certificate(certfile)
+
+    session_key = os.urandom(32)
+    enc_key = None
+    for target in list(doc.iter(ns(IDX_NS, 'Transaction'))):
+        enc_data = xmlsec.template.encrypted_data_create(
+            doc, xmlsec.Transform.AES256_GCM, type=xmlsec.EncryptionType.ELEMENT, ns='xenc')
+        xmlsec.template.encrypted_data_ensure_cipher_value(enc_data)
+        if enc_key is None:
+            # The first block carries the session key, encrypted for the cert
+            key_info = xmlsec.template.encrypted_data_ensure_key_info(enc_data, ns='dsig')
+            enc_key = xmlsec.template.add_encrypted_key(key_info, xmlsec.Transform.RSA_OAEP)
+            xmlsec.template.encrypted_data_ensure_cipher_value(enc_key)
+        ctx = cert.encryption_context()
+        ctx.key = xmlsec.Key.from_binary_data(xmlsec.KeyData.AES, session_key)
+        enc_data = ctx.encrypt_xml(enc_data, target)
+        if enc_key.getparent() is not security:
+            security.insert(0, enc_key)
+            enc_data.remove(key_info)
+        crypto_wsse.add_data_reference(enc_key, enc_data)
+    return etree.tostring(doc)
+
+
+def xpath_lookup(doc):
+    """Resolve every DataReference with one formatted XPath query each."""
+    for ref in doc.find(ENCRYPTED_KEY_PATH).find(REFERENCE_LIST):
+        referenced_id = ref.get('URI')[1:]
+        doc.xpath(
+            "//enc:EncryptedData[@Id='%s' or @wsu:Id='%s']" % (referenced_id, referenced_id),
+            namespaces={'enc': ENC_NS, 'wsu': WSU_NS},
+        )[0]
+
+
+def index_lookup(doc):
+    """Resolve every DataReference through one IdIndex."""
+    ids = IdIndex(doc)
+    for ref in doc.find(ENCRYPTED_KEY_PATH).find(REFERENCE_LIST):
+        assert ids.get(ref.get('URI')[1:], ENCRYPTED_DATA) is not None
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--blocks', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    keyfile, certfile = generate_keypair()
+    results = {}
+    for blocks in args.blocks:
+        encrypted = build_encrypted(blocks, certfile)
+        doc = etree.fromstring(encrypted)
+        results[blocks] = {
+            'bytes': len(encrypted),
+            'xpath_lookup_ms': round(timed(lambda: xpath_lookup(doc), args.iterations), 3),
+            'index_lookup_ms': round(timed(lambda: index_lookup(doc), args.iterations), 3),
+            'decrypt_ms': round(timed(lambda: crypto_wsse.decrypt_element(
+                etree.fromstring(encrypted), keyfile), args.iterations), 3),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare two load test reports (benchmarks/load_test.py --output).
+
+Prints throughput, p99 latency and peak RSS per scenario side by side and
+exits non-zero if any scenario regressed by more than ``--threshold``.
+
+    python benchmarks/compare.py before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# metric, whether higher is better
+METRICS = (
+    ('throughput_rps', True),
+    ('p99_ms', False),
+    ('rss_peak_mb', False),
+)
+
+
+def compare(before, after, threshold):
+    """
+    Compare the scenarios present in both reports.
+
+    Returns:
+        A tuple (rows, regressions): rows of (scenario, metric, before, after,
+        relative change) and the subset of them that regressed
+    """
+    rows, regressions = [], []
+    for name, old in before['scenarios'].items():
+        new = after['scenarios'].get(name)
+        if new is None:
+            continue
+        for metric, higher_is_better in METRICS:
+            if not old.get(metric):
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            row = (name, metric, old[metric], new[metric], change)
+            rows.append(row)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.before) as fh:
+        before = json.load(fh)
+    with open(args.after) as fh:
+        after = json.load(fh)
+
+    print(f"before {before.get('commit')}  after {after.get('commit')}")
+    rows, regressions = compare(before, after, args.threshold)
+    for name, metric, old, new, change in rows:
+        flag = '  REGRESSION' if (name, metric, old, new, change) in regressions else ''
+        print(f"{name:<24} {metric:<15} {old:>12} {new:>12} {change:+8.1%}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Synthetic ProviderResponseService callback envelopes for the benchmarks.
+
+Builds Submit envelopes for each message type (AvX, FicaX, IDX, IVX) with a
+configurable number of repeated items (transactions, payslip fields,
+documents), shaped like the recorded Comcorp callbacks.
+"""
+import base64
+import os
+from datetime import datetime, timedelta, timezone
+
+SOAP_NS = 'http://www.w3.org/2003/05/soap-envelope'
+WSSE_NS = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd'
+WSU_NS = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd'
+
+MESSAGE_TYPES = ('avx', 'fica', 'idx', 'ivx')
+
+
+def _blob(size):
+    return base64.b64encode(os.urandom(size)).decode('ascii')
+
+
+def _timestamp(minutes=5):
+    created = datetime.now(timezone.utc).replace(microsecond=0)
+    expires = created + timedelta(minutes=minutes)
+    return created.isoformat().replace('+00:00', 'Z'), expires.isoformat().replace('+00:00', 'Z')
+
+
+def _avx_body(items, image_size):
+    details = ''.join(f'<AccountStatus{i}>Open</AccountStatus{i}>' for i in range(min(items, 50)))
+    return (
+        '<AvXProviderSubmitMessage xmlns="http://AvX.Contract/V1">'
+        f'<AvxResponseDetail>{details}</AvxResponseDetail>'
+        f'<SerializedAvxRespose>{_blob(image_size)}</SerializedAvxRespose>'
+        '</AvXProviderSubmitMessage>'
+    )
+
+
+def _fica_body(items, image_size):
+    documents = ''.join(
+        f'<Document xmlns="http://SecureX.Common/V1"><Name>doc{i}.pdf</Name>'
+        f'<Content>{_blob(image_size)}</Content></Document>'
+        for i in range(items)
+    )
+    return (
+        '<FicaProviderSubmitMessage xmlns="http://FicaX.Contract/V1">'
+        '<Data><Name>Jane</Name><Surname>Doe</Surname></Data>'
+        f'<Documents>{documents}</Documents>'
+        '<SerializedData>e30=</SerializedData>'
+        '<SerializedElements>e30=</SerializedElements>'
+        '</FicaProviderSubmitMessage>'
+    )
+
+
+def _idx_body(items, image_size):
+    transactions = ''.join(
+        f'<Transaction><Date>2024-01-{i % 28 + 1:02d}</Date><Amount>{i}.50</Amount>'
+        f'<Balance>{i * 3}.00</Balance><Description>Payment reference {i}</Description></Transaction>'
+        for i in range(items)
+    )
+    return (
+        '<IDXProviderSubmitMessage xmlns="http://IDX.Contract/V1">'
+        '<AccountName>Acme Trading</AccountName><AccountNumber>1234567890</AccountNumber>'
+        '<AccountType>Current</AccountType>'
+        '<Data><StatementData><DateFrom>2024-01-01</DateFrom><DateTo>2024-01-31</DateTo>'
+        f'<Transactions>{transactions}</Transactions></StatementData></Data>'
+        f'<Images><StatementImage>{_blob(image_size)}</StatementImage></Images>'
+        '</IDXProviderSubmitMessage>'
+    )
+
+
+def _ivx_body(items, image_size):
+    fields = ''.join(
+        f'<KeyValuePair><Key>Field{i}</Key><Value>{i}</Value></KeyValuePair>'
+        for i in range(items)
+    )
+    return (
+        '<IVXProviderSubmitMessage xmlns="http://IVX.Contract/V1" xmlns:c="http://SecureX.Common/V1">'
+        '<Data><PayslipData><TimeStamp>2024-01-31T00:00:00</TimeStamp>'
+        f'<c:Fields>{fields.replace("<", "<c:").replace("<c:/", "</c:")}</c:Fields></PayslipData></Data>'
+        f'<Images><c:Document><c:Content>{_blob(image_size)}</c:Content></c:Document></Images>'
+        '<SerializedData>e30=</SerializedData>'
+        f'<SerializedImages>{_blob(image_size)}</SerializedImages>'
+        '</IVXProviderSubmitMessage>'
+    )
+
+
+BODIES = {
+    'avx': _avx_body,
+    'fica': _fica_body,
+    'idx': _idx_body,
+    'ivx': _ivx_body,
+}
+
+
+def build_envelope(message_type, items=1, image_size=1024, exchange_reference='EX-1', ttl_minutes=5):
+    """
+    Build a callback envelope.
+
+    Args:
+        message_type: One of MESSAGE_TYPES
+        items: Number of repeated items (transactions, fields, documents)
+        image_size: Size in bytes of each (random) base64 blob
+        exchange_reference: The SecureX ExchangeReference header value
+        ttl_minutes: Minutes until the wsu:Timestamp expires
+
+    Returns:
+        The envelope as UTF-8 bytes
+    """
+    created, expires = _timestamp(ttl_minutes)
+    return (
+        f'<soap:Envelope xmlns:soap="{SOAP_NS}" xmlns:wsse="{WSSE_NS}" xmlns:wsu="{WSU_NS}">'
+        '<soap:Header>'
+        '<h:Header xmlns:h="http://SecureX.Common/V1">'
+        f'<h:ExchangeReference>{exchange_reference}</h:ExchangeReference>'
+        '<h:ProviderReference>PR-1</h:ProviderReference>'
+        '<h:ConsumerReference>CR-1</h:ConsumerReference>'
+        '</h:Header>'
+        '<wsse:Security><wsu:Timestamp wsu:Id="TS-1">'
+        f'<wsu:Created>{created}</wsu:Created><wsu:Expires>{expires}</wsu:Expires>'
+        '</wsu:Timestamp></wsse:Security>'
+        '</soap:Header>'
+        f'<soap:Body>{BODIES[message_type](items, image_size)}</soap:Body>'
+        '</soap:Envelope>'
+    ).encode('utf-8')
@@ -0,0 +1,105 @@
+"""
+Fixture envelopes for replaying ProviderResponseService callbacks.
+
+Writes one envelope per message type (AvX, FicaX, IDX, IVX) and size to a
+directory, together with a ``manifest.json`` describing them. With
+``--signed`` the envelopes are signed (BinarySecurityToken, Body and
+Timestamp) with a generated test keypair whose certificate is written next to
+them; start the app with ``TRUSTED_CERT_FILES`` pointing at it.
+
+The timestamps are valid for ``--ttl-minutes`` and every envelope carries
+REFERENCE_MARKER as its ExchangeReference, which the load test replaces with
+a unique reference per request (the SecureX header is not signed).
+
+    python benchmarks/fixtures.py --out /tmp/fixtures --sizes 1 1000 100000 --signed
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.envelopes import MESSAGE_TYPES, build_envelope  # noqa: E402
+from benchmarks.keys import generate_keypair  # noqa: E402
+
+REFERENCE_MARKER = 'EX-00000000'
+MANIFEST = 'manifest.json'
+DEFAULT_SIZES = (1, 1000, 100000)
+
+
+def sign(envelope, keyfile, certfile):
+    """Sign an envelope the way Comcorp does; return it as bytes."""
+    from lxml import etree
+    from zeep.wsse.signature import BinarySignature
+
+    doc = etree.fromstring(envelope)
+    BinarySignature(keyfile, certfile).apply(doc, {})
+    return etree.tostring(doc)
+
+
+def write_fixtures(directory, sizes=DEFAULT_SIZES, image_size=128, signed=False, ttl_minutes=7 * 24 * 60):
+    """
+    Generate the fixture envelopes.
+
+    Args:
+        directory: Where to write the envelopes and the manifest
+        sizes: Numbers of repeated items (transactions, fields, documents)
+        image_size: Size in bytes of each base64 blob
+        signed: Whether to sign the envelopes with a generated keypair
+        ttl_minutes: Minutes until the envelopes' timestamps expire
+
+    Returns:
+        The manifest as a dict
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {'signed': signed, 'certfile': None, 'fixtures': []}
+    if signed:
+        keyfile, certfile = generate_keypair(directory, name='provider')
+        manifest['certfile'] = os.path.abspath(certfile)
+
+    for message_type in MESSAGE_TYPES:
+        for items in sizes:
+            envelope = build_envelope(message_type, items=items, image_size=image_size,
+                                      exchange_reference=REFERENCE_MARKER, ttl_minutes=ttl_minutes)
+            if signed:
+                envelope = sign(envelope, keyfile, certfile)
+            name = f'{message_type}-{items}'
+            path = os.path.join(directory, f'{name}.xml')
+            with open(path, 'wb') as fh:
+                fh.write(envelope)
+            manifest['fixtures'].append({
+                'name': name,
+                'message_type': message_type,
+                'items': items,
+                'bytes': len(envelope),
+                'path': os.path.abspath(path),
+            })
+
+    with open(os.path.join(directory, MANIFEST), 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def load_manifest(directory):
+    """Read the manifest written by write_fixtures."""
+    with open(os.path.join(directory, MANIFEST)) as fh:
+        return json.load(fh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--image-size', type=int, default=128)
+    parser.add_argument('--signed', action='store_true')
+    parser.add_argument('--ttl-minutes', type=int, default=7 * 24 * 60)
+    args = parser.parse_args()
+
+    manifest = write_fixtures(args.out, args.sizes, args.image_size, args.signed, args.ttl_minutes)
+    for fixture in manifest['fixtures']:
+        print(f"{fixture['name']:>12}  {fixture['bytes']:>12,d} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Locally generated test keypairs for the benchmarks.
+
+Never use these for anything but benchmarking: the private keys are written
+unencrypted to a temporary directory.
+"""
+import os
+import tempfile
+
+from OpenSSL import crypto
+
+
+def generate_keypair(directory=None, name='bench', bits=2048):
+    """
+    Generate an RSA key and a self-signed certificate for it.
+
+    Args:
+        directory: Where to write the files (default: a new temporary directory)
+        name: Prefix for the file names and the certificate CN
+        bits: RSA key size
+
+    Returns:
+        A tuple (keyfile, certfile) of PEM file paths
+    """
+    directory = directory or tempfile.mkdtemp(prefix='comcorp-bench-')
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, bits)
+
+    cert = crypto.X509()
+    cert.get_subject().CN = name
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(24 * 60 * 60)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+
+    keyfile = os.path.join(directory, f'{name}_key.pem')
+    certfile = os.path.join(directory, f'{name}_cert.pem')
+    with open(keyfile, 'wb') as fh:
+        fh.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    with open(certfile, 'wb') as fh:
+        fh.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    return keyfile, certfile
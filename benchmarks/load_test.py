@@ -0,0 +1,295 @@
+"""
+Load test of both endpoints through gunicorn, with JSON output.
+
+Starts the local Comcorp stand-in (benchmarks/stub_server.py), then gunicorn
+with ``config/gunicorn_config.py``, and drives at ``--concurrency``:
+
+- ``download``: POST /comcorp-download-request with a JSON payload
+- ``callback-<type>-<items>``: POST /ProviderResponseService, replaying each
+  fixture envelope (benchmarks/fixtures.py) with a unique ExchangeReference
+
+For every scenario it reports throughput, p50/p99/max latency, errors,
+rejected callbacks and the peak RSS of the gunicorn master and workers. The
+JSON document also records the git commit, so two runs can be compared with
+benchmarks/compare.py.
+
+Run it from the directory the app is normally started from (the one holding
+the WSDL files), e.g.:
+
+    python benchmarks/load_test.py --concurrency 8 --sizes 1 1000 --output before.json
+    python benchmarks/load_test.py --env PROVIDER_ASYNC_ACK=1 --output after.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(ROOT, 'config', 'gunicorn_config.py')
+
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_client_pool import PAYLOAD, wait_for  # noqa: E402
+from benchmarks.fixtures import REFERENCE_MARKER, load_manifest, write_fixtures  # noqa: E402
+from benchmarks.stub_server import start_stub  # noqa: E402
+
+AUTH = 'Basic ' + base64.b64encode(b'bench:bench').decode()
+
+
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    children = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as fh:
+                children.extend(int(child) for child in fh.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def tree_rss_kb(pid):
+    """Return the summed RSS, in KiB, of ``pid`` and all its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += _rss_kb(current)
+        pending.extend(_children(current))
+    return total
+
+
+class RssSampler:
+    """Sample the RSS of a process tree in the background, keeping the peak."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, tree_rss_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, tree_rss_kb(self.pid))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def drive(url, bodies, total, concurrency, headers, accepted=None):
+    """
+    POST ``total`` requests to ``url`` from ``concurrency`` threads.
+
+    Args:
+        url: The endpoint
+        bodies: A function of the request number returning the request body
+        total: Number of requests
+        concurrency: Number of concurrent clients
+        headers: Request headers
+        accepted: Optional predicate on a 200 response body; requests it
+                  returns False for are counted as rejected
+
+    Returns:
+        A dict of throughput, latency percentiles (ms), errors and rejections
+    """
+    def one(number):
+        req = urllib.request.Request(url, data=bodies(number), headers=headers, method='POST')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=600) as resp:
+                body = resp.read()
+            outcome = 'ok' if accepted is None or accepted(body) else 'rejected'
+        except (urllib.error.URLError, OSError):
+            outcome = 'error'
+        return time.perf_counter() - started, outcome
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    outcomes = [outcome for _, outcome in results]
+    return {
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'errors': outcomes.count('error'),
+        'rejected': outcomes.count('rejected'),
+    }
+
+
+def callback_bodies(envelope):
+    """Return a body function substituting a unique ExchangeReference per request."""
+    marker = REFERENCE_MARKER.encode()
+    run = f'LT-{int(time.time()):x}'
+
+    def body(number):
+        return envelope.replace(marker, f'{run}-{number}'.encode(), 1)
+    return body
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_gunicorn(args, manifest):
+    env = dict(os.environ,
+               COMCORP_SERVICE_ADDRESS=f'http://127.0.0.1:{args.stub_port}/',
+               BASIC_AUTH_USERNAME='bench',
+               BASIC_AUTH_PASSWORD='bench',
+               PYTHONPATH=ROOT)
+    if manifest['certfile']:
+        env['TRUSTED_CERT_FILES'] = manifest['certfile']
+    for assignment in args.env:
+        name, _, value = assignment.partition('=')
+        env[name] = value
+
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG,
+           '--bind', f'127.0.0.1:{args.port}',
+           '--pid', os.path.join(tempfile.gettempdir(), 'bench_gunicorn.pid'),
+           '--timeout', str(args.timeout)]
+    if args.workers:
+        cmd += ['--workers', str(args.workers)]
+    if args.worker_class:
+        cmd += ['--worker-class', args.worker_class]
+    cmd.append(args.app)
+    return subprocess.Popen(cmd, env=env)
+
+
+def scenarios(args, manifest):
+    """Yield (name, url, body function, request count, headers, accepted predicate)."""
+    base = f'http://127.0.0.1:{args.port}'
+    if 'download' in args.endpoints:
+        payload = json.dumps(PAYLOAD).encode()
+        yield ('download', base + '/comcorp-download-request', lambda _: payload, args.requests,
+               {'Content-Type': 'application/json', 'Authorization': AUTH}, None)
+    if 'callback' in args.endpoints:
+        for fixture in manifest['fixtures']:
+            with open(fixture['path'], 'rb') as fh:
+                envelope = fh.read()
+            # Cap the bytes sent per scenario so the large fixtures finish in reasonable time
+            total = max(args.concurrency, min(args.requests, args.byte_budget * 2 ** 20 // len(envelope)))
+            yield (f"callback-{fixture['name']}", base + '/ProviderResponseService',
+                   callback_bodies(envelope), total,
+                   {'Content-Type': 'application/soap+xml'}, lambda body: b'>true<' in body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', nargs='+', default=['download', 'callback'],
+                        choices=['download', 'callback'])
+    parser.add_argument('--fixtures', help='directory written by benchmarks/fixtures.py '
+                                           '(default: generate into a temporary directory)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--image-size', type=int, default=128)
+    parser.add_argument('--signed', action='store_true', help='sign the generated fixtures')
+    parser.add_argument('--byte-budget', type=int, default=256,
+                        help='MiB of callback bodies sent per scenario at most')
+    parser.add_argument('--app', default='wsgi:app', help='e.g. asgi:application')
+    parser.add_argument('--workers', type=int, default=0, help='override the gunicorn worker count')
+    parser.add_argument('--worker-class', help='override the gunicorn worker class')
+    parser.add_argument('--timeout', type=int, default=300, help='gunicorn worker timeout')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for gunicorn, e.g. PROVIDER_ASYNC_ACK=1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stub-port', type=int, default=8766)
+    parser.add_argument('--stub-latency', type=float, default=0.0,
+                        help='seconds the Comcorp stand-in waits before answering')
+    parser.add_argument('--wsdl', default='RequestingMemberSubmitService.wsdl')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        manifest = load_manifest(args.fixtures)
+    else:
+        manifest = write_fixtures(tempfile.mkdtemp(prefix='comcorp-fixtures-'), args.sizes,
+                                  args.image_size, args.signed)
+
+    stub = start_stub(args.stub_port, args.wsdl, args.stub_latency)
+    proc = start_gunicorn(args, manifest)
+    results = {}
+    try:
+        wait_for(f'http://127.0.0.1:{args.port}/health')
+        idle_rss_kb = tree_rss_kb(proc.pid)
+        for name, url, bodies, total, headers, accepted in scenarios(args, manifest):
+            # Warm up every worker first
+            drive(url, bodies, args.concurrency, args.concurrency, headers, accepted)
+            with RssSampler(proc.pid) as rss:
+                results[name] = drive(url, bodies, total, args.concurrency, headers, accepted)
+            results[name]['rss_peak_mb'] = round(rss.peak_kb / 1024, 1)
+            print(f"{name}: {results[name]}", file=sys.stderr)
+    finally:
+        proc.terminate()
+        proc.wait()
+        stub.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {
+            'app': args.app,
+            'worker_class': args.worker_class,
+            'workers': args.workers or None,
+            'concurrency': args.concurrency,
+            'signed': manifest['signed'],
+            'stub_latency': args.stub_latency,
+            'env': args.env,
+        },
+        'idle_rss_mb': round(idle_rss_kb / 1024, 1),
+        'scenarios': results,
+    }
+    document = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(document + '\n')
+    print(document)
+
+
+if __name__ == '__main__':
+    main()
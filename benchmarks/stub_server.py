@@ -0,0 +1,92 @@
+"""
+Local stand-in for the Comcorp RequestingMemberSubmitService endpoint.
+
+Answers every POST with a Submit response envelope rendered from the WSDL's
+output message, optionally after a fixed delay to model the provider's
+latency, so /comcorp-download-request can be load tested without Comcorp.
+
+Run it standalone from the directory holding the WSDL files:
+
+    python benchmarks/stub_server.py --port 8766 --latency 0.2
+
+and point the app at it with ``COMCORP_SERVICE_ADDRESS=http://127.0.0.1:8766/``.
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_submit_response(wsdl):
+    """Render an empty Submit response envelope for the output element in ``wsdl``."""
+    import zeep
+    from lxml import etree
+
+    client = zeep.Client(wsdl)
+    binding = next(iter(client.wsdl.bindings.values()))
+    soap_env = binding.nsmap['soap-env']
+    envelope = etree.Element(etree.QName(soap_env, 'Envelope'))
+    body = etree.SubElement(envelope, etree.QName(soap_env, 'Body'))
+    etree.SubElement(body, binding.get('Submit').output.body.qname)
+    return etree.tostring(envelope, xml_declaration=True, encoding='utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    response = b''
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/soap+xml')
+        self.send_header('Content-Length', str(len(self.response)))
+        self.end_headers()
+        self.wfile.write(self.response)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(port, wsdl='RequestingMemberSubmitService.wsdl', latency=0.0):
+    """
+    Serve the stand-in on a background thread.
+
+    Args:
+        port: The local port to listen on
+        wsdl: The RequestingMemberSubmitService WSDL the response is rendered from
+        latency: Seconds to wait before answering each request
+
+    Returns:
+        The running ThreadingHTTPServer
+    """
+    handler = type('Handler', (StubHandler,), {
+        'response': build_submit_response(wsdl),
+        'latency': latency,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--wsdl', default='RequestingMemberSubmitService.wsdl')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before answering')
+    args = parser.parse_args()
+
+    server = start_stub(args.port, args.wsdl, args.latency)
+    print(f"Comcorp stand-in listening on http://127.0.0.1:{args.port}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
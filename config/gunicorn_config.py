@@ -1,4 +1,7 @@
+import glob
 import multiprocessing
+import os
+import tempfile
 
 # Gunicorn configuration file
 # https://docs.gunicorn.org/en/stable/configure.html
@@ -8,8 +11,12 @@ bind = "127.0.0.1:8000"  # Only bind to localhost, Nginx will proxy to this
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1  # Recommended formula
-worker_class = "sync"  # Use sync workers for SOAP processing
-timeout = 120  # Increase timeout for SOAP requests
+# Use sync workers for SOAP processing (wsgi:app). To hold many slow Comcorp
+# calls per worker, serve asgi:application with
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+timeout = 120  # Increase timeout for SOAP requests (keep above COMCORP_BULK_DEADLINE_SECONDS)
+preload_app = True  # Load the app (and parsed WSDLs) once in the master, shared copy-on-write
 
 # Server mechanics
 daemon = False  # Don't daemonize in production, use systemd instead
@@ -22,6 +29,8 @@ umask = 0  # File permissions
 accesslog = "access.log"
 errorlog = "error.log"
 loglevel = "info"
+# Write access.log/error.log from a listener thread (app/gunicorn_logging.py)
+logger_class = "app.gunicorn_logging.QueuedLogger"
 
 # Process naming
 proc_name = "mcauto-soap-client"
@@ -32,6 +41,37 @@ proc_name = "mcauto-soap-client"
 # ssl_version = "TLSv1_2"
 # cert_reqs = 0  # No client certificate required
 
+# Metrics (app/metrics.py): every worker writes its samples to files in this
+# directory and /metrics aggregates them. Must be set before the app is loaded.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'mcauto-soap-client-metrics'))
+
+# Server hooks
+def on_starting(server):
+    # Drop the samples of a previous run
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def worker_exit(server, worker):
+    # Write out what the worker's log listeners still have queued
+    from app.logging_config import flush
+    flush()
+
+def when_ready(server):
+    # Runs in the master before the workers are forked, so the parsed
+    # outbound WSDL is inherited by every worker.
+    from app.constants import REQUESTING_MEMBER_WSDL
+    from app.wsdl_cache import load_document
+    try:
+        load_document(REQUESTING_MEMBER_WSDL)
+    except Exception as e:
+        server.log.warning(f"Could not preload {REQUESTING_MEMBER_WSDL}: {e}")
+
 # Security
 limit_request_line = 4094  # Limit request line size
 limit_request_fields = 100  # Limit number of header fields
@@ -0,0 +1,50 @@
+"""
+Test setup.
+
+Importing the app loads its WSDLs from the working directory and its keys from
+``../certs``, so the tests run from a scratch directory laid out that way: the
+repository's certificates next to it, and the stand-in WSDL of
+tests/fixtures in place of the Comcorp WSDLs.
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from benchmarks.keys import generate_keypair
+
+TESTS_DIR = Path(__file__).resolve().parent
+ROOT = TESTS_DIR.parent
+FIXTURES = TESTS_DIR / 'fixtures'
+WSDL = FIXTURES / 'ConsumerDecryptedService.wsdl'
+
+
+def _prepare_run_dir():
+    """Create <scratch>/certs and <scratch>/run (with its WSDLs); return <scratch>."""
+    scratch = Path(tempfile.mkdtemp(prefix='comcorp-tests-'))
+    shutil.copytree(ROOT / 'certs', scratch / 'certs')
+    run_dir = scratch / 'run'
+    (run_dir / 'wsdl').mkdir(parents=True)
+    shutil.copy(WSDL, run_dir / 'RequestingMemberSubmitService.wsdl')
+    shutil.copy(WSDL, run_dir / 'wsdl' / 'ProviderResponseService.wsdl')
+    return scratch
+
+
+SCRATCH_DIR = _prepare_run_dir()
+
+
+def pytest_sessionstart(session):
+    # Before the test modules (and so the app) are imported
+    os.chdir(SCRATCH_DIR / 'run')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def keypair(tmp_path_factory):
+    """A locally generated (keyfile, certfile) pair to sign and encrypt with."""
+    return generate_keypair(str(tmp_path_factory.mktemp('keys')))
@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from app import app, client_service
+from app.async_download_service import create_asgi_app, submit_download_request_async
+from app.comcorp_download_service import submit_download_request
+from app.xpaths import BODY, ENCRYPTED_DATA
+from benchmarks.stub_server import start_stub
+
+PAYLOAD = {
+    'AccountNumber': '1234567890', 'AccountType': 'Current', 'BranchCode': '250655',
+    'DateFrom': '2024-01-01', 'DateTo': '2024-03-31',
+    'PhysicalEntities': [{'IdentificationNo': '8001015009087', 'IdentificationType': 'SAID', 'Name': 'Doe'}],
+}
+
+
+@pytest.fixture(scope='module')
+def stub():
+    server = start_stub(0)
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def clients(stub, monkeypatch):
+    monkeypatch.setattr(client_service, 'SERVICE_ADDRESS', stub)
+    monkeypatch.setattr(client_service, '_clients', {})
+    monkeypatch.setattr(client_service, '_async_clients', {})
+
+
+def test_async_submit_matches_the_sync_client():
+    async def submit():
+        try:
+            data, history = await submit_download_request_async(PAYLOAD)
+            return data, history.last_sent['envelope']
+        finally:
+            await client_service.close_async_clients()
+
+    data, sent = asyncio.run(submit())
+    assert data == submit_download_request(PAYLOAD)[0]
+    # Signed and encrypted like the sync client's requests
+    assert sent.find(BODY)[0].tag == ENCRYPTED_DATA
+
+
+def call_asgi(application, method, path, body=b'', headers=()):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'http_version': '1.1', 'scheme': 'http', 'method': method, 'path': path,
+             'query_string': b'', 'headers': list(headers), 'server': ('testserver', 80)}
+
+    async def run():
+        try:
+            await application(scope, receive, send)
+        finally:
+            await client_service.close_async_clients()
+
+    asyncio.run(run())
+    status = sent[0]['status']
+    return status, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+@pytest.fixture
+def application(monkeypatch):
+    monkeypatch.setenv('BASIC_AUTH_USERNAME', 'user')
+    monkeypatch.setenv('BASIC_AUTH_PASSWORD', 'secret')
+    return create_asgi_app(app)
+
+
+AUTH = (b'authorization', b'Basic ' + base64.b64encode(b'user:secret'))
+
+
+def test_asgi_download_request(application):
+    status, body = call_asgi(application, 'POST', '/comcorp-download-request', json.dumps(PAYLOAD).encode(),
+                             [AUTH, (b'content-type', b'application/json')])
+    assert status == 200
+    response = json.loads(body)
+    assert response['status'] == 'success'
+    assert response['data'] == {'Status': None, 'Reference': None, 'Messages': None}
+
+
+def test_asgi_download_request_requires_auth(application):
+    status, _ = call_asgi(application, 'POST', '/comcorp-download-request', json.dumps(PAYLOAD).encode())
+    assert status == 401
+
+
+def test_other_routes_are_served_by_flask(application):
+    status, body = call_asgi(application, 'GET', '/metrics')
+    assert status == 200 and b'comcorp_' in body
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import os
+import time
+
+import pytest
+from lxml import etree
+
+from app import blob_store
+
+
+def encoded(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def test_store_and_read_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, 'BLOB_DECODE_CHUNK', 8)
+    data = os.urandom(1000)
+    text = encoded(data)
+    ref = blob_store.store_base64('\n'.join(text[i:i + 76] for i in range(0, len(text), 76)), str(tmp_path))
+    assert ref.digest == hashlib.sha256(data).hexdigest()
+    assert ref.size == len(data) and ref.new
+    with ref.view() as view:
+        assert bytes(view) == data
+    assert blob_store.open_blob(ref.digest, str(tmp_path)) == ref
+
+
+def test_duplicates_are_stored_once(tmp_path):
+    first = blob_store.store_base64(encoded(b'same'), str(tmp_path))
+    second = blob_store.store_base64(encoded(b'same'), str(tmp_path))
+    assert first == second and not second.new
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.incoming-')]
+
+
+def test_invalid_base64(tmp_path):
+    with pytest.raises(ValueError):
+        blob_store.store_base64('abc', str(tmp_path))
+    with pytest.raises(ValueError):
+        blob_store.store_base64('ab!d', str(tmp_path))
+
+
+def test_store_element_clears_the_text(tmp_path):
+    elem = etree.Element('Image')
+    elem.text = encoded(b'image')
+    ref = blob_store.store_element(elem, str(tmp_path))
+    assert elem.text is None
+    with ref.view() as view:
+        assert bytes(view) == b'image'
+
+
+def test_prune(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, 'BLOB_RETENTION_SECONDS', 100)
+    old = blob_store.store_base64(encoded(b'old'), str(tmp_path))
+    resent = blob_store.store_base64(encoded(b'resent'), str(tmp_path))
+    past = time.time() - 200
+    os.utime(old.path, (past, past))
+    os.utime(resent.path, (past, past))
+    # Receiving a blob again keeps it for another retention period
+    blob_store.store_base64(encoded(b'resent'), str(tmp_path))
+
+    assert blob_store.prune(str(tmp_path)) == 1
+    assert not os.path.exists(old.path)
+    assert os.path.exists(resent.path)
+
+
+def test_prune_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, 'BLOB_RETENTION_SECONDS', 0)
+    blob_store.store_base64(encoded(b'kept'), str(tmp_path))
+    assert blob_store.prune(str(tmp_path), now=time.time() + 10 ** 9) == 0
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from app import callback_queue
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'queue.sqlite3')
+
+
+def test_claim_complete(db):
+    callback_id = callback_queue.enqueue(b'<envelope/>', db)
+    callback = callback_queue.claim(db)
+    assert (callback.id, callback.body, callback.attempts) == (callback_id, b'<envelope/>', 0)
+    # Claimed messages are not handed out twice
+    assert callback_queue.claim(db) is None
+
+    callback_queue.complete(callback_id, db)
+    stats = callback_queue.stats(db)
+    assert (stats['pending'], stats['processing'], stats['done']) == (0, 0, 1)
+    assert stats['retention_seconds'] == callback_queue.CALLBACK_RETENTION_SECONDS
+    body = callback_queue.get_connection(db).execute(
+        "SELECT body FROM callbacks WHERE id = ?", (callback_id,)).fetchone()[0]
+    assert bytes(body) == b''
+
+
+def test_claims_in_order(db):
+    first = callback_queue.enqueue(b'1', db)
+    second = callback_queue.enqueue(b'2', db)
+    assert [callback_queue.claim(db).id, callback_queue.claim(db).id] == [first, second]
+
+
+def test_expired_lease_is_claimed_again(db, monkeypatch):
+    callback_id = callback_queue.enqueue(b'<envelope/>', db)
+    callback_queue.claim(db)
+    monkeypatch.setattr(callback_queue, 'CALLBACK_LEASE_SECONDS', -1)
+    assert callback_queue.claim(db).id == callback_id
+
+
+def test_failure_is_retried_after_backoff(db, monkeypatch):
+    monkeypatch.setattr(callback_queue, 'CALLBACK_RETRY_DELAY', 60)
+    callback_id = callback_queue.enqueue(b'<envelope/>', db)
+    callback_queue.claim(db)
+    assert callback_queue.fail(callback_id, 'boom', db) == callback_queue.PENDING
+    assert callback_queue.claim(db) is None
+
+    next_attempt_at, last_error = callback_queue.get_connection(db).execute(
+        "SELECT next_attempt_at, last_error FROM callbacks WHERE id = ?", (callback_id,)).fetchone()
+    assert last_error == 'boom'
+    assert next_attempt_at == pytest.approx(time.time() + 60, abs=5)
+
+    monkeypatch.setattr(callback_queue, 'CALLBACK_RETRY_DELAY', 0)
+    callback_queue.fail(callback_id, 'boom', db)
+    retried = callback_queue.claim(db)
+    assert (retried.id, retried.attempts) == (callback_id, 2)
+
+
+def test_dead_letter_and_requeue(db, monkeypatch):
+    monkeypatch.setattr(callback_queue, 'CALLBACK_RETRY_DELAY', 0)
+    monkeypatch.setattr(callback_queue, 'CALLBACK_MAX_ATTEMPTS', 2)
+    callback_id = callback_queue.enqueue(b'<envelope/>', db)
+    callback_queue.claim(db)
+    assert callback_queue.fail(callback_id, 'first', db) == callback_queue.PENDING
+    callback_queue.claim(db)
+    assert callback_queue.fail(callback_id, 'second', db) == callback_queue.DEAD
+    assert callback_queue.claim(db) is None
+    assert callback_queue.stats(db)['dead'] == 1
+
+    assert callback_queue.requeue_dead(db) == 1
+    requeued = callback_queue.claim(db)
+    assert (requeued.id, requeued.attempts) == (callback_id, 0)
+
+
+def test_prune_deletes_old_processed_messages(db):
+    done = callback_queue.enqueue(b'done', db)
+    pending = callback_queue.enqueue(b'pending', db)
+    callback_queue.claim(db)
+    callback_queue.complete(done, db)
+
+    assert callback_queue.prune(db) == 0
+    later = time.time() + callback_queue.CALLBACK_RETENTION_SECONDS + 1
+    assert callback_queue.prune(db, now=later) == 1
+    assert [row[0] for row in callback_queue.get_connection(db).execute("SELECT id FROM callbacks")] == [pending]
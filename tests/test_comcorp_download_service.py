@@ -0,0 +1,81 @@
+import base64
+import json
+import time
+
+import pytest
+
+from app import app
+from app import comcorp_download_service as service
+
+PAYLOAD = {'AccountNumber': '1', 'AccountType': 'Current', 'PhysicalEntities': []}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('BASIC_AUTH_USERNAME', 'user')
+    monkeypatch.setenv('BASIC_AUTH_PASSWORD', 'secret')
+    return app.test_client()
+
+
+@pytest.fixture
+def auth():
+    return {'Authorization': 'Basic ' + base64.b64encode(b'user:secret').decode('ascii')}
+
+
+def test_requires_auth(client):
+    assert client.post('/comcorp-download-request/bulk', json=[PAYLOAD]).status_code == 401
+
+
+def test_bulk_rejects_a_body_that_is_not_a_list(client, auth):
+    response = client.post('/comcorp-download-request/bulk', json=PAYLOAD, headers=auth)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_bulk_rejects_too_many_items_before_streaming(client, auth, monkeypatch, ndjson):
+    monkeypatch.setattr(service, 'BULK_MAX_ITEMS', 2)
+    submitted = []
+    monkeypatch.setattr(service, 'submit_bulk_item', lambda *args: submitted.append(args))
+    if ndjson:
+        response = client.post('/comcorp-download-request/bulk', headers=auth, content_type='application/x-ndjson',
+                               data='\n'.join(json.dumps(PAYLOAD) for _ in range(3)))
+    else:
+        response = client.post('/comcorp-download-request/bulk', json=[PAYLOAD] * 3, headers=auth)
+    assert response.status_code == 413
+    assert response.get_json() == {'status': 'error', 'message': 'More than 2 items'}
+    assert submitted == []
+
+
+def test_bulk_header_failure_is_a_json_error(client, auth, monkeypatch):
+    def failing_header(soap):
+        raise RuntimeError('no header')
+
+    monkeypatch.setattr(service, 'getHeader', failing_header)
+    response = client.post('/comcorp-download-request/bulk', json=[PAYLOAD], headers=auth)
+    assert response.status_code == 500
+    assert response.get_json() == {'status': 'error', 'message': 'no header'}
+
+
+def fake_item(index, payload, header, bypass_cache=False):
+    time.sleep(payload.get('sleep', 0))
+    return {'index': index, 'status': 'success', 'data': payload, 'elapsed_ms': 0}
+
+
+def test_bulk_results(monkeypatch):
+    monkeypatch.setattr(service, 'submit_bulk_item', fake_item)
+    items = [{'n': 1}, service.InvalidItem('bad line'), {'n': 2}]
+    results = sorted(service.bulk_results(items, header=None, concurrency=2), key=lambda item: item['index'])
+    assert [item['status'] for item in results] == ['success', 'error', 'success']
+    assert results[1]['message'] == 'Invalid JSON: bad line'
+
+
+def test_bulk_results_stop_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(service, 'submit_bulk_item', fake_item)
+    items = [{'sleep': 0}, {'sleep': 2}, {'sleep': 0}, {'sleep': 2}]
+    started = time.monotonic()
+    results = list(service.bulk_results(items, header=None, concurrency=4, deadline=time.monotonic() + 0.5))
+    assert time.monotonic() - started < 1.5
+    statuses = {item['index']: item['status'] for item in results}
+    assert statuses == {0: 'success', 1: 'error', 2: 'success', 3: 'error'}
+    assert {item['message'] for item in results if item['status'] == 'error'} == {'Bulk request deadline exceeded'}
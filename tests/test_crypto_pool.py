@@ -0,0 +1,54 @@
+import copy
+
+import pytest
+from lxml import etree
+
+from app import crypto_pool, crypto_wsse
+from app.xpaths import BODY
+from benchmarks.envelopes import build_envelope
+
+
+@pytest.fixture
+def envelopes(keypair):
+    """A plain envelope and an encrypted copy of it."""
+    plain = etree.fromstring(build_envelope('idx', items=20))
+    encrypted = copy.deepcopy(plain)
+    crypto_wsse.encrypt_element(encrypted, keypair[1])
+    return plain, encrypted
+
+
+def message(envelope):
+    return etree.tostring(envelope.find(BODY)[0], method='c14n')
+
+
+def not_pooled(*args):
+    raise AssertionError('decrypted in the pool')
+
+
+@pytest.mark.parametrize('processes, size', [(0, 10 ** 9), (1, 100), (1, None)])
+def test_decrypted_inline_in_place(keypair, envelopes, monkeypatch, processes, size):
+    monkeypatch.setattr(crypto_pool, 'CRYPTO_POOL_PROCESSES', processes)
+    monkeypatch.setattr(crypto_pool, '_decrypt_in_pool', not_pooled)
+    plain, encrypted = envelopes
+    assert message(encrypted) != message(plain)
+    assert crypto_pool.decrypt_element(encrypted, keypair[0], size) is encrypted
+    assert message(encrypted) == message(plain)
+
+
+def test_large_envelopes_are_decrypted_in_the_pool(keypair, envelopes, monkeypatch):
+    monkeypatch.setattr(crypto_pool, 'CRYPTO_POOL_PROCESSES', 1)
+    plain, encrypted = envelopes
+    try:
+        decrypted = crypto_pool.decrypt_element(encrypted, keypair[0], crypto_pool.CRYPTO_POOL_MIN_BYTES)
+    finally:
+        crypto_pool.shutdown()
+    assert decrypted is not encrypted
+    assert message(decrypted) == message(plain)
+
+
+def test_serialized_envelopes_round_trip(keypair, monkeypatch):
+    monkeypatch.setattr(crypto_pool, 'CRYPTO_POOL_PROCESSES', 0)
+    plain = build_envelope('avx')
+    encrypted = crypto_wsse.encrypt(plain, keypair[1])
+    decrypted = crypto_pool.decrypt(encrypted, keypair[0])
+    assert message(etree.fromstring(decrypted)) == message(etree.fromstring(plain))
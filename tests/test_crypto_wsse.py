@@ -0,0 +1,63 @@
+import copy
+import os
+import shutil
+
+import pytest
+import xmlsec
+from lxml import etree
+
+from app import crypto_wsse, key_store
+from app.xpaths import BODY, ENCRYPTED_DATA
+from benchmarks.envelopes import MESSAGE_TYPES, build_envelope
+from benchmarks.keys import generate_keypair
+
+
+def message(envelope):
+    return etree.tostring(envelope.find(BODY)[0], method='c14n')
+
+
+@pytest.mark.parametrize('message_type', MESSAGE_TYPES)
+def test_encrypt_decrypt_round_trip(keypair, message_type):
+    keyfile, certfile = keypair
+    plain = etree.fromstring(build_envelope(message_type, items=3))
+    envelope = copy.deepcopy(plain)
+    crypto_wsse.encrypt_element(envelope, certfile)
+    assert envelope.find(BODY)[0].tag == ENCRYPTED_DATA
+    crypto_wsse.decrypt_element(envelope, keyfile)
+    assert message(envelope) == message(plain)
+
+
+def test_serialized_round_trip(keypair):
+    keyfile, certfile = keypair
+    plain = build_envelope('idx')
+    decrypted = crypto_wsse.decrypt(crypto_wsse.encrypt(plain, certfile), keyfile)
+    assert message(etree.fromstring(decrypted)) == message(etree.fromstring(plain))
+
+
+def test_wrong_key_does_not_decrypt(keypair, tmp_path):
+    other_keyfile, _ = generate_keypair(str(tmp_path), name='other')
+    envelope = etree.fromstring(build_envelope('avx'))
+    crypto_wsse.encrypt_element(envelope, keypair[1])
+    with pytest.raises(xmlsec.Error):
+        crypto_wsse.decrypt_element(envelope, other_keyfile)
+
+
+def test_material_is_loaded_once(keypair):
+    keyfile, certfile = keypair
+    assert key_store.get_certificate(certfile) is key_store.get_certificate(certfile)
+    assert key_store.get_private_key(keyfile) is key_store.get_private_key(keyfile)
+
+
+def test_changed_certificate_is_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(key_store, 'KEY_RELOAD_CHECK_INTERVAL', 0)
+    _, first = generate_keypair(str(tmp_path), name='first')
+    _, second = generate_keypair(str(tmp_path), name='second')
+    certfile = str(tmp_path / 'rotated.pem')
+    shutil.copy(first, certfile)
+    loaded = key_store.get_certificate(certfile)
+
+    shutil.copy(second, certfile)
+    os.utime(certfile, ns=(0, os.stat(certfile).st_mtime_ns + 10 ** 9))
+    reloaded = key_store.get_certificate(certfile)
+    assert reloaded is not loaded
+    assert reloaded.fingerprint == key_store.get_certificate(second).fingerprint
@@ -0,0 +1,79 @@
+import logging
+import queue
+
+import pytest
+from lxml import etree
+
+from app import app, debug_capture
+
+IDX_NS = 'http://IDX.Contract/V1'
+
+
+def envelope(lines):
+    root = etree.Element('{urn:soap}Envelope', nsmap={'s': 'urn:soap', 'a': 'urn:a'})
+    body = etree.SubElement(root, '{urn:soap}Body')
+    response = etree.SubElement(body, f'{{{IDX_NS}}}Response', nsmap={None: IDX_NS})
+    etree.SubElement(response, f'{{{IDX_NS}}}Status', {'{urn:a}code': '0'}).text = 'OK'
+    response.append(etree.Comment(' statement '))
+    transactions = etree.SubElement(response, f'{{{IDX_NS}}}Transactions')
+    for index in range(lines):
+        line = etree.SubElement(transactions, f'{{{IDX_NS}}}Transaction')
+        etree.SubElement(line, f'{{{IDX_NS}}}Description').text = f'Payment {index} & <transfer>'
+        etree.SubElement(line, '{urn:other}Note', nsmap={'o': 'urn:other'}).text = 'x'
+    mixed = etree.SubElement(response, f'{{{IDX_NS}}}Remark')
+    mixed.text = 'mixed '
+    etree.SubElement(mixed, f'{{{IDX_NS}}}b').tail = ' content'
+    return root
+
+
+@pytest.mark.parametrize('depth', [1, 2, 4, 10])
+def test_streamed_text_is_pretty(depth):
+    root = envelope(5)
+    assert ''.join(debug_capture.iter_pretty(root, depth=depth, min_elements=0)) == debug_capture.pretty(root)
+
+
+def test_namespaces_are_declared_once():
+    streamed = ''.join(debug_capture.iter_pretty(envelope(3), min_elements=0))
+    assert streamed.count(f'xmlns="{IDX_NS}"') == 1
+    assert streamed.count('xmlns:s=') == 1
+
+
+def test_small_elements_are_pretty_printed_whole(monkeypatch):
+    root = envelope(1)
+    assert list(debug_capture.iter_pretty(root)) == [debug_capture.pretty(root)]
+
+
+def test_chunks(monkeypatch):
+    monkeypatch.setattr(debug_capture, 'DEBUG_STREAM_CHUNK_SIZE', 256)
+    root = envelope(50)
+    chunks = list(debug_capture.iter_pretty(root, min_elements=0))
+    assert len(chunks) > 10
+    assert ''.join(chunks) == debug_capture.pretty(root)
+
+
+def capture_record(size):
+    element = etree.Element('blob')
+    element.text = 'x' * size
+    return logging.makeLogRecord({'msg': '%s', 'args': (debug_capture.PrettyXml(element),)})
+
+
+def test_snapshot_queue_is_capped_by_bytes():
+    snapshots = debug_capture._SnapshotQueue(maxsize=100, maxbytes=1000)
+    snapshots.put_nowait(capture_record(600))
+    with pytest.raises(queue.Full):
+        snapshots.put_nowait(capture_record(600))
+    # Records without XML are not limited by the byte cap
+    snapshots.put_nowait(logging.makeLogRecord({'msg': 'dropped'}))
+    snapshots.get_nowait()
+    assert snapshots.bytes == 0
+    snapshots.put_nowait(capture_record(600))
+
+
+def test_request_flag_is_ignored_on_the_callback_endpoint(monkeypatch):
+    monkeypatch.setattr(debug_capture, 'DEBUG_CAPTURE_REQUEST_FLAG', True)
+    monkeypatch.setattr(debug_capture, 'DEBUG_CAPTURE_SAMPLE_RATE', 0)
+    started = []
+    original = debug_capture.start
+    monkeypatch.setattr(debug_capture, 'start', lambda requested=False: started.append(original(requested)))
+    app.test_client().post('/ProviderResponseService?debug=true', data=b'<not xml')
+    assert started == [False]
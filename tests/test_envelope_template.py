@@ -0,0 +1,52 @@
+import pytest
+
+from app import client_service, envelope_template
+from app.envelope_template import PrerenderedMessage, submit_arguments
+
+ENTITY = {'IdentificationNo': '8001015009087', 'IdentificationType': 'SAID', 'Initials': 'J', 'Name': 'Doe'}
+
+
+def payload(entities=1, **values):
+    return dict({
+        'AccountNumber': '1234567890', 'AccountType': 'Current', 'BranchCode': '250655',
+        'DateFrom': '2024-01-01', 'DateTo': '2024-03-31', 'EmailAddress': 'a@example.com',
+        'JointAccount': 'N', 'PhysicalEntities': [dict(ENTITY, Name=f'Entity {index}') for index in range(entities)],
+    }, **values)
+
+
+@pytest.fixture(scope='module')
+def client():
+    return client_service.create_client()
+
+
+def test_template_is_installed(client):
+    assert client.template is not None
+
+
+@pytest.mark.parametrize('values', [
+    payload(0),
+    payload(1),
+    payload(5),
+    payload(2, AccountNumber='R&D <"1">', EmailAddress="o'brien@example.com"),
+    payload(1, PhysicalEntities=[{'Name': 'Only a name'}]),
+])
+def test_template_renders_as_zeep(client, values):
+    assert client.template.matches_zeep(client.soap, values)
+
+
+def test_payloads_with_null_values_are_rendered_by_zeep(client):
+    values = payload(1, BranchCode=None)
+    assert client.template.render(values, envelope_template.getHeader(client.soap)) is None
+    args, kwargs = submit_arguments(client, values)
+    assert not isinstance(args[0], PrerenderedMessage)
+    assert 'Header' in kwargs['_soapheaders']
+
+
+def test_submit_arguments_use_the_template(client):
+    args, kwargs = submit_arguments(client, payload(2))
+    assert isinstance(args[0], PrerenderedMessage) and kwargs == {}
+
+
+def test_templates_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(envelope_template, 'ENVELOPE_TEMPLATES', False)
+    assert envelope_template.install(client.soap, client.service._binding) is None
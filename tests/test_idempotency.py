@@ -0,0 +1,127 @@
+import hashlib
+import io
+import uuid
+
+import pytest
+from lxml import etree
+
+from app import app, idempotency
+from app import provider_response_service as prs
+from app.message_extract import extract_envelope
+from benchmarks.envelopes import build_envelope
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'idempotency.sqlite3')
+
+
+@pytest.fixture
+def key():
+    return idempotency.key_from_bytes(build_envelope('idx', exchange_reference=str(uuid.uuid4())))
+
+
+def test_key_from_bytes_reads_the_references_message_and_body_digest():
+    content = build_envelope('avx', exchange_reference='EX-9')
+    body = content[content.index(b'<soap:Body>'):]
+    assert idempotency.key_from_bytes(content) == (
+        f'EX-9|PR-1|CR-1|{{http://AvX.Contract/V1}}AvXProviderSubmitMessage|{hashlib.sha256(body).hexdigest()}')
+
+
+def test_messages_with_the_same_references_get_different_keys():
+    keys = {idempotency.key_from_bytes(build_envelope(message_type, exchange_reference='EX-1'))
+            for message_type in ('avx', 'idx', 'idx')}
+    assert len(keys) == 3
+
+
+def test_key_does_not_depend_on_the_security_header():
+    content = build_envelope('idx', exchange_reference='EX-7')
+    resent = content.replace(b'TS-1', b'TS-2')
+    assert resent != content
+    assert idempotency.key_from_bytes(resent) == idempotency.key_from_bytes(content)
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 100, 65536])
+def test_key_from_record_matches_key_from_bytes(read_size):
+    content = build_envelope('fica', exchange_reference='EX-7')
+    stream = idempotency.BodyDigestReader(io.BytesIO(content))
+    while stream.read(read_size):
+        pass
+    record = extract_envelope(etree.fromstring(content))
+    assert idempotency.key_from_record(record, stream.hexdigest()) == idempotency.key_from_bytes(content)
+
+
+def test_key_from_bytes_without_references():
+    envelope = b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body/></s:Envelope>'
+    assert idempotency.key_from_bytes(envelope) is None
+    assert idempotency.key_from_bytes(b'<not xml') is None
+
+
+def test_lookup_after_record(db, key):
+    assert idempotency.lookup(key, db) is None
+    idempotency.record(key, True, db)
+    assert idempotency.lookup(key, db) is True
+
+
+def test_record_is_shared_through_the_database(db, key):
+    idempotency.record(key, True, db)
+    # A worker that has not seen the key finds it in the database
+    idempotency._cache._items.clear()
+    assert idempotency.lookup(key, db) is True
+
+
+def test_failures_are_not_remembered(db, key):
+    idempotency.record(key, False, db)
+    assert idempotency.lookup(key, db) is None
+
+
+def test_keys_expire_after_the_ttl(db, key, monkeypatch):
+    idempotency.record(key, True, db)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_TTL', 0)
+    assert idempotency.lookup(key, db) is None
+
+
+def test_disabled(db, key, monkeypatch):
+    idempotency.record(key, True, db)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_ENABLED', False)
+    assert idempotency.lookup(key, db) is None
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_DB', db)
+    monkeypatch.setattr(prs, 'ASYNC_ACK', False)
+    return app.test_client()
+
+
+def post(client, content):
+    response = client.post('/ProviderResponseService', data=content, content_type='application/soap+xml')
+    return etree.fromstring(response.data).findtext('.//{*}Value')
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_endpoint_acks_a_duplicate_without_processing_it(client, monkeypatch, streaming):
+    monkeypatch.setattr(prs, 'STREAMING_INGEST', streaming)
+    processed = []
+
+    def counted(handler):
+        def wrapper(*args, **kwargs):
+            processed.append(handler.__name__)
+            return handler(*args, **kwargs)
+        return wrapper
+
+    for name in ('process_submit_request', 'process_streamed_idx_message'):
+        monkeypatch.setattr(prs, name, counted(getattr(prs, name)))
+    for message_type in ('avx', 'idx'):
+        content = build_envelope(message_type, exchange_reference=str(uuid.uuid4()))
+        assert post(client, content) == 'true'
+        assert post(client, content) == 'true'
+    assert len(processed) == 2
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_endpoint_verifies_before_looking_up(client, monkeypatch, streaming):
+    monkeypatch.setattr(prs, 'STREAMING_INGEST', streaming)
+    expired = build_envelope('avx', exchange_reference=str(uuid.uuid4()), ttl_minutes=-1)
+    idempotency.record(idempotency.key_from_bytes(expired), True)
+    assert post(client, expired) == 'false'
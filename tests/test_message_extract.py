@@ -0,0 +1,62 @@
+import pytest
+from lxml import etree
+
+from app.message_extract import extract_avx, extract_envelope, extract_fica, extract_idx, extract_ivx
+from benchmarks.envelopes import MESSAGE_TYPES, build_envelope
+
+
+def parse(message_type, **kwargs):
+    return extract_envelope(etree.fromstring(build_envelope(message_type, **kwargs)))
+
+
+@pytest.mark.parametrize('message_type', MESSAGE_TYPES)
+def test_extract_envelope(message_type):
+    record = parse(message_type, exchange_reference='EX-5')
+    assert record.securex_header.find('{*}ExchangeReference').text == 'EX-5'
+    assert record.has_timestamp
+    assert record.timestamp_created < record.timestamp_expires
+    assert record.signature is None
+    assert record.encrypted_data == []
+    assert etree.QName(record.message).localname.lower().startswith(message_type)
+
+
+def test_extract_envelope_without_header():
+    envelope = etree.fromstring(b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope">'
+                                b'<s:Body><!-- c --><m/></s:Body></s:Envelope>')
+    record = extract_envelope(envelope)
+    assert (record.header, record.security, record.has_timestamp) == (None, None, False)
+    assert record.message.tag == 'm'
+
+
+def test_extract_avx():
+    record = extract_avx(parse('avx', items=3).message)
+    assert len(record.response_detail) == 3
+    assert record.serialized_response.text
+
+
+def test_extract_fica():
+    record = extract_fica(parse('fica', items=4).message)
+    assert record.data.find('{*}Name').text == 'Jane'
+    assert len(record.document_contents) == 4
+    assert record.serialized_data.text == 'e30='
+
+
+def test_extract_idx():
+    record = extract_idx(parse('idx', items=7).message)
+    assert record.account_number.text == '1234567890'
+    assert record.account_type.text == 'Current'
+    assert len(record.statements) == 1
+    statement = record.statements[0]
+    assert (statement.date_from, statement.date_to, statement.transaction_count) == ('2024-01-01', '2024-01-31', 7)
+    assert record.image_count == 1
+    assert len(record.statement_images) == 1
+
+
+def test_extract_ivx():
+    record = extract_ivx(parse('ivx', items=5).message)
+    assert len(record.payslips) == 1
+    assert record.payslips[0].timestamp == '2024-01-31T00:00:00'
+    assert record.payslips[0].field_count == 5
+    assert record.document_count == 1
+    assert len(record.document_contents) == 1
+    assert record.serialized_images.text
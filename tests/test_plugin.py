@@ -0,0 +1,35 @@
+import copy
+
+import pytest
+from lxml import etree
+
+from app import crypto_wsse, plugin
+from app.xpaths import BODY, ENCRYPTED_DATA, HEADER, SECURITY_PATH
+from benchmarks.envelopes import build_envelope
+
+
+@pytest.fixture
+def encrypting(keypair, monkeypatch):
+    monkeypatch.setattr(plugin, 'PUBLIC_KEY_FILE', keypair[1])
+    return plugin.encryptPlugin()
+
+
+def without_header():
+    envelope = etree.fromstring(build_envelope('idx'))
+    envelope.remove(envelope.find(HEADER))
+    return envelope
+
+
+@pytest.mark.parametrize('make_envelope', [lambda: etree.fromstring(build_envelope('idx')), without_header])
+def test_egress_encrypts_the_tree_in_place(keypair, encrypting, make_envelope):
+    envelope = make_envelope()
+    plain = copy.deepcopy(envelope)
+    headers = {'Content-Type': 'application/soap+xml'}
+
+    encrypted, http_headers = encrypting.egress(envelope, headers, None, None)
+    assert encrypted is envelope and http_headers is headers
+    assert encrypted.find(SECURITY_PATH) is not None
+    assert encrypted.find(BODY)[0].tag == ENCRYPTED_DATA
+
+    crypto_wsse.decrypt_element(encrypted, keypair[0])
+    assert etree.tostring(encrypted.find(BODY)[0], method='c14n') == etree.tostring(plain.find(BODY)[0], method='c14n')
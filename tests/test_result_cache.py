@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+from app import result_cache
+
+PAYLOAD = {'AccountNumber': '1', 'AccountType': 'Current', 'PhysicalEntities': [{'Name': 'A'}, {'Name': 'B'}]}
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_TTL', 60)
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_TTL_BY_ACCOUNT_TYPE', {})
+    result_cache._cache.clear()
+    yield
+    result_cache._cache.clear()
+
+
+class Submit:
+    """A submit callable counting its calls."""
+
+    def __init__(self, result='data'):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result, 'history'
+
+
+def test_payload_key_ignores_entity_order_and_whitespace():
+    reordered = {'AccountType': 'Current ', 'AccountNumber': '1',
+                 'PhysicalEntities': [{'Name': 'B'}, {'Name': 'A'}], 'Other': 'x'}
+    assert result_cache.payload_key(reordered) == result_cache.payload_key(PAYLOAD)
+    assert result_cache.payload_key(dict(PAYLOAD, AccountNumber='2')) != result_cache.payload_key(PAYLOAD)
+
+
+def test_miss_then_hit():
+    submit = Submit()
+    assert result_cache.fetch(PAYLOAD, submit) == ('data', 'history', result_cache.MISS)
+    assert result_cache.fetch(PAYLOAD, submit) == ('data', None, result_cache.HIT)
+    assert submit.calls == 1
+
+
+def test_bypass():
+    submit = Submit()
+    result_cache.fetch(PAYLOAD, submit)
+    assert result_cache.fetch(PAYLOAD, submit, bypass=True)[2] == result_cache.BYPASS
+    assert submit.calls == 2
+    assert result_cache.bypass_requested('max-age=0, No-Cache')
+    assert not result_cache.bypass_requested(None)
+
+
+def test_not_cached_with_a_ttl_of_zero(monkeypatch):
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_TTL', 0)
+    submit = Submit()
+    assert result_cache.fetch(PAYLOAD, submit) == ('data', 'history', None)
+    assert result_cache.fetch(PAYLOAD, submit)[2] is None
+    assert submit.calls == 2
+
+
+def test_ttl_by_account_type(monkeypatch):
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_TTL_BY_ACCOUNT_TYPE', {'current': 5})
+    assert result_cache.ttl_for(PAYLOAD) == 5
+    assert result_cache.ttl_for(dict(PAYLOAD, AccountType='Savings')) == 60
+
+
+def test_entries_expire(monkeypatch):
+    cache = result_cache.TTLCache(10)
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache.put('key', 'value', ttl=5)
+    assert cache.get('key') == 'value'
+    now[0] += 5
+    assert cache.get('key') is None
+
+
+def test_size_is_bounded():
+    cache = result_cache.TTLCache(2)
+    for key in 'abc':
+        cache.put(key, key, ttl=60)
+    assert [cache.get(key) for key in 'abc'] == [None, 'b', 'c']
+
+
+def test_concurrent_requests_are_coalesced():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_submit():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'data', 'history'
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(leader=result_cache.fetch(PAYLOAD, slow_submit)))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.update(follower=result_cache.fetch(PAYLOAD, slow_submit)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert results['leader'] == ('data', 'history', result_cache.MISS)
+    assert results['follower'][0] == 'data'
+    assert results['follower'][2] in (result_cache.COALESCED, result_cache.HIT)
+
+
+def test_failures_are_not_cached():
+    def failing():
+        raise RuntimeError('down')
+
+    with pytest.raises(RuntimeError):
+        result_cache.fetch(PAYLOAD, failing)
+    assert result_cache.fetch(PAYLOAD, Submit())[2] == result_cache.MISS
@@ -0,0 +1,49 @@
+import pytest
+
+from app import session_keys
+from app.constants import PUBLIC_KEY_FILE
+from app.key_store import get_certificate
+
+
+@pytest.fixture
+def cert():
+    return get_certificate(PUBLIC_KEY_FILE)
+
+
+@pytest.fixture(autouse=True)
+def reuse(monkeypatch):
+    monkeypatch.setattr(session_keys, 'SESSION_KEY_REUSE_MESSAGES', 3)
+    monkeypatch.setattr(session_keys, 'SESSION_KEY_REUSE_SECONDS', 60)
+    session_keys.clear()
+    yield
+    session_keys.clear()
+
+
+def test_disabled_by_default_settings(cert, monkeypatch):
+    monkeypatch.setattr(session_keys, 'SESSION_KEY_REUSE_MESSAGES', 1)
+    assert not session_keys.reuse_enabled()
+    assert session_keys.acquire(cert) is None
+
+
+def test_key_is_shared_up_to_the_message_cap(cert):
+    keys = [session_keys.acquire(cert) for _ in range(4)]
+    assert keys[0] is keys[1] is keys[2]
+    assert keys[3] is not keys[0]
+    assert keys[3].uses == 1
+
+
+def test_key_is_replaced_after_its_lifetime(cert, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_keys.time, 'monotonic', lambda: now[0])
+    first = session_keys.acquire(cert)
+    now[0] += 59
+    assert session_keys.acquire(cert) is first
+    now[0] += 1
+    assert session_keys.acquire(cert) is not first
+
+
+def test_key_is_replaced_when_the_certificate_is_reloaded(cert):
+    first = session_keys.acquire(cert)
+    reloaded = type(cert)(cert.path, open(cert.path, 'rb').read())
+    assert session_keys.acquire(reloaded) is not first
+
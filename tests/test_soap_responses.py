@@ -0,0 +1,66 @@
+import re
+
+import pytest
+from lxml import etree
+
+from app import soap_responses
+from app.constants import SOAP_NS
+from app.wsse_header import response_security
+
+ERRORS = ['Signature does not verify & <the> "envelope" was\r rejected \x01 é']
+
+
+def built(success=None, errors=None, security=False):
+    """The response as the endpoint built it before the templates: an lxml tree per response."""
+    envelope = etree.Element(f"{{{SOAP_NS}}}Envelope", nsmap=soap_responses.NSMAP)
+    if security:
+        etree.SubElement(envelope, f"{{{SOAP_NS}}}Header").append(response_security())
+    body = etree.SubElement(envelope, f"{{{SOAP_NS}}}Body")
+    if errors is None:
+        etree.SubElement(body, soap_responses.VALUE).text = "true" if success else "false"
+    else:
+        fault = etree.SubElement(body, f"{{{SOAP_NS}}}Fault")
+        etree.SubElement(fault, "Code").text = '500'
+        detail = etree.SubElement(fault, "Detail")
+        securex_fault = etree.SubElement(detail, soap_responses.SECUREX_FAULT)
+        etree.SubElement(securex_fault, "Code").text = '500'
+        errors_elem = etree.SubElement(securex_fault, "Errors")
+        for error in errors:
+            # lxml rejects the characters XML does not allow; the templates replace them
+            etree.SubElement(errors_elem, "string").text = soap_responses._INVALID_XML.sub('\ufffd', error)
+    return etree.tostring(envelope, encoding='utf-8', xml_declaration=True)
+
+
+def normalized(xml):
+    """The XML without the per-message wsu:Id and timestamps."""
+    xml = re.sub(rb'id-[0-9a-f-]+', b'id', xml)
+    return re.sub(rb'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\+00:00Z', b'timestamp', xml)
+
+
+@pytest.mark.parametrize('success', [True, False])
+@pytest.mark.parametrize('security', [True, False])
+def test_ack_matches_tree_builder(success, security):
+    assert normalized(soap_responses.ack(success, security=security)) == normalized(built(success, security=security))
+
+
+@pytest.mark.parametrize('errors', [ERRORS, ['one', 'two'], []])
+@pytest.mark.parametrize('security', [True, False])
+def test_fault_matches_tree_builder(errors, security):
+    rendered = soap_responses.fault(500, errors, security=security)
+    assert normalized(rendered) == normalized(built(errors=errors, security=security))
+    etree.fromstring(rendered)
+
+
+def test_fault_without_errors_is_self_closing():
+    assert b'<Errors/>' in soap_responses.fault(400, [], security=False)
+
+
+def test_security_header_is_filled_per_response():
+    first, second = soap_responses.ack(True, security=True), soap_responses.ack(True, security=True)
+    assert b'@@response:' not in first
+    ids = [etree.fromstring(xml).find('.//{*}Timestamp').get(soap_responses.ID_ATTR) for xml in (first, second)]
+    assert ids[0] != ids[1]
+
+
+def test_escape():
+    assert soap_responses.escape('a & <b> "c"\r\x00') == 'a &amp; &lt;b&gt; "c"&#13;\ufffd'.encode('utf-8')
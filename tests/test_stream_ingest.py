@@ -0,0 +1,106 @@
+import io
+import uuid
+
+import pytest
+from lxml import etree
+
+from app import app, blob_store, idempotency
+from app import provider_response_service as prs
+from app.stream_ingest import NO_HEADER_ERROR, ingest
+from benchmarks.envelopes import build_envelope
+
+HEADERLESS_IDX = (
+    b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>'
+    b'<IDXProviderSubmitMessage xmlns="http://IDX.Contract/V1"><AccountName>Acme</AccountName>'
+    b'<Images><StatementImage>aGVsbG8=</StatementImage></Images>'
+    b'</IDXProviderSubmitMessage></s:Body></s:Envelope>'
+)
+
+
+@pytest.fixture(autouse=True)
+def blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, 'BLOB_STORE_DIR', str(tmp_path / 'blobs'))
+    return tmp_path / 'blobs'
+
+
+class Verifier:
+    def __init__(self, result=(True, None)):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, envelope):
+        self.calls += 1
+        return self.result
+
+
+def test_idx_message_is_processed_while_streaming():
+    verify = Verifier()
+    envelope, streamed = ingest(io.BytesIO(build_envelope('idx', items=5)), verify)
+    assert verify.calls == 1
+    assert streamed.security_error is None
+    assert streamed.account_name == 'Acme Trading'
+    assert streamed.statements == [('2024-01-01', '2024-01-31', 5)]
+    assert streamed.transaction_count == 5
+    assert len(streamed.images) == 1
+    # The processed transactions are no longer in the tree
+    assert not envelope.findall('.//{http://IDX.Contract/V1}Transaction')
+
+
+def test_other_messages_are_returned_as_a_complete_tree():
+    verify = Verifier()
+    content = build_envelope('avx')
+    envelope, streamed = ingest(io.BytesIO(content), verify)
+    assert verify.calls == 1
+    assert streamed is None
+    assert etree.tostring(envelope) == etree.tostring(etree.fromstring(content))
+
+
+def test_rejected_header_stops_the_streamed_processing(blobs):
+    verify = Verifier((False, 'Timestamp expired'))
+    _, streamed = ingest(io.BytesIO(build_envelope('idx')), verify)
+    assert streamed.security_error == 'Timestamp expired'
+    assert streamed.images == [] and not blobs.exists()
+
+
+def test_envelope_without_header_is_rejected(blobs):
+    verify = Verifier()
+    _, streamed = ingest(io.BytesIO(HEADERLESS_IDX), verify)
+    assert verify.calls == 0
+    assert streamed.security_error == NO_HEADER_ERROR
+    assert streamed.account_name is None and streamed.images == []
+    assert not blobs.exists()
+
+
+def test_envelope_without_header_or_body_is_rejected():
+    verify = Verifier()
+    source = io.BytesIO(b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"/>')
+    _, streamed = ingest(source, verify)
+    assert verify.calls == 0
+    assert streamed.security_error == NO_HEADER_ERROR
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(prs, 'STREAMING_INGEST', True)
+    monkeypatch.setattr(prs, 'ASYNC_ACK', False)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_DB', str(tmp_path / 'idempotency.sqlite3'))
+    return app.test_client()
+
+
+def post(client, content):
+    response = client.post('/ProviderResponseService', data=content, content_type='application/soap+xml')
+    assert response.status_code == 200
+    return etree.fromstring(response.data).findtext('.//{*}Value')
+
+
+def test_endpoint_acks_a_streamed_idx_message(client):
+    assert post(client, build_envelope('idx', exchange_reference=str(uuid.uuid4()))) == 'true'
+
+
+def test_endpoint_rejects_a_streamed_message_without_header(client, monkeypatch):
+    def handler(*args):
+        raise AssertionError('the message was processed')
+
+    monkeypatch.setattr(prs, 'process_streamed_idx_message', handler)
+    monkeypatch.setattr(prs, 'process_submit_request', handler)
+    assert post(client, HEADERLESS_IDX) == 'false'
@@ -0,0 +1,109 @@
+import copy
+
+import pytest
+import xmlsec
+from lxml import etree
+from zeep.exceptions import SignatureVerificationFailed
+from zeep.wsse.signature import BinarySignature, _sign_node
+
+from app import crypto_wsse, trust_store
+from app import provider_response_service as prs
+from app.xpaths import BODY, HEADER, SECURITY_PATH
+from benchmarks.envelopes import build_envelope
+from benchmarks.keys import generate_keypair
+
+IDX_NS = 'http://IDX.Contract/V1'
+WSU_NS = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd'
+
+
+@pytest.fixture(autouse=True)
+def trusted(keypair, monkeypatch):
+    monkeypatch.setattr(trust_store, 'TRUSTED_CERT_FILES', [keypair[1]])
+
+
+@pytest.fixture(scope='module')
+def untrusted(tmp_path_factory):
+    return generate_keypair(str(tmp_path_factory.mktemp('untrusted')), name='untrusted')
+
+
+def signed(keypair, message_type='idx'):
+    envelope = etree.fromstring(build_envelope(message_type, items=3))
+    BinarySignature(*keypair).apply(envelope, {})
+    # As received: the wsu:Id attributes are plain attributes again
+    return etree.fromstring(etree.tostring(envelope))
+
+
+def signed_timestamp_only(keypair):
+    """An envelope whose signature covers the Timestamp but not the Body."""
+    keyfile, certfile = keypair
+    envelope = etree.fromstring(build_envelope('idx'))
+    security = envelope.find(SECURITY_PATH)
+    signature = xmlsec.template.create(envelope, xmlsec.Transform.EXCL_C14N, xmlsec.Transform.RSA_SHA256)
+    x509_data = xmlsec.template.add_x509_data(xmlsec.template.ensure_key_info(signature))
+    xmlsec.template.x509_data_add_certificate(x509_data)
+    security.insert(0, signature)
+    ctx = xmlsec.SignatureContext()
+    ctx.key = xmlsec.Key.from_file(keyfile, xmlsec.KeyFormat.PEM)
+    ctx.key.load_cert_from_file(certfile, xmlsec.KeyFormat.PEM)
+    _sign_node(ctx, signature, security.find(f'{{{WSU_NS}}}Timestamp'))
+    ctx.sign(signature)
+    return etree.fromstring(etree.tostring(envelope))
+
+
+def test_trusted_signature_verifies(keypair):
+    assert trust_store.verify_envelope(signed(keypair)).path == keypair[1]
+
+
+def test_untrusted_certificate_is_rejected(untrusted):
+    with pytest.raises(SignatureVerificationFailed, match='not trusted'):
+        trust_store.verify_envelope(signed(untrusted))
+
+
+def test_tampered_body_is_rejected(keypair):
+    envelope = signed(keypair)
+    envelope.find(f'.//{{{IDX_NS}}}AccountName').text = 'Someone Else'
+    with pytest.raises(SignatureVerificationFailed, match='does not verify'):
+        trust_store.verify_envelope(envelope)
+
+
+def test_unsigned_body_is_rejected(keypair):
+    with pytest.raises(SignatureVerificationFailed, match='Body is not signed'):
+        trust_store.verify_envelope(signed_timestamp_only(keypair))
+
+
+def test_missing_signature_is_rejected():
+    with pytest.raises(SignatureVerificationFailed, match='No Signature'):
+        trust_store.verify_envelope(etree.fromstring(build_envelope('idx')))
+
+
+def test_wrapped_body_is_rejected(keypair):
+    # The signed Body is moved into the Header and a forged one takes its place
+    envelope = signed(keypair)
+    body = envelope.find(BODY)
+    forged = copy.deepcopy(body)
+    del forged.attrib[f'{{{WSU_NS}}}Id']
+    forged.find(f'.//{{{IDX_NS}}}AccountName').text = 'Someone Else'
+    envelope.find(HEADER).append(body)
+    envelope.append(forged)
+    with pytest.raises(SignatureVerificationFailed, match='Body is not signed'):
+        trust_store.verify_envelope(envelope)
+
+
+def test_duplicated_id_is_rejected(keypair):
+    # A forged Body with the signed Body's Id, the signed one hidden in the Header
+    envelope = signed(keypair)
+    body = envelope.find(BODY)
+    forged = copy.deepcopy(body)
+    forged.find(f'.//{{{IDX_NS}}}AccountName').text = 'Someone Else'
+    envelope.find(HEADER).append(body)
+    envelope.append(forged)
+    with pytest.raises(SignatureVerificationFailed, match='matches 2 elements'):
+        trust_store.verify_envelope(envelope)
+
+
+def test_signed_and_encrypted_callback_is_processed(keypair, untrusted, monkeypatch):
+    monkeypatch.setattr(prs, 'PRIVATE_KEY_FILE', keypair[0])
+    for signer, accepted in ((keypair, True), (untrusted, False)):
+        envelope = signed(signer)
+        crypto_wsse.encrypt_element(envelope, keypair[1])
+        assert prs.process_submit_request(etree.fromstring(etree.tostring(envelope))) is accepted
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+import zeep
+from lxml import etree
+
+from app import wsdl_cache
+
+WSDL = Path(__file__).parent / 'fixtures' / 'ConsumerDecryptedService.wsdl'
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(wsdl_cache, 'WSDL_CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(wsdl_cache, 'WSDL_CACHE_ENABLED', True)
+    return tmp_path / 'cache'
+
+
+def submit_message(document):
+    client = zeep.Client(wsdl=document)
+    header = client.get_type('ns3:SecureXHeader')(ExchangeReference='EX-1')
+    entity = client.get_type('ns1:Entity')(Name='Jane')
+    message = client.create_message(client.service, 'Submit', AccountNumber='1',
+                                    PhysicalEntities={'Entity': [entity]}, _soapheaders=[header])
+    return etree.tostring(message)
+
+
+def test_pickle_round_trip(cache_dir):
+    document = wsdl_cache.build(WSDL)
+    path = wsdl_cache.cache_path(WSDL)
+    assert path.exists() and path.parent == cache_dir
+
+    cached = wsdl_cache.load_cached_document(path, zeep.Transport(), zeep.Settings())
+    assert cached is not document
+    assert list(cached.services) == list(document.services)
+    assert submit_message(cached) == submit_message(document)
+
+
+def test_cache_key_follows_the_wsdl_content(tmp_path, cache_dir):
+    copy = tmp_path / 'Service.wsdl'
+    copy.write_bytes(WSDL.read_bytes())
+    before = wsdl_cache.cache_path(copy)
+    copy.write_bytes(WSDL.read_bytes().replace(b'ConsumerDecryptedService"', b'ConsumerDecryptedService" '))
+    assert wsdl_cache.cache_path(copy) != before
+
+
+def test_unreadable_cache_is_rebuilt(tmp_path, cache_dir):
+    copy = tmp_path / 'Service.wsdl'
+    copy.write_bytes(WSDL.read_bytes())
+    path = wsdl_cache.cache_path(copy)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b'not a pickle')
+    document = wsdl_cache.load_document(copy)
+    assert list(document.services) == ['ConsumerDecryptedService']
+    assert wsdl_cache.load_document(copy) is document